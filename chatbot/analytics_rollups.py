@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from encryption import anonymize_timestamp
+
+# Rollup documents for all chats together use this in place of an anonymous id
+ALL_CHATS = "all"
+GRANULARITIES = ("hour", "day")
+COUNTERS = ("sessions", "new_sessions", "messages")
+SENTIMENTS = ("negative", "neutral", "positive")
+
+
+def period_of(granularity, when):
+    """Period key of a datetime, never finer than the hour kept by anonymize_timestamp."""
+    hour = anonymize_timestamp(when) if isinstance(when, datetime) else when
+    return hour if granularity == "hour" else hour[:10]
+
+
+def periods_between(granularity, start, end):
+    """Every period key from the one holding `start` up to the one holding `end`, oldest first."""
+    step = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+    current = datetime.fromisoformat(period_of(granularity, start))
+    last = datetime.fromisoformat(period_of(granularity, end))
+    periods = []
+    while current <= last:
+        periods.append(period_of(granularity, current))
+        current += step
+    return periods
+
+
+def _field(name):
+    # Mood labels become field names, which may not contain dots or start with $
+    return name.replace(".", "_").lstrip("$")
+
+
+def rollup_increments(entry):
+    """$inc fields for one pending rollup entry."""
+    increments = {}
+    for counter in ("new_sessions", "messages"):
+        if entry.get(counter):
+            increments[counter] = entry[counter]
+    for mood, count in entry.get("moods", {}).items():
+        increments[f"moods.{_field(mood)}"] = count
+    for key, count in entry.get("sentiment", {}).items():
+        increments[f"sentiment.{key}"] = count
+    return increments
+
+
+def write_rollups(collection, pending):
+    """Apply counters accumulated per (anonymous_id, hour) to the hourly and daily rollups.
+
+    Each chat gets its own rollup documents, and the totals for all chats
+    are kept under ALL_CHATS. The first write to a chat's document for a
+    period is an upsert, which is how that chat is counted once in the
+    period's `sessions`.
+    """
+    operations = []
+    keys = []
+    for (anonymous_id, hour), entry in pending.items():
+        increments = rollup_increments(entry)
+        for granularity in GRANULARITIES:
+            period = period_of(granularity, hour)
+            operations.append(UpdateOne(
+                {"anonymous_id": anonymous_id, "granularity": granularity, "period": period},
+                {"$setOnInsert": {"sessions": 1}, **({"$inc": increments} if increments else {})},
+                upsert=True
+            ))
+            keys.append((granularity, period, increments))
+    if not operations:
+        return
+    result = collection.bulk_write(operations, ordered=False)
+
+    totals = {}
+    for i, (granularity, period, increments) in enumerate(keys):
+        total = totals.setdefault((granularity, period), {})
+        for field, count in increments.items():
+            total[field] = total.get(field, 0) + count
+        if i in result.upserted_ids:
+            total["sessions"] = total.get("sessions", 0) + 1
+    operations = [
+        UpdateOne(
+            {"anonymous_id": ALL_CHATS, "granularity": granularity, "period": period},
+            {"$inc": total},
+            upsert=True
+        )
+        for (granularity, period), total in totals.items() if total
+    ]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+
+class AnalyticsRollups:
+    """Dashboard queries over the hourly and daily rollups.
+
+    A series is one indexed range read of at most one document per period,
+    with missing periods filled with zeros. Periods are never finer than an
+    hour, so nothing is more precise than the anonymized timestamps.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index(
+            [("anonymous_id", 1), ("granularity", 1), ("period", 1)], unique=True
+        )
+
+    def series(self, granularity="day", start=None, end=None, anonymous_id=ALL_CHATS):
+        """Counters per period from `start` to `end`, as parallel lists ready for plotting.
+
+        Returns {"period": [...], "sessions": [...], "new_sessions": [...],
+        "messages": [...], "sentiment": {key: [...]}, "moods": {mood: [...]}}.
+        Defaults to the last 30 days, or the last 48 hours for hourly series.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        end = end or datetime.now()
+        start = start or end - (timedelta(hours=47) if granularity == "hour" else timedelta(days=29))
+        periods = periods_between(granularity, start, end)
+        index = {period: i for i, period in enumerate(periods)}
+        series = {
+            "period": periods,
+            **{counter: [0] * len(periods) for counter in COUNTERS},
+            "sentiment": {key: [0] * len(periods) for key in SENTIMENTS},
+            "moods": {}
+        }
+        if not periods:
+            return series
+        for doc in self.collection.find(
+            {"anonymous_id": anonymous_id, "granularity": granularity,
+             "period": {"$gte": periods[0], "$lte": periods[-1]}},
+            {"_id": 0, "anonymous_id": 0, "granularity": 0}
+        ):
+            i = index.get(doc["period"])
+            if i is None:
+                continue
+            for counter in COUNTERS:
+                series[counter][i] = doc.get(counter, 0)
+            for key, count in doc.get("sentiment", {}).items():
+                series["sentiment"].setdefault(key, [0] * len(periods))[i] = count
+            for mood, count in doc.get("moods", {}).items():
+                series["moods"].setdefault(mood, [0] * len(periods))[i] = count
+        return series
+
+    def top_moods(self, granularity="day", start=None, end=None, limit=10, anonymous_id=ALL_CHATS):
+        """(mood, count) pairs over the range, most frequent first."""
+        moods = self.series(granularity, start, end, anonymous_id)["moods"]
+        totals = sorted(((mood, sum(counts)) for mood, counts in moods.items()), key=lambda item: -item[1])
+        return totals[:limit]
+
+    def forget(self, anonymous_id):
+        """Drop the rollups of one chat; the totals for all chats keep its counts."""
+        self.collection.delete_many({"anonymous_id": anonymous_id})
@@ -0,0 +1,105 @@
+import os
+import queue
+import threading
+from dotenv import load_dotenv
+from mood_matcher import detect_mood
+
+load_dotenv()
+
+# Run the sentiment model on user messages as they are stored
+SENTIMENT_ON_WRITE = os.getenv("SENTIMENT_ON_WRITE", "true").lower() == "true"
+# Background threads labelling stored messages; the analyzer batches their concurrent requests
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", "4"))
+
+# Stored sentiment codes, and the keys of the per-chat sentiment counts
+SENTIMENT_CODES = {"NEGATIVE": -1, "NEUTRAL": 0, "POSITIVE": 1}
+SENTIMENT_KEYS = {-1: "negative", 0: "neutral", 1: "positive"}
+
+
+class MessageAnnotator:
+    """Labels user messages with a mood when they are written, and with a sentiment code afterwards.
+
+    Annotations are stored next to each message as `ann: {"m": mood, "s": code}`,
+    with either key left out when there is nothing to record. The mood comes
+    from keyword matching on the write path. The sentiment model is too slow
+    for it, so `label_later` queues user messages for background threads
+    that call the shared SentimentAnalyzer's `analyze`, and hands each code
+    to a callback that stores it. Messages written while the model loads
+    wait in the queue. If the model cannot be loaded, sentiment is skipped
+    for the rest of the process.
+    """
+
+    def __init__(self, analyzer=None, sentiment=SENTIMENT_ON_WRITE, workers=SENTIMENT_WORKERS):
+        self._analyzer = analyzer
+        self.sentiment = sentiment
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            import shared
+            self._analyzer = shared.get_sentiment_analyzer()
+        return self._analyzer
+
+    def warm_up(self):
+        if self.sentiment:
+            self._sentiment("warm up")
+
+    def _sentiment(self, text):
+        if not self.sentiment:
+            return None
+        try:
+            return SENTIMENT_CODES.get(self.analyzer.analyze(text))
+        except Exception as e:
+            print(f"Error analyzing sentiment, disabling it for stored messages: {e}")
+            with self._lock:
+                self.sentiment = False
+            return None
+
+    def annotate(self, messages):
+        """One annotation dict per (role, content) pair: the mood of user messages, empty when there is none."""
+        annotations = []
+        for role, content in messages:
+            mood = detect_mood(content) if role == "user" else None
+            annotations.append({"m": mood} if mood else {})
+        return annotations
+
+    def label_later(self, texts, store):
+        """Queue (key, text) pairs for sentiment labelling; `store(key, code)` runs in a background thread."""
+        if not self.sentiment or not texts:
+            return
+        self._start_workers()
+        for key, text in texts:
+            self._queue.put((key, text, store))
+
+    def join(self):
+        """Wait until every queued message has been labelled and stored."""
+        self._queue.join()
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                threads = [
+                    threading.Thread(target=self._serve, name=f"sentiment-annotator-{i}", daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in threads:
+                    thread.start()
+                self._threads = threads
+
+    def _serve(self):
+        while True:
+            key, text, store = self._queue.get()
+            try:
+                code = self._sentiment(text)
+                if code is not None:
+                    store(key, code)
+            except Exception as e:
+                print(f"Error storing sentiment: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,111 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from metrics import HistogramFamily, register
+
+load_dotenv()
+
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:5001/api")
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "2"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "10"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "10"))
+
+# Only methods that are safe to send twice are retried. A retried POST could create a second chat, and
+# a retried PUT of a chat's messages could overwrite a newer save that landed in between
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "DELETE"})
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Path segments that identify a resource, collapsed so histograms are per route rather than per chat
+_ID_SEGMENT = re.compile(r"/(?:[0-9a-f]{24}|\d+|[0-9a-f-]{36})(?=/|$)", re.IGNORECASE)
+
+
+def route_of(endpoint):
+    return _ID_SEGMENT.sub("/:id", endpoint.split("?", 1)[0])
+
+
+class ApiCall(NamedTuple):
+    method: str
+    endpoint: str
+    data: Optional[Any] = None
+    params: Optional[dict] = None
+
+
+class ApiClient:
+    """Client for the Node API with one keep-alive connection pool per process.
+
+    Every request has (connect, read) timeouts. GET and DELETE are
+    retried with exponential backoff on connection errors, 429 and 5xx,
+    honouring Retry-After; POST and PUT are never retried. Latency is recorded per
+    method and route. `batch` sends several independent calls in parallel
+    over the same pool, since the API has no batch endpoint.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, connect_timeout=API_CONNECT_TIMEOUT, read_timeout=API_READ_TIMEOUT,
+                 max_retries=API_MAX_RETRIES, backoff_factor=0.2, pool_size=API_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latency_ms = register(
+            "chatbot_api_request_duration_milliseconds",
+            "Node API request latency by method, route and status.",
+            HistogramFamily(("method", "route", "outcome"))
+        )
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="api-client")
+
+    def request(self, method, endpoint, data=None, params=None, token=None):
+        """Send one request and return the decoded JSON body; raises requests exceptions on failure."""
+        method = method.upper()
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self.session.request(
+                method,
+                f"{self.base_url}{endpoint}",
+                json=data,
+                params=params,
+                headers=headers,
+                timeout=self.timeout
+            )
+            outcome = str(response.status_code)
+            response.raise_for_status()
+            return response.json()
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.latency_ms.labels(method, route_of(endpoint), outcome).observe(elapsed)
+
+    def batch(self, calls, token=None):
+        """Send independent ApiCalls in parallel; each result is the JSON body or the exception raised."""
+        def send(call):
+            try:
+                return self.request(call.method, call.endpoint, call.data, call.params, token=token)
+            except Exception as e:
+                return e
+        calls = [call if isinstance(call, ApiCall) else ApiCall(*call) for call in calls]
+        if len(calls) <= 1:
+            return [send(call) for call in calls]
+        return list(self._executor.map(send, calls))
+
+    def metrics(self):
+        return self.latency_ms.snapshot()
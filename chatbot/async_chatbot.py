@@ -0,0 +1,93 @@
+import asyncio
+import shared
+from metrics import span
+
+
+class AsyncChatBot:
+    """Asyncio front end to ChatBot for serving many sessions from one event loop.
+
+    LLM calls, including the ones that fold old turns into the summary, go
+    through the shared OpenAI-compatible async client (one pooled HTTP
+    connection pool per process) and a RequestScheduler that caps
+    concurrent and per-minute calls and retries transient failures. Prompt
+    building, recommendations and Mongo access reuse ChatBot and run in
+    worker threads, since pymongo is synchronous.
+    """
+
+    def __init__(self, chatbot=None, client=None, scheduler=None, model=shared.LLM_MODEL, temperature=0.7):
+        self.chatbot = chatbot or shared.get_chatbot()
+        self.client = client or shared.get_async_llm_client()
+        self.scheduler = scheduler or shared.get_llm_scheduler()
+        self.model = model
+        self.temperature = temperature
+
+    def _request(self, prompt, stream):
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            stream=stream
+        )
+
+    def _summarizer(self):
+        """Blocking summarize callable for build_prompt's worker thread, run through the scheduler on this loop."""
+        loop = asyncio.get_running_loop()
+        memory = self.chatbot.memory
+
+        def summarize(summary, messages):
+            prompt = memory.summary_prompt(summary, messages)
+            completion = asyncio.run_coroutine_threadsafe(
+                self.scheduler.run(lambda: self._request(prompt, stream=False)), loop
+            ).result()
+            return completion.choices[0].message.content.strip()
+        return summarize
+
+    async def get_bot_response(self, chat_id, user_input):
+        try:
+            if self.chatbot.is_mood_message(user_input):
+                return await asyncio.to_thread(self.chatbot.get_recommendation_response, user_input)
+            context = await asyncio.to_thread(self.chatbot.load_context, chat_id)
+            cached = self.chatbot.cached_response(user_input, context)
+            if cached:
+                return cached
+            prompt = await asyncio.to_thread(
+                self.chatbot.build_prompt, chat_id, user_input, context, self._summarizer()
+            )
+            with span("llm"):
+                completion = await self.scheduler.run(lambda: self._request(prompt, stream=False))
+            response = completion.choices[0].message.content
+            self.chatbot.cache_response(user_input, context, response)
+            return response
+        except Exception as e:
+            print(f"Error in async get_bot_response: {e}")
+            return "I apologize, but I encountered an error processing your message. Please try again."
+
+    async def stream_bot_response(self, chat_id, user_input):
+        streamed = []
+        try:
+            if self.chatbot.is_mood_message(user_input):
+                yield await asyncio.to_thread(self.chatbot.get_recommendation_response, user_input)
+                return
+            context = await asyncio.to_thread(self.chatbot.load_context, chat_id)
+            cached = self.chatbot.cached_response(user_input, context)
+            if cached:
+                yield cached
+                return
+            prompt = await asyncio.to_thread(
+                self.chatbot.build_prompt, chat_id, user_input, context, self._summarizer()
+            )
+            with span("llm"):
+                async for chunk in self.scheduler.stream(lambda: self._request(prompt, stream=True)):
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        streamed.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            self.chatbot.cache_response(user_input, context, "".join(streamed))
+        except Exception as e:
+            print(f"Error in async stream_bot_response: {e}")
+            if streamed:
+                yield "\n\nI apologize, but my response was interrupted. Please try again."
+            else:
+                yield "I apologize, but I encountered an error processing your message. Please try again."
+
+    def metrics(self):
+        return self.scheduler.metrics()
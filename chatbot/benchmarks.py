@@ -0,0 +1,1094 @@
+"""Performance benchmarks for the chatbot backend.
+
+Run one suite at a time, e.g. `python benchmarks.py db --turns 200`.
+Benchmarks use a local MongoDB when MONGODB_URI is set and fall back to
+mongomock otherwise, so they run without any external services.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Sentiment annotation would load a transformer model on the first write; the sentiment suite measures it separately
+os.environ.setdefault("SENTIMENT_ON_WRITE", "false")
+
+MONGO_OPERATIONS = {
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "delete_one", "delete_many", "bulk_write", "aggregate", "count_documents",
+    "find_one_and_update", "create_index"
+}
+
+
+class CountingCollection:
+    """Wraps a collection and counts the calls that reach the server."""
+
+    # Shared by all wrappers, since they may count into the same dict from several threads
+    _lock = threading.Lock()
+
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in MONGO_OPERATIONS:
+            return attr
+
+        def counted(*args, **kwargs):
+            with self._lock:
+                self._counter[name] = self._counter.get(name, 0) + 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def make_mongo_client():
+    uri = os.getenv("MONGODB_URI")
+    if uri:
+        from pymongo import MongoClient
+        return MongoClient(uri), f"mongod at {uri}"
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("Set MONGODB_URI or install mongomock to run database benchmarks")
+    return mongomock.MongoClient(), "mongomock"
+
+
+def make_counting_db(client, counter, annotator=None):
+    from db_handler import ChatDatabase
+    db = ChatDatabase(client=client, annotator=annotator)
+    db.chats = CountingCollection(db.chats, counter)
+    db.messages = CountingCollection(db.messages, counter)
+    db.analytics = CountingCollection(db.analytics, counter)
+    db.analytics_buffer.collection = db.analytics
+    db.analytics_buffer.rollups = CountingCollection(db.analytics_buffer.rollups, counter)
+    return db
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, samples, unit="ms"):
+    print(
+        f"{name:<28} mean {statistics.mean(samples):8.3f}{unit}  "
+        f"p50 {percentile(samples, 50):8.3f}{unit}  p95 {percentile(samples, 95):8.3f}{unit}"
+    )
+
+
+def legacy_add_message(db, chat_id, role, content):
+    """The per-message write path as it was before add_messages: three round trips."""
+    from bson import ObjectId
+    from encryption import encrypt_message, anonymize_timestamp
+    chat = db.chats.find_one({"_id": ObjectId(chat_id)})
+    db.chats.update_one(
+        {"_id": ObjectId(chat_id)},
+        {
+            "$push": {"messages": {"role": role, "content": encrypt_message(content), "timestamp": datetime.now()}},
+            "$set": {"updated_at": datetime.now(), "title": chat.get("title", "New Chat")}
+        }
+    )
+    db.analytics.update_one(
+        {"anonymous_id": chat.get("anonymous_id")},
+        {"$inc": {"message_count": 1}, "$set": {"last_activity": anonymize_timestamp(datetime.now())}}
+    )
+
+
+def bench_db(args):
+    client, backend = make_mongo_client()
+    print(f"Write path per turn (user + assistant message) on {backend}, {args.turns} turns")
+
+    def run(name, write_turn):
+        counter = {}
+        db = make_counting_db(client, counter)
+        chat_id = db.create_chat("benchmark_user")
+        counter.clear()
+        samples = []
+        for turn in range(args.turns):
+            pair = [("user", f"message {turn} " * 8), ("assistant", f"reply {turn} " * 20)]
+            start = time.perf_counter()
+            write_turn(db, chat_id, turn, pair)
+            samples.append((time.perf_counter() - start) * 1000)
+        db.analytics_buffer.flush()
+        report(name, samples)
+        print(f"{'':<28} round trips/turn {sum(counter.values()) / args.turns:.2f}  {dict(sorted(counter.items()))}")
+        db.delete_chat(chat_id)
+
+    def legacy(db, chat_id, turn, pair):
+        for role, content in pair:
+            legacy_add_message(db, chat_id, role, content)
+
+    def batched(db, chat_id, turn, pair):
+        db.add_messages(chat_id, pair, start_seq=turn * 2)
+
+    run("legacy add_message", legacy)
+    run("add_messages", batched)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_sessions(args):
+    from unittest import mock
+    import shared
+    from chatbot import ChatBot
+    from db_handler import ChatDatabase
+    from recommendation_system import MoodBasedRecommender
+
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    client, backend = make_mongo_client()
+    print(f"Session cold start over {args.sessions} sessions ({backend})")
+
+    def per_session():
+        return ChatBot(
+            llm=shared._create_llm(),
+            db=ChatDatabase(client=client),
+            recommender=MoodBasedRecommender(shared.DATASET_PATH)
+        )
+
+    def registry():
+        return shared.get_chatbot()
+
+    for name, factory in [("per-session construction", per_session), ("shared registry", registry)]:
+        with mock.patch.object(shared, "_create_database", lambda: ChatDatabase(client=client)):
+            sessions = []
+            rss_before = current_rss_mb()
+            samples = []
+            for _ in range(args.sessions):
+                start = time.perf_counter()
+                sessions.append(factory())
+                samples.append((time.perf_counter() - start) * 1000)
+            rss_per_session = (current_rss_mb() - rss_before) / args.sessions
+        report(name, samples)
+        print(f"{'':<28} RSS growth/session {rss_per_session:.2f}MB")
+
+
+def recommender_queries(recommender, count, seed=0):
+    """Mix of exact moods, sentences naming a mood and free text that needs scoring."""
+    import random
+    rng = random.Random(seed)
+    templates = [
+        "{mood}",
+        "I have been feeling {mood} all week",
+        "my {word} keeps getting worse at night",
+        "how do I deal with {word} and everything else",
+    ]
+    queries = []
+    for _ in range(count):
+        mood = rng.choice(recommender.moods)
+        word = rng.choice(mood.replace("-", " ").split())
+        queries.append(rng.choice(templates).format(mood=mood, word=word + "ness"))
+    return queries
+
+
+def bench_recommender(args):
+    import shared
+    from recommendation_system import MoodBasedRecommender
+
+    start = time.perf_counter()
+    recommender = MoodBasedRecommender(shared.DATASET_PATH)
+    print(f"Recommender load {(time.perf_counter() - start) * 1000:.1f}ms, {len(recommender.moods)} moods")
+
+    for count in args.sizes:
+        queries = recommender_queries(recommender, count)
+        loop_samples = []
+        batch_samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for query in queries:
+                recommender.get_recommendations(query, args.k)
+            loop_samples.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            recommender.get_recommendations_batch(queries, args.k)
+            batch_samples.append((time.perf_counter() - start) * 1000)
+        report(f"{count} queries, one by one", loop_samples)
+        report(f"{count} queries, batched", batch_samples)
+
+    start = time.perf_counter()
+    recommender.get_recommendations_batch(recommender.moods, args.k, sample=True, seed=0)
+    print(f"Precompute all {len(recommender.moods)} moods: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+
+def make_benchmark_chatbot(client, llm_base_url, **llm_kwargs):
+    """A ChatBot wired to a local LLM stub and the given Mongo client."""
+    import shared
+    from chatbot import ChatBot
+    from db_handler import ChatDatabase
+    from langchain.chat_models import ChatOpenAI
+    llm = ChatOpenAI(base_url=llm_base_url, api_key="benchmark", model="fake-llm", **llm_kwargs)
+    return ChatBot(llm=llm, db=ChatDatabase(client=client), recommender=shared.get_recommender())
+
+
+def bench_ttft(args):
+    from stub_servers import FakeLLMServer
+
+    client, backend = make_mongo_client()
+    with FakeLLMServer(first_token_latency=args.first_token_latency, token_interval=args.token_interval) as llm:
+        print(
+            f"Time to first token, fake LLM at {llm.base_url} "
+            f"(first token {args.first_token_latency * 1000:.0f}ms, {args.token_interval * 1000:.0f}ms/token), {backend}"
+        )
+        chatbot = make_benchmark_chatbot(client, llm.base_url)
+        chat_id = chatbot.db.create_chat("benchmark_user")
+        prompt = "I have had a long week and I can't switch off at night"
+
+        blocking = []
+        first_token = []
+        streamed_total = []
+        for _ in range(args.turns):
+            start = time.perf_counter()
+            chatbot.get_bot_response(chat_id, prompt)
+            blocking.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            first = None
+            for _token in chatbot.stream_bot_response(chat_id, prompt):
+                if first is None:
+                    first = time.perf_counter() - start
+            streamed_total.append((time.perf_counter() - start) * 1000)
+            first_token.append(first * 1000)
+        report("blocking reply", blocking)
+        report("streamed first token", first_token)
+        report("streamed full reply", streamed_total)
+        chatbot.db.delete_chat(chat_id)
+
+
+def bench_memory(args):
+    import random
+    from conversation_memory import estimate_tokens, format_messages
+    from stub_servers import FakeLLMServer
+
+    client, backend = make_mongo_client()
+    rng = random.Random(0)
+    words = "work sleep family exams friends anxious tired worried hopeful lonely week night talk feel".split()
+    summary = " ".join(rng.choice(words) for _ in range(60))
+    with FakeLLMServer(reply=summary, first_token_latency=0, token_interval=0) as llm:
+        chatbot = make_benchmark_chatbot(client, llm.base_url)
+        chat_id = chatbot.db.create_chat("benchmark_user")
+        print(f"Prompt tokens per turn over a {args.turns}-turn conversation ({backend})")
+        print(f"{'turn':>6} {'full history':>14} {'budgeted':>10}")
+        transcript = []
+        budgeted = []
+        full = []
+        for turn in range(1, args.turns + 1):
+            user = " ".join(rng.choice(words) for _ in range(rng.randint(10, 40)))
+            reply = " ".join(rng.choice(words) for _ in range(rng.randint(40, 120)))
+            full.append(estimate_tokens(chatbot.prompt_template.format(history=format_messages(transcript), input=user)))
+            budgeted.append(estimate_tokens(chatbot.build_prompt(chat_id, user)))
+            pair = [{"role": "user", "content": user}, {"role": "assistant", "content": reply}]
+            chatbot.db.append_messages(chat_id, pair, len(transcript))
+            transcript.extend(pair)
+            if turn in (1, 10, 25, 50, 100, 150, 200) or turn == args.turns:
+                print(f"{turn:>6} {full[-1]:>14} {budgeted[-1]:>10}")
+        print(f"{'max':>6} {max(full):>14} {max(budgeted):>10}")
+        print(f"{'total':>6} {sum(full):>14} {sum(budgeted):>10}")
+        print(f"Summarization calls: {len(llm.requests)}")
+        chatbot.db.delete_chat(chat_id)
+
+
+def bench_async_load(args):
+    import asyncio
+    import httpx
+    from openai import AsyncOpenAI
+    from async_chatbot import AsyncChatBot
+    from scheduler import RequestScheduler
+    from stub_servers import FakeLLMServer
+
+    client, backend = make_mongo_client()
+    with FakeLLMServer(
+        first_token_latency=args.latency,
+        token_interval=0,
+        error_rate=args.error_rate,
+        retry_after=0.05
+    ) as llm:
+        chatbot = make_benchmark_chatbot(client, llm.base_url)
+        chat_ids = [chatbot.db.create_chat(f"load_user_{i}") for i in range(args.sessions)]
+
+        async def run():
+            http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=args.max_concurrency))
+            bot = AsyncChatBot(
+                chatbot=chatbot,
+                client=AsyncOpenAI(base_url=llm.base_url, api_key="benchmark", max_retries=0, http_client=http_client),
+                scheduler=RequestScheduler(
+                    max_concurrency=args.max_concurrency,
+                    requests_per_minute=args.rpm,
+                    base_delay=0.05
+                ),
+                model="fake-llm"
+            )
+            turn_ms = []
+
+            async def session(chat_id):
+                for turn in range(args.turns):
+                    start = time.perf_counter()
+                    reply = await bot.get_bot_response(chat_id, f"Today was hard, turn {turn}")
+                    turn_ms.append((time.perf_counter() - start) * 1000)
+                    await asyncio.to_thread(
+                        chatbot.db.append_messages,
+                        chat_id,
+                        [{"role": "user", "content": f"Today was hard, turn {turn}"}, {"role": "assistant", "content": reply}],
+                        turn * 2
+                    )
+
+            start = time.perf_counter()
+            await asyncio.gather(*(session(chat_id) for chat_id in chat_ids))
+            elapsed = time.perf_counter() - start
+            await http_client.aclose()
+            return bot.metrics(), turn_ms, elapsed
+
+        metrics, turn_ms, elapsed = asyncio.run(run())
+        total = args.sessions * args.turns
+        print(
+            f"{args.sessions} sessions x {args.turns} turns against fake LLM ({args.latency * 1000:.0f}ms, "
+            f"{args.error_rate:.0%} 429s), concurrency {args.max_concurrency}, {args.rpm:.0f} rpm, {backend}"
+        )
+        print(f"Throughput {total / elapsed:.1f} turns/s over {elapsed:.2f}s")
+        report("turn latency", turn_ms)
+        print(
+            f"LLM calls {metrics['calls']}, retries {metrics['retries']}, failures {metrics['failures']}, "
+            f"429s served {llm.rejected}"
+        )
+        print(f"Queue wait p50 {metrics['wait_ms']['p50']:.1f}ms p95 {metrics['wait_ms']['p95']:.1f}ms, "
+              f"call latency p50 {metrics['latency_ms']['p50']:.1f}ms p95 {metrics['latency_ms']['p95']:.1f}ms")
+        for chat_id in chat_ids:
+            chatbot.db.delete_chat(chat_id)
+
+
+def legacy_encrypt_message(message):
+    """encrypt_message as it was before MessageCipher: key re-read from the environment per call."""
+    import base64
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import pad
+    from encryption import get_encryption_key
+    iv = os.urandom(16)
+    cipher = AES.new(get_encryption_key(), AES.MODE_CBC, iv)
+    return base64.b64encode(iv + cipher.encrypt(pad(message.encode('utf-8'), AES.block_size))).decode('utf-8')
+
+
+def legacy_decrypt_message(encrypted_message):
+    import base64
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import unpad
+    from encryption import get_encryption_key
+    combined = base64.b64decode(encrypted_message)
+    cipher = AES.new(get_encryption_key(), AES.MODE_CBC, combined[:16])
+    return unpad(cipher.decrypt(combined[16:]), AES.block_size).decode('utf-8')
+
+
+def bench_crypto(args):
+    from encryption import MessageCipher, get_encryption_key
+
+    key = get_encryption_key()
+    for count in args.sizes:
+        messages = [f"message {i}: " + "I have been feeling overwhelmed lately. " * 4 for i in range(count)]
+        print(f"{count} messages of ~{len(messages[0])} characters")
+
+        def timed(name, func, items):
+            start = time.perf_counter()
+            result = func(items)
+            elapsed = time.perf_counter() - start
+            print(f"  {name:<34} {elapsed * 1000:9.1f}ms  {count / elapsed:10.0f} msg/s")
+            return result
+
+        tokens = timed("legacy encrypt_message loop", lambda items: [legacy_encrypt_message(m) for m in items], messages)
+        timed("legacy decrypt_message loop", lambda items: [legacy_decrypt_message(t) for t in items], tokens)
+        for fmt in ("cbc", "gcm", "envelope"):
+            for workers in (1, args.workers):
+                cipher = MessageCipher(key, fmt=fmt, workers=workers)
+                tokens = timed(f"{fmt} encrypt_many, {workers} thread(s)", cipher.encrypt_many, messages)
+                timed(f"{fmt} decrypt_many, {workers} thread(s)", cipher.decrypt_many, tokens)
+
+
+def make_tiny_sentiment_model(texts, max_length):
+    """A randomly initialized two-layer RoBERTa classifier with a word-level tokenizer, built offline."""
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaForSequenceClassification
+    vocab = {"[PAD]": 0, "[UNK]": 1}
+    for text in texts:
+        for word in text.lower().split():
+            vocab.setdefault(word, len(vocab))
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="[PAD]", unk_token="[UNK]")
+    config = RobertaConfig(
+        vocab_size=len(vocab), hidden_size=128, num_hidden_layers=2, num_attention_heads=4,
+        intermediate_size=256, max_position_embeddings=max_length + 2, pad_token_id=0, num_labels=3
+    )
+    return RobertaForSequenceClassification(config), tokenizer
+
+
+def bench_sentiment(args):
+    import csv
+    import threading
+    import shared
+    from sentiment import SentimentAnalyzer, preprocess
+
+    with open(shared.DATASET_PATH, newline="", encoding="utf-8") as f:
+        texts = [preprocess(row["exercise"]) for _, row in zip(range(args.texts), csv.DictReader(f))]
+    if args.model:
+        analyzer = SentimentAnalyzer(model_path=args.model, quantize=args.quantize, cache_size=0)
+        print(f"Model {args.model}")
+    else:
+        model, tokenizer = make_tiny_sentiment_model(texts, args.max_length)
+        analyzer = SentimentAnalyzer(model=model, tokenizer=tokenizer, quantize=args.quantize,
+                                     cache_size=0, max_length=args.max_length)
+        print("Tiny randomly initialized model")
+    start = time.perf_counter()
+    analyzer.load()
+    print(f"Load {(time.perf_counter() - start) * 1000:.1f}ms, quantized: {args.quantize}, {len(texts)} texts")
+
+    analyzer.predict(texts[:8])
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        analyzer.predict(texts, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"  batch size {batch_size:<4} {len(texts) / elapsed:10.1f} texts/s")
+
+    # Concurrent single-text callers, grouped by the micro-batching thread
+    analyzer.batches = analyzer.texts = 0
+    per_thread = -(-len(texts) // args.threads)
+
+    def caller(chunk):
+        for text in chunk:
+            analyzer.analyze(text)
+    threads = [
+        threading.Thread(target=caller, args=(texts[i * per_thread:(i + 1) * per_thread],))
+        for i in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats = analyzer.stats()
+    print(
+        f"  {args.threads} concurrent analyze() callers {len(texts) / elapsed:10.1f} texts/s, "
+        f"mean batch {stats['mean_batch_size']:.1f}"
+    )
+
+
+LEGACY_MAIN_MOOD_TRIGGERS = [
+    'can you recommend', 'can you suggest', 'what should i do for', 'any tips for',
+    'help with', 'cope with', 'manage my', 'suggest something for', 'recommend something for'
+]
+LEGACY_CHATBOT_MOOD_KEYWORDS = ['suggest', 'recommend', 'help', 'manage my', 'what should i do ', 'any tips for']
+
+
+def legacy_get_latest_mood(text, mood_words):
+    """main.get_latest_mood as it was for a single message: a substring scan per mood word."""
+    for mood in mood_words:
+        if mood in text.lower():
+            return mood
+    return None
+
+
+def legacy_is_mood_message(text, keywords):
+    text = text.lower()
+    return any(kw in text for kw in keywords)
+
+
+def bench_moods(args):
+    import random
+    from mood_matcher import MoodMatcher, load_mood_config
+
+    config = load_mood_config()
+    mood_words = config["moods"]
+    phrases = mood_words + config["intents"]["recommendation"] + ["help", "I need help", "sadness", "lostness"]
+    filler = "today was long and I keep thinking about what happened at work with my friends".split()
+    rng = random.Random(0)
+    messages = []
+    for _ in range(args.messages):
+        words = rng.sample(filler, rng.randint(4, 12))
+        for _ in range(rng.randint(0, 2)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(phrases))
+        messages.append(" ".join(words))
+
+    start = time.perf_counter()
+    matcher = MoodMatcher(mood_words, config["intents"])
+    print(f"{len(messages)} messages, matcher compiled in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def timed(name, func):
+        start = time.perf_counter()
+        result = [func(message) for message in messages]
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<44} {elapsed * 1000:9.1f}ms  {len(messages) / elapsed:10.0f} msg/s")
+        return result
+
+    legacy_moods = timed("legacy mood word loop", lambda m: legacy_get_latest_mood(m, mood_words))
+    legacy_main = timed("legacy main.is_mood_message", lambda m: legacy_is_mood_message(m, LEGACY_MAIN_MOOD_TRIGGERS))
+    legacy_bot = timed(
+        "legacy ChatBot.is_mood_message", lambda m: legacy_is_mood_message(m, LEGACY_CHATBOT_MOOD_KEYWORDS)
+    )
+    scans = timed("matcher.scan (moods, intents and spans)", matcher.scan)
+    moods = [next((m.label for m in found if m.kind == "mood"), None) for found in scans]
+    intents = [any(m.kind == "intent" for m in found) for found in scans]
+    print(f"  legacy intent checks disagree on {sum(a != b for a, b in zip(legacy_main, legacy_bot))} messages")
+    print(f"  matcher and legacy loop report a different mood for {sum(a != b for a, b in zip(moods, legacy_moods))}")
+    print(f"  matcher recommendation intents: {sum(intents)}, legacy ChatBot: {sum(legacy_bot)}, "
+          f"legacy main: {sum(legacy_main)}")
+
+
+def bench_fetch(args):
+    import contextlib
+    import io
+    import tempfile
+    from stub_servers import FakeRecommendationServer
+    from vid import RecommendationFetcher, mental_health_states
+
+    with tempfile.TemporaryDirectory() as tmp, FakeRecommendationServer(
+        latency=args.latency, error_rate=args.error_rate, hang_seconds=args.timeout * 2
+    ) as server:
+        output = os.path.join(tmp, "recommendations.json")
+        fetcher = RecommendationFetcher(
+            fetch_url=server.url, output_path=output, concurrency=args.concurrency,
+            requests_per_minute=args.requests_per_minute, timeout=args.timeout, base_delay=0.1
+        )
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            failed = fetcher.run(mental_health_states)
+        elapsed = time.perf_counter() - start
+        metrics = fetcher.scheduler.metrics()
+    # The old script: one request at a time with a one second pause after each
+    sequential = len(mental_health_states) * (args.latency + 1)
+    print(f"{len(mental_health_states)} moods, {args.latency * 1000:.0f}ms latency, {args.error_rate:.0%} injected failures")
+    print(f"  concurrent fetch       {elapsed:8.2f}s  {server.requests} requests, {metrics['retries']} retries, "
+          f"{len(failed)} moods failed")
+    print(f"  sequential (old vid)   {sequential:8.2f}s  estimated, no retries")
+
+
+def bench_external(args):
+    import tempfile
+    from external_recommendations import CircuitBreaker, ExternalRecommendationClient
+    from stub_servers import FakeRecommendationServer
+
+    def timed_get(client, mood):
+        start = time.perf_counter()
+        client.get(mood)
+        return (time.perf_counter() - start) * 1000
+
+    with tempfile.TemporaryDirectory() as cache_dir, FakeRecommendationServer(latency=args.latency) as server:
+        moods = [f"mood {i}" for i in range(args.moods)]
+        local = {mood: {"videos": [{"title": "local"}], "podcasts": []} for mood in moods[: args.moods // 2]}
+        client = ExternalRecommendationClient(
+            url=server.url, local_recommendations=local, cache_dir=cache_dir, read_timeout=args.timeout
+        )
+        print(f"{args.moods} moods, upstream latency {args.latency * 1000:.0f}ms, half with a local fallback")
+        report("first request per mood", [timed_get(client, mood) for mood in moods])
+        time.sleep(args.latency * 2 + 0.5)
+        report("cached", [timed_get(client, mood) for mood in moods])
+
+        restarted = ExternalRecommendationClient(url=server.url, cache_dir=cache_dir, read_timeout=args.timeout)
+        report("after restart (disk tier)", [timed_get(restarted, mood) for mood in moods])
+
+        server.latency = args.timeout * 3
+        down = ExternalRecommendationClient(
+            url=server.url, read_timeout=args.timeout, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        )
+        report("upstream hanging, no cache", [timed_get(down, mood) for mood in moods])
+        print(f"  breaker {down.breaker.state} after {down.fetches} upstream calls, {down.errors} errors")
+        server.latency = 0
+
+
+def bench_api(args):
+    import requests
+    from api_client import ApiCall, ApiClient
+    from stub_servers import FakeChatApiServer
+
+    with FakeChatApiServer(latency=args.latency, error_rate=args.error_rate) as server:
+        client = ApiClient(base_url=server.base_url, backoff_factor=0.01)
+        token = client.request("POST", "/signup", {"username": "bench", "password": "pw", "name": "Bench"})["token"]
+        chat_ids = [client.request("POST", "/chats", {}, token=token)["_id"] for _ in range(args.calls)]
+        print(f"{args.calls} chats, {args.latency * 1000:.0f}ms server latency, {args.error_rate:.0%} injected 503s")
+
+        def legacy_call(chat_id):
+            # A fresh connection per call, as make_api_request did
+            return requests.get(f"{server.base_url}/chats/{chat_id}", headers={"Authorization": f"Bearer {token}"}).json()
+
+        samples = {}
+        for name, run in (
+            ("new connection per call", lambda: [legacy_call(chat_id) for chat_id in chat_ids]),
+            ("pooled session, sequential", lambda: [client.request("GET", f"/chats/{c}", token=token) for c in chat_ids]),
+            ("pooled session, batch", lambda: client.batch([ApiCall("GET", f"/chats/{c}") for c in chat_ids], token=token)),
+        ):
+            samples[name] = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = run()
+                samples[name].append((time.perf_counter() - start) * 1000)
+            report(name, samples[name])
+        failed = sum(isinstance(result, Exception) for result in results)
+        print(f"  last batch: {failed} failed calls; server saw {server.requests} requests, {server.failures} injected failures")
+        for route, snapshot in client.metrics().items():
+            print(f"  {route:<32} n={snapshot['count']:<5} p50 {snapshot['p50']:7.2f}ms  p95 {snapshot['p95']:7.2f}ms")
+
+
+def legacy_get_mental_health_resources(resources_json, category=None):
+    if category and category in resources_json:
+        return list(resources_json[category])
+    return list(resources_json.get('general', []))
+
+
+def legacy_format_resource_response(resources):
+    if not resources:
+        return "No resources found."
+    response = "**Mental Health Resources:**\n\n"
+    for i, resource in enumerate(resources, 1):
+        response += f"{i}. **{resource['title']}**\n"
+        if resource.get('summary'):
+            response += f"   {resource['summary']}\n"
+        if resource.get('url'):
+            response += f"   [Read more]({resource['url']})\n"
+        if resource.get('published_date'):
+            response += f"   Published: {resource['published_date']}\n"
+        response += "\n"
+    return response
+
+
+def bench_resources(args):
+    import json
+    from resource_catalog import RECOMMENDATIONS_PATH, RESOURCES_PATH, ResourceCatalog
+
+    with open(RESOURCES_PATH, 'r') as f:
+        resources_json = json.load(f)
+    with open(RECOMMENDATIONS_PATH, 'r') as f:
+        moods = list(json.load(f))
+
+    start = time.perf_counter()
+    catalog = ResourceCatalog(reload_interval=3600)
+    stats = catalog.stats()
+    print(f"catalog built in {(time.perf_counter() - start) * 1000:.1f}ms, "
+          f"{stats['resources']} resources, {stats['index_keys']} index keys")
+    polling = ResourceCatalog(reload_interval=0)
+
+    legacy = legacy_format_resource_response(legacy_get_mental_health_resources(resources_json))
+    assert legacy == catalog.format_resources(catalog.search(category='general'))
+
+    def timed(name, func):
+        samples = []
+        for i in range(args.requests):
+            start = time.perf_counter()
+            func(moods[i % len(moods)])
+            samples.append((time.perf_counter() - start) * 1_000_000)
+        report(name, samples, unit="us")
+
+    print(f"{args.requests} requests, lookup and render of the general resources")
+    timed("legacy concatenation", lambda mood: legacy_format_resource_response(
+        legacy_get_mental_health_resources(resources_json)))
+    timed("catalog", lambda mood: catalog.format_resources(catalog.search(category='general')))
+    timed("catalog, ranked by mood", lambda mood: catalog.format_resources(
+        catalog.search(mood=mood, category='general')))
+    timed("catalog, mtime check always", lambda mood: polling.format_resources(
+        polling.search(mood=mood, category='general')))
+    timed("catalog media by mood", catalog.media)
+    timed("full reload", lambda mood: catalog.reload())
+
+
+def legacy_push_messages(db, chat_id, docs):
+    """Append to the messages array inside the chat document, as add_messages did before buckets."""
+    from bson import ObjectId
+    stored_count = {"$ifNull": ["$message_count", 0]}
+    db.chats.update_one({"_id": ObjectId(chat_id)}, [{"$set": {
+        "messages": {"$concatArrays": [
+            {"$ifNull": ["$messages", []]},
+            {"$map": {
+                "input": {"$literal": docs},
+                "as": "msg",
+                "in": {"seq": {"$add": [stored_count, "$$msg.seq"]}, "role": "$$msg.role",
+                       "content": "$$msg.content", "timestamp": "$$msg.timestamp"}
+            }}
+        ]},
+        "message_count": {"$add": [stored_count, len(docs)]},
+        "updated_at": datetime.now()
+    }}])
+
+
+def bench_buckets(args):
+    import bson
+    from bson import ObjectId
+    from db_handler import MESSAGE_BUCKET_SIZE, bucket_start, message_cache
+    from encryption import get_cipher
+
+    client, backend = make_mongo_client()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(f"Append and tail read ({args.tail} messages) per chat size on {backend}, "
+          f"buckets of {MESSAGE_BUCKET_SIZE}, {args.turns} turns")
+    template = get_cipher().encrypt_many(f"stored message {i} " * 6 for i in range(MESSAGE_BUCKET_SIZE))
+    now = datetime.now()
+
+    def history(count):
+        return [
+            {"seq": seq, "role": "user" if seq % 2 == 0 else "assistant",
+             "content": template[seq % MESSAGE_BUCKET_SIZE], "timestamp": now}
+            for seq in range(count)
+        ]
+
+    for size in sizes:
+        messages = history(size)
+        for layout in ("inline array", "buckets"):
+            counter = {}
+            db = make_counting_db(client, counter)
+            chat_id = db.create_chat("benchmark_user")
+            oid = ObjectId(chat_id)
+            if layout == "buckets":
+                buckets = {}
+                for msg in messages:
+                    buckets.setdefault(bucket_start(msg["seq"]), []).append(msg)
+                if buckets:
+                    db.messages.insert_many([
+                        {"chat_id": oid, "seq": start, "count": len(group), "messages": group}
+                        for start, group in buckets.items()
+                    ])
+                db.chats.update_one({"_id": oid}, {"$set": {"message_count": size}})
+                largest = max((bson.encode(b) for b in db.messages.find({"chat_id": oid})), key=len, default=b"")
+            else:
+                db.chats.update_one({"_id": oid}, {"$set": {"message_count": size, "messages": messages}})
+                largest = bson.encode(db.chats.find_one({"_id": oid}))
+
+            appends, reads = [], []
+            counter.clear()
+            for turn in range(args.turns):
+                pair = [("user", f"message {turn} " * 8), ("assistant", f"reply {turn} " * 20)]
+                start = time.perf_counter()
+                if layout == "buckets":
+                    db.add_messages(chat_id, pair, start_seq=size + turn * 2)
+                else:
+                    docs = [{"seq": i, "role": role, "content": token, "timestamp": datetime.now()}
+                            for i, ((role, _), token) in enumerate(zip(pair, get_cipher().encrypt_many(c for _, c in pair)))]
+                    legacy_push_messages(db, chat_id, docs)
+                appends.append((time.perf_counter() - start) * 1000)
+                message_cache.invalidate(chat_id)
+                start = time.perf_counter()
+                tail = db.get_chat_history(chat_id, limit=args.tail)
+                reads.append((time.perf_counter() - start) * 1000)
+            assert len(tail) == min(args.tail, size + args.turns * 2)
+            db.analytics_buffer.flush()
+            print(f"{size} messages, {layout}: largest document {len(largest) / 1024:.0f}KB, "
+                  f"round trips/turn {sum(counter.values()) / args.turns:.1f}")
+            report("  append turn", appends)
+            report("  tail read", reads)
+            db.delete_chat(chat_id)
+
+
+def legacy_daily_messages(db, start, end):
+    """Messages per day by scanning every stored message, as a dashboard without rollups would."""
+    counts = {}
+    for bucket in db.messages.find({}, {"messages.timestamp": 1}):
+        for msg in bucket["messages"]:
+            if start <= msg["timestamp"] <= end:
+                day = msg["timestamp"].date().isoformat()
+                counts[day] = counts.get(day, 0) + 1
+    return counts
+
+
+def bench_rollups(args):
+    import random
+    from bson import ObjectId
+    from analytics_rollups import periods_between
+    from db_handler import bucket_start
+    from encryption import generate_anonymous_id
+
+    client, backend = make_mongo_client()
+    counter = {}
+    db = make_counting_db(client, counter)
+    rng = random.Random(0)
+    end = datetime.now()
+    start = end - timedelta(days=args.days - 1)
+    moods = ["anxious", "sad", "stressed", "lonely", None]
+    print(f"{args.chats} chats with {args.messages} messages each over {args.days} days on {backend}")
+
+    write_samples = []
+    buckets = []
+    for _ in range(args.chats):
+        chat_id = str(ObjectId())
+        anonymous_id = generate_anonymous_id(chat_id)
+        opened = start + timedelta(seconds=rng.uniform(0, (end - start).total_seconds()))
+        db.analytics_buffer.record_session(anonymous_id, opened)
+        messages = []
+        for seq in range(args.messages):
+            when = min(end, opened + timedelta(minutes=seq * rng.uniform(1, 30)))
+            mood = rng.choice(moods)
+            t0 = time.perf_counter()
+            db.analytics_buffer.record(anonymous_id, 1, when, {rng.choice(["negative", "neutral", "positive"]): 1},
+                                       {mood: 1} if mood else None)
+            write_samples.append((time.perf_counter() - t0) * 1000)
+            messages.append({"seq": seq, "role": "user", "content": "", "timestamp": when})
+        for first in range(0, len(messages), 100):
+            buckets.append({"chat_id": ObjectId(chat_id), "seq": bucket_start(first), "messages": messages[first:first + 100]})
+    counter.clear()
+    t0 = time.perf_counter()
+    db.analytics_buffer.flush()
+    print(f"final flush {(time.perf_counter() - t0) * 1000:.1f}ms, {dict(sorted(counter.items()))}")
+    report("record per message", write_samples)
+    db.messages.insert_many(buckets)
+
+    def timed(name, func, repeat=args.repeat):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = func()
+            samples.append((time.perf_counter() - t0) * 1000)
+        report(name, samples)
+        return result
+
+    scanned = timed("scan all messages (daily)", lambda: legacy_daily_messages(db, start, end), repeat=3)
+    daily = timed("rollup series (daily)", lambda: db.rollups.series("day", start, end))
+    timed("rollup series (hourly, 48h)", lambda: db.rollups.series("hour", end - timedelta(hours=47), end))
+    assert [scanned.get(day, 0) for day in periods_between("day", start, end)] == daily["messages"]
+    print(f"{sum(daily['messages'])} messages, {sum(daily['sessions'])} chat-days, "
+          f"{db.rollups.collection.count_documents({})} rollup documents")
+    db.rollups.collection.drop()
+    db.messages.drop()
+
+
+def bench_tracing(args):
+    import metrics
+
+    def per_call_ns(func):
+        start = time.perf_counter_ns()
+        for _ in range(args.iterations):
+            func()
+        return (time.perf_counter_ns() - start) / args.iterations
+
+    def bare():
+        pass
+
+    def traced():
+        with metrics.span("bench"):
+            pass
+
+    print(f"Span overhead over {args.iterations} calls")
+    baseline = per_call_ns(bare)
+    metrics.enable_tracing(False)
+    disabled = per_call_ns(traced)
+    metrics.enable_tracing(True)
+    enabled = per_call_ns(traced)
+    print(f"  empty call            {baseline:8.0f}ns")
+    print(f"  span, tracing off     {disabled:8.0f}ns  (+{disabled - baseline:.0f}ns)")
+    print(f"  span, tracing on      {enabled:8.0f}ns  (+{enabled - baseline:.0f}ns)")
+
+    client, backend = make_mongo_client()
+    db = make_counting_db(client, {})
+    chat_id = db.create_chat("benchmark_user")
+    for turn in range(args.turns):
+        with metrics.turn():
+            db.get_conversation_context(chat_id, 40)
+            db.add_messages(chat_id, [("user", f"message {turn} " * 8), ("assistant", f"reply {turn} " * 20)],
+                            start_seq=turn * 2)
+    db.delete_chat(chat_id)
+    print(f"Stages over {args.turns} database turns on {backend}")
+    for key, snapshot in metrics.STAGE_LATENCY_MS.snapshot().items():
+        stage, outcome = key.split(" ")
+        if stage != "bench":
+            print(f"  {stage:<14} {outcome:<6} n={snapshot['count']:<6} mean {snapshot['mean']:8.3f}ms  "
+                  f"p95 {snapshot['p95']:8.3f}ms")
+    metrics.enable_tracing(False)
+
+
+STARTUP_ENTRY_POINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+# Milliseconds allowed for importing what main.py imports at the top, beyond Streamlit itself
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "150"))
+# Imported by the Streamlit server before it runs main.py, so not charged to the app
+STARTUP_BASELINE_MODULES = ("streamlit",)
+# Only the features that need them may import these, after the first page render
+STARTUP_DEFERRED_MODULES = frozenset({
+    "langchain", "langchain_core", "langchain_community", "openai", "httpx", "sklearn", "pandas",
+    "scipy", "numpy", "torch", "transformers", "pymongo", "emoji"
+})
+_STARTUP_MARKER = "-- startup imports --"
+
+
+def startup_imports(path=STARTUP_ENTRY_POINT):
+    """Modules imported at the top level of an entry point script."""
+    import ast
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure_imports(modules, cwd=None):
+    """One `python -X importtime` run in a fresh interpreter.
+
+    Returns (total ms, {top-level module: cumulative ms}, every module
+    imported, modules that could not be imported), counting only what is
+    imported after STARTUP_BASELINE_MODULES.
+    """
+    import subprocess
+    import sys
+    # Plain import statements, since importtime does not log imports made through importlib
+    def import_all(names, report_missing):
+        on_error = "print({!r})" if report_missing else "pass"
+        return "".join(f"try:\n    import {name}\nexcept ImportError:\n    {on_error.format(name)}\n" for name in names)
+    code = (
+        import_all(STARTUP_BASELINE_MODULES, False)
+        + f"import sys\nsys.stderr.write({_STARTUP_MARKER!r} + '\\n')\n"
+        + import_all(modules, True)
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd or os.path.dirname(STARTUP_ENTRY_POINT), capture_output=True, text=True, check=True
+    )
+    lines = result.stderr.split(_STARTUP_MARKER + "\n", 1)[-1].splitlines()
+    top_level = {}
+    imported = set()
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip())
+        # Nested imports are indented under the module that triggered them
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = int(cumulative) / 1000
+    return sum(top_level.values()), top_level, imported, result.stdout.split()
+
+
+def bench_startup(args):
+    modules = startup_imports(args.entry_point)
+    runs = [measure_imports(modules, os.path.dirname(os.path.abspath(args.entry_point))) for _ in range(args.repeat)]
+    total, top_level, imported, missing = min(runs, key=lambda run: run[0])
+    print(f"Imports of {os.path.basename(args.entry_point)} beyond {', '.join(STARTUP_BASELINE_MODULES)}, "
+          f"best of {args.repeat} runs: {total:.1f}ms (budget {args.budget:.0f}ms)")
+    for name, ms in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<28} {ms:8.1f}ms")
+    if missing:
+        print(f"Not installed, so not measured: {', '.join(missing)}")
+    deferred = sorted(name for name in imported if name.split(".")[0] in STARTUP_DEFERRED_MODULES)
+    problems = []
+    if deferred:
+        problems.append(f"imported at startup but should load lazily: "
+                        f"{', '.join(sorted({name.split('.')[0] for name in deferred}))}")
+    if total > args.budget:
+        problems.append(f"startup imports took {total:.1f}ms, over the {args.budget:.0f}ms budget")
+    if problems:
+        raise SystemExit("FAIL: " + "; ".join(problems))
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    suites = parser.add_subparsers(dest="suite", required=True)
+
+    db_parser = suites.add_parser("db", help="ChatDatabase write path round trips and latency")
+    db_parser.add_argument("--turns", type=int, default=200)
+    db_parser.set_defaults(func=bench_db)
+
+    sessions_parser = suites.add_parser("sessions", help="Session cold start time and RSS per session")
+    sessions_parser.add_argument("--sessions", type=int, default=20)
+    sessions_parser.set_defaults(func=bench_sessions)
+
+    recommender_parser = suites.add_parser("recommender", help="Single vs batched recommendation scoring")
+    recommender_parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    recommender_parser.add_argument("--k", type=int, default=5)
+    recommender_parser.add_argument("--repeat", type=int, default=5)
+    recommender_parser.set_defaults(func=bench_recommender)
+
+    ttft_parser = suites.add_parser("ttft", help="Time to first token, blocking vs streamed replies")
+    ttft_parser.add_argument("--turns", type=int, default=10)
+    ttft_parser.add_argument("--first-token-latency", type=float, default=0.2)
+    ttft_parser.add_argument("--token-interval", type=float, default=0.02)
+    ttft_parser.set_defaults(func=bench_ttft)
+
+    memory_parser = suites.add_parser("memory", help="Prompt tokens per turn with rolling summaries")
+    memory_parser.add_argument("--turns", type=int, default=200)
+    memory_parser.set_defaults(func=bench_memory)
+
+    load_parser = suites.add_parser("async-load", help="Concurrent sessions through the async ChatBot and scheduler")
+    load_parser.add_argument("--sessions", type=int, default=100)
+    load_parser.add_argument("--turns", type=int, default=3)
+    load_parser.add_argument("--latency", type=float, default=0.3)
+    load_parser.add_argument("--error-rate", type=float, default=0.05)
+    load_parser.add_argument("--max-concurrency", type=int, default=32)
+    load_parser.add_argument("--rpm", type=float, default=6000)
+    load_parser.set_defaults(func=bench_async_load)
+
+    crypto_parser = suites.add_parser("crypto", help="Message encryption and decryption throughput")
+    crypto_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    crypto_parser.add_argument("--workers", type=int, default=4)
+    crypto_parser.set_defaults(func=bench_crypto)
+
+    sentiment_parser = suites.add_parser("sentiment", help="Sentiment analysis throughput by batch size")
+    sentiment_parser.add_argument("--texts", type=int, default=512)
+    sentiment_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    sentiment_parser.add_argument("--threads", type=int, default=32, help="Concurrent analyze() callers")
+    sentiment_parser.add_argument("--model", help="Local model directory to use instead of the tiny random model")
+    sentiment_parser.add_argument("--quantize", action="store_true", help="Apply dynamic int8 quantization")
+    sentiment_parser.add_argument("--max-length", type=int, default=128)
+    sentiment_parser.set_defaults(func=bench_sentiment)
+
+    moods_parser = suites.add_parser("moods", help="Compiled mood and intent matcher vs keyword loops")
+    moods_parser.add_argument("--messages", type=int, default=10000)
+    moods_parser.set_defaults(func=bench_moods)
+
+    fetch_parser = suites.add_parser("fetch", help="vid.py recommendation refresh against a local mock server")
+    fetch_parser.add_argument("--latency", type=float, default=0.3)
+    fetch_parser.add_argument("--error-rate", type=float, default=0.1)
+    fetch_parser.add_argument("--concurrency", type=int, default=8)
+    fetch_parser.add_argument("--requests-per-minute", type=float, default=600)
+    fetch_parser.add_argument("--timeout", type=float, default=2.0)
+    fetch_parser.set_defaults(func=bench_fetch)
+
+    external_parser = suites.add_parser("external", help="Cached external recommendation client vs a slow upstream")
+    external_parser.add_argument("--moods", type=int, default=20)
+    external_parser.add_argument("--latency", type=float, default=0.3)
+    external_parser.add_argument("--timeout", type=float, default=0.5, help="Client read timeout in seconds")
+    external_parser.set_defaults(func=bench_external)
+
+    api_parser = suites.add_parser("api", help="Node API client: pooled, batched and retried calls against a stub")
+    api_parser.add_argument("--calls", type=int, default=8, help="Independent calls per rerun")
+    api_parser.add_argument("--latency", type=float, default=0.02)
+    api_parser.add_argument("--error-rate", type=float, default=0.0)
+    api_parser.add_argument("--repeat", type=int, default=10)
+    api_parser.set_defaults(func=bench_api)
+
+    resources_parser = suites.add_parser("resources", help="Resource lookup and rendering, catalog vs concatenation")
+    resources_parser.add_argument("--requests", type=int, default=2000)
+    resources_parser.set_defaults(func=bench_resources)
+
+    buckets_parser = suites.add_parser("buckets", help="Append and tail-read latency, inline array vs message buckets")
+    buckets_parser.add_argument("--sizes", default="10,1000,50000", help="Comma-separated messages per chat")
+    buckets_parser.add_argument("--turns", type=int, default=20)
+    buckets_parser.add_argument("--tail", type=int, default=20, help="Messages per tail read")
+    buckets_parser.set_defaults(func=bench_buckets)
+
+    rollups_parser = suites.add_parser("rollups", help="Analytics rollup writes and dashboard series vs a full scan")
+    rollups_parser.add_argument("--chats", type=int, default=500)
+    rollups_parser.add_argument("--messages", type=int, default=20, help="Messages per chat")
+    rollups_parser.add_argument("--days", type=int, default=30)
+    rollups_parser.add_argument("--repeat", type=int, default=20)
+    rollups_parser.set_defaults(func=bench_rollups)
+
+    tracing_parser = suites.add_parser("tracing", help="Span overhead and per-stage latency of database turns")
+    tracing_parser.add_argument("--iterations", type=int, default=200000)
+    tracing_parser.add_argument("--turns", type=int, default=200)
+    tracing_parser.set_defaults(func=bench_tracing)
+
+    startup_parser = suites.add_parser("startup", help="Import time of main.py; exits non-zero past the budget")
+    startup_parser.add_argument("--budget", type=float, default=STARTUP_IMPORT_BUDGET_MS, help="Milliseconds")
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    startup_parser.add_argument("--entry-point", default=STARTUP_ENTRY_POINT)
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
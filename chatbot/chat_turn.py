@@ -0,0 +1,51 @@
+"""The reply side of a chat turn, without any Streamlit state.
+
+main.py calls these with the session's chatbot and open chat; loadtest.py
+calls them the same way for simulated users.
+"""
+import shared
+from mood_matcher import detect_mood, is_recommendation_request
+
+
+def is_mood_message(user_input):
+    return is_recommendation_request(user_input)
+
+
+def get_mental_health_resources(mood=None, category=None, region=None):
+    """Resources in `category` (or 'general'), the ones matching `mood` first."""
+    catalog = shared.get_resource_catalog()
+    resources = catalog.search(mood=mood, category=category, region=region) if category else []
+    if not resources:
+        resources = catalog.search(mood=mood, category='general')
+    return resources
+
+
+def format_resource_response(resources):
+    return shared.get_resource_catalog().format_resources(resources)
+
+
+def recommendation_response(chatbot, prompt):
+    recommendations = chatbot.recommender.get_recommendations(prompt)
+    response = "Here are some exercises that might help you:\n\n"
+    for i, rec in enumerate(recommendations, 1):
+        response += f"{i}. {rec['exercise']}\n\n"
+
+    resources = get_mental_health_resources(mood=detect_mood(prompt))
+    response += "\n" + format_resource_response(resources)
+
+    response += "\nWould you like to try any of these exercises or learn more about the resources? I'm here to support you."
+    return response
+
+
+def process_user_input(chatbot, chat_id, prompt):
+    if is_mood_message(prompt):
+        return recommendation_response(chatbot, prompt)
+    return chatbot.get_bot_response(chat_id, prompt)
+
+
+def stream_user_input(chatbot, chat_id, prompt, stream_reply):
+    """Like process_user_input, but yields the LLM reply as `stream_reply(chat_id, prompt)` produces it."""
+    if is_mood_message(prompt):
+        yield recommendation_response(chatbot, prompt)
+        return
+    yield from stream_reply(chat_id, prompt)
@@ -1,24 +1,20 @@
 import os
 from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import PromptTemplate
-from db_handler import ChatDatabase
-from encryption import encrypt_message, decrypt_message
-from recommendation_system import MoodBasedRecommender
+import shared
+from metrics import span
+from conversation_memory import SummaryBufferMemory
+from mood_matcher import is_recommendation_request
 
 load_dotenv()
 
+# Most recent messages loaded per turn; older ones are only seen through the summary
+HISTORY_WINDOW = int(os.getenv("LLM_HISTORY_WINDOW", "40"))
+
 class ChatBot:
-    def __init__(self):
+    def __init__(self, llm=None, db=None, recommender=None, response_cache=None):
         try:
-            self.llm = ChatOpenAI(
-                base_url="https://api.groq.com/openai/v1",
-                api_key=os.getenv("GROQ_API_KEY"),
-                model="llama3-8b-8192",
-                temperature=0.7
-            )
+            self.llm = llm or shared.get_llm()
             
             self.prompt_template = PromptTemplate(
                 input_variables=["history", "input"],
@@ -35,11 +31,10 @@ User: {input}
 AI:"""
             )
             
-            self.db = ChatDatabase()
-            
-            # Initialize the recommendation system
-            dataset_path = os.path.join(os.path.dirname(__file__), 'mental_health_chatbot_interactions.csv')
-            self.recommender = MoodBasedRecommender(dataset_path)
+            self.db = db or shared.get_database()
+            self.recommender = recommender or shared.get_recommender()
+            self.memory = SummaryBufferMemory(self.llm)
+            self.response_cache = response_cache or shared.get_response_cache()
             
         except Exception as e:
             print(f"Error initializing chatbot: {e}")
@@ -47,44 +42,89 @@ AI:"""
 
     @staticmethod
     def is_mood_message(user_input):
-        mood_keywords = [
-            'suggest', 'recommend', 'help', 'manage my', 'what should i do ', 'any tips for'
-        ]
-        user_input_lower = user_input.lower()
-        return any(kw in user_input_lower for kw in mood_keywords)
+        return is_recommendation_request(user_input)
+
+    def get_recommendation_response(self, user_input):
+        if not self.recommender:
+            return "I apologize, but I'm having trouble accessing the recommendation system right now. Please try again later."
+        recommendations = self.recommender.get_recommendations(user_input)
+        response = "Here are some exercises that might help you:\n\n"
+        for i, rec in enumerate(recommendations, 1):
+            response += f"{i}. {rec['exercise']}\n\n"
+        response += "Would you like to try any of these exercises? I'm here to support you."
+        return response
+
+    def load_context(self, chat_id):
+        return self.db.get_conversation_context(chat_id, limit=HISTORY_WINDOW)
+
+    def build_prompt(self, chat_id, user_input, context=None, summarize=None):
+        if context is None:
+            context = self.load_context(chat_id)
+        summary, summary_upto, history = self.memory.load(
+            context["summary"],
+            context["summary_upto"],
+            context["messages"],
+            summarize
+        )
+        if summary_upto > context["summary_upto"]:
+            self.db.update_conversation_summary(chat_id, summary, summary_upto)
+        return self.prompt_template.format(history=history, input=user_input)
+
+    def cached_response(self, user_input, context):
+        if not self.response_cache:
+            return None
+        return self.response_cache.get(user_input, context["messages"], context["summary"], context["summary_upto"])
+
+    def cache_response(self, user_input, context, response):
+        if self.response_cache:
+            self.response_cache.put(
+                user_input, context["messages"], response, context["summary"], context["summary_upto"]
+            )
 
     def get_bot_response(self, chat_id, user_input):
         try:
             if self.is_mood_message(user_input):
-                if self.recommender:
-                    recommendations = self.recommender.get_recommendations(user_input)
-                    response = "Here are some exercises that might help you:\n\n"
-                    for i, rec in enumerate(recommendations, 1):
-                        response += f"{i}. {rec['exercise']}\n\n"
-                    response += "Would you like to try any of these exercises? I'm here to support you."
-                    return response
-                else:
-                    return "I apologize, but I'm having trouble accessing the recommendation system right now. Please try again later."
+                return self.get_recommendation_response(user_input)
             # Otherwise, use LLM for normal conversation
-            history = self.db.get_chat_history(chat_id)
-            memory = ConversationBufferMemory()
-            for msg in history:
-                if msg["role"] == "user":
-                    memory.chat_memory.add_user_message(msg["content"])
-                else:
-                    memory.chat_memory.add_ai_message(msg["content"])
-            conversation = ConversationChain(
-                llm=self.llm,
-                memory=memory,
-                prompt=self.prompt_template,
-                verbose=False
-            )
-            response = conversation.predict(input=user_input)
+            context = self.load_context(chat_id)
+            cached = self.cached_response(user_input, context)
+            if cached:
+                return cached
+            prompt = self.build_prompt(chat_id, user_input, context)
+            with span("llm"):
+                response = self.llm.predict(prompt)
+            self.cache_response(user_input, context, response)
             return response
         except Exception as e:
             print(f"Error in get_bot_response: {e}")
             return "I apologize, but I encountered an error processing your message. Please try again."
 
+    def stream_bot_response(self, chat_id, user_input):
+        """Like get_bot_response, but yields the LLM reply token by token as it is generated."""
+        streamed = []
+        try:
+            if self.is_mood_message(user_input):
+                yield self.get_recommendation_response(user_input)
+                return
+            context = self.load_context(chat_id)
+            cached = self.cached_response(user_input, context)
+            if cached:
+                yield cached
+                return
+            prompt = self.build_prompt(chat_id, user_input, context)
+            with span("llm"):
+                for chunk in self.llm.stream(prompt):
+                    if chunk.content:
+                        streamed.append(chunk.content)
+                        yield chunk.content
+            self.cache_response(user_input, context, "".join(streamed))
+        except Exception as e:
+            print(f"Error in stream_bot_response: {e}")
+            if streamed:
+                yield "\n\nI apologize, but my response was interrupted. Please try again."
+            else:
+                yield "I apologize, but I encountered an error processing your message. Please try again."
+
 def main():
     # Example usage
     chatbot = ChatBot()
@@ -97,8 +137,10 @@ def main():
             print("\nTake care! Remember, you're not alone. 💚")
             break
             
-        response = chatbot.get_bot_response("test_chat_id", user_input)
-        print(f"\nBot: {response}")
+        print("\nBot: ", end="", flush=True)
+        for token in chatbot.stream_bot_response("test_chat_id", user_input):
+            print(token, end="", flush=True)
+        print()
 
 if __name__ == "__main__":
     main()
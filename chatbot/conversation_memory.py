@@ -0,0 +1,95 @@
+import os
+from dotenv import load_dotenv
+from langchain.prompts import PromptTemplate
+
+load_dotenv()
+
+# Prompt tokens allowed for verbatim history before older turns are summarized
+MEMORY_TOKEN_BUDGET = int(os.getenv("LLM_MEMORY_TOKEN_BUDGET", "1500"))
+# Most recent turns (user + assistant pairs) kept verbatim
+MEMORY_RECENT_TURNS = int(os.getenv("LLM_MEMORY_RECENT_TURNS", "6"))
+
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template="""Progressively summarize the lines of a supportive mental health conversation, adding onto the previous summary and returning a new summary.
+Keep what the user shared about their feelings, circumstances and what has already been suggested. Write at most a short paragraph.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def format_messages(messages):
+    lines = []
+    for msg in messages:
+        speaker = "Human" if msg["role"] == "user" else "AI"
+        lines.append(f"{speaker}: {msg['content']}")
+    return "\n".join(lines)
+
+
+class SummaryBufferMemory:
+    """Keeps the newest turns verbatim within a token budget and folds older ones into a summary.
+
+    Folding happens in chunks: once the verbatim part exceeds the budget or
+    the turn limit, it is trimmed to half of both, so the summarizing LLM
+    call runs every few turns rather than on every turn.
+    """
+
+    def __init__(self, llm, token_budget=MEMORY_TOKEN_BUDGET, recent_turns=MEMORY_RECENT_TURNS):
+        self.llm = llm
+        self.token_budget = token_budget
+        self.max_messages = recent_turns * 2
+
+    @staticmethod
+    def summary_prompt(summary, messages):
+        return SUMMARY_PROMPT.format(summary=summary or "(none)", new_lines=format_messages(messages))
+
+    def summarize(self, summary, messages):
+        return self.llm.predict(self.summary_prompt(summary, messages)).strip()
+
+    def _split(self, messages):
+        tokens = sum(estimate_tokens(msg["content"]) for msg in messages)
+        if tokens <= self.token_budget and len(messages) <= self.max_messages:
+            return [], messages
+        keep = 0
+        kept_tokens = 0
+        for msg in reversed(messages):
+            cost = estimate_tokens(msg["content"])
+            if keep >= self.max_messages // 2 or kept_tokens + cost > self.token_budget // 2:
+                break
+            keep += 1
+            kept_tokens += cost
+        keep = max(keep, 1)
+        return messages[:-keep], messages[-keep:]
+
+    def load(self, summary, summary_upto, messages, summarize=None):
+        """Return (summary, summary_upto, history text) for the prompt.
+
+        `messages` are the latest stored messages, each with its `seq`;
+        those before `summary_upto` are already covered by `summary`.
+        `summarize(summary, messages)` replaces the blocking LLM call, e.g.
+        to send it through a RequestScheduler.
+        """
+        messages = [msg for msg in messages if msg["seq"] >= summary_upto]
+        to_fold, recent = self._split(messages)
+        if to_fold:
+            try:
+                summary, summary_upto = (summarize or self.summarize)(summary, to_fold), to_fold[-1]["seq"] + 1
+            except Exception as e:
+                # Answer from the previous summary and the recent window; summary_upto is
+                # unchanged, so the next turn tries to fold these messages again
+                print(f"Error summarizing conversation: {e}")
+        history = format_messages(recent)
+        if summary:
+            history = f"Summary of earlier conversation: {summary}\n{history}"
+        return summary, summary_upto, history
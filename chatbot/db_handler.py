@@ -1,19 +1,255 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from collections import OrderedDict
 from datetime import datetime
+import atexit
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 from bson import ObjectId
-from encryption import encrypt_message, decrypt_message, generate_anonymous_id, anonymize_timestamp
+from encryption import encrypt_message, decrypt_message, get_cipher, generate_anonymous_id, anonymize_timestamp
+from annotations import MessageAnnotator, SENTIMENT_KEYS
+from analytics_rollups import AnalyticsRollups, write_rollups
+from metrics import span
 
 load_dotenv()
 
+ANALYTICS_FLUSH_SIZE = int(os.getenv("ANALYTICS_FLUSH_SIZE", "50"))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "5"))
+DECRYPT_CACHE_BYTES = int(os.getenv("DECRYPT_CACHE_BYTES", str(32 * 1024 * 1024)))
+# Messages per document in the messages collection
+MESSAGE_BUCKET_SIZE = int(os.getenv("MESSAGE_BUCKET_SIZE", "100"))
+DUPLICATE_KEY_ERROR = 11000
+# Messages stored in a chat; chats migrate_chats.py has not reached yet have no message_count,
+# only their inline array
+STORED_COUNT = {"$ifNull": ["$message_count", {"$size": {"$ifNull": ["$messages", []]}}]}
+
+
+def bucket_start(seq, size=MESSAGE_BUCKET_SIZE):
+    """Sequence number of the first slot of the bucket holding `seq`."""
+    return seq - seq % size
+
+
+def bucket_updates(chat_id, docs, size=MESSAGE_BUCKET_SIZE):
+    """(filter, update) pairs appending message docs, which carry their final `seq`, to a chat's buckets.
+
+    Each bucket is upserted on its (chat_id, seq) key and kept sorted by
+    seq. An update is skipped when the bucket already holds the first
+    message it would add, so writing the same messages again is a no-op;
+    the upsert then fails on the unique index, and so does one that races
+    another writer creating the same bucket. `write_buckets` retries those
+    without upsert, which appends in the second case only.
+    """
+    groups = {}
+    for doc in docs:
+        groups.setdefault(bucket_start(doc["seq"], size), []).append(doc)
+    return [
+        (
+            {"chat_id": chat_id, "seq": start, "messages.seq": {"$ne": group[0]["seq"]}},
+            {"$push": {"messages": {"$each": group, "$sort": {"seq": 1}}}, "$inc": {"count": len(group)}}
+        )
+        for start, group in groups.items()
+    ]
+
+
+def write_buckets(collection, chat_id, docs, size=MESSAGE_BUCKET_SIZE):
+    updates = bucket_updates(chat_id, docs, size)
+    try:
+        if len(updates) == 1:
+            collection.update_one(*updates[0], upsert=True)
+        elif updates:
+            collection.bulk_write(
+                [UpdateOne(condition, update, upsert=True) for condition, update in updates],
+                ordered=False
+            )
+    except DuplicateKeyError:
+        collection.update_one(*updates[0])
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        collection.bulk_write([UpdateOne(*updates[error["index"]]) for error in errors], ordered=False)
+
+
+class AnalyticsBuffer:
+    """Accumulates per-chat analytics counters and writes them with one bulk_write.
+
+    With a `rollups` collection, the same counters plus new sessions and
+    moods are also accumulated per (anonymous_id, anonymized hour) and
+    applied to the hourly and daily rollups on each flush.
+    """
+
+    def __init__(self, collection, rollups=None, flush_size=ANALYTICS_FLUSH_SIZE,
+                 flush_interval=ANALYTICS_FLUSH_INTERVAL):
+        self.collection = collection
+        self.rollups = rollups
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._pending_rollups = {}
+        self._pending_messages = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _rollup_entry(self, anonymous_id, when):
+        return self._pending_rollups.setdefault(
+            (anonymous_id, anonymize_timestamp(when)),
+            {"new_sessions": 0, "messages": 0, "moods": {}, "sentiment": {}}
+        )
+
+    def _due(self):
+        return (
+            self._pending_messages >= self.flush_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def record_session(self, anonymous_id, when):
+        if self.rollups is None:
+            return
+        with self._lock:
+            self._rollup_entry(anonymous_id, when)["new_sessions"] += 1
+            due = self._due()
+        if due:
+            self.flush()
+
+    def record(self, anonymous_id, message_count, when, sentiment=None, moods=None):
+        with self._lock:
+            entry = self._pending.setdefault(
+                anonymous_id,
+                {"message_count": 0, "last_activity": None, "sentiment": {}}
+            )
+            entry["message_count"] += message_count
+            for key, count in (sentiment or {}).items():
+                entry["sentiment"][key] = entry["sentiment"].get(key, 0) + count
+            entry["last_activity"] = max(filter(None, [entry["last_activity"], anonymize_timestamp(when)]))
+            if self.rollups is not None:
+                rollup = self._rollup_entry(anonymous_id, when)
+                rollup["messages"] += message_count
+                for key, count in (sentiment or {}).items():
+                    rollup["sentiment"][key] = rollup["sentiment"].get(key, 0) + count
+                for mood, count in (moods or {}).items():
+                    rollup["moods"][mood] = rollup["moods"].get(mood, 0) + count
+            self._pending_messages += message_count
+            due = self._due()
+        if due:
+            self.flush()
+
+    def discard(self, anonymous_id):
+        with self._lock:
+            entry = self._pending.pop(anonymous_id, None)
+            if entry:
+                self._pending_messages -= entry["message_count"]
+            for key in [key for key in self._pending_rollups if key[0] == anonymous_id]:
+                del self._pending_rollups[key]
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            rollups, self._pending_rollups = self._pending_rollups, {}
+            self._pending_messages = 0
+            self._last_flush = time.monotonic()
+        if pending:
+            try:
+                self.collection.bulk_write([
+                    UpdateOne(
+                        {"anonymous_id": anonymous_id},
+                        {
+                            "$inc": {
+                                "message_count": entry["message_count"],
+                                **{f"sentiment.{key}": count for key, count in entry["sentiment"].items()}
+                            },
+                            "$max": {"last_activity": entry["last_activity"]}
+                        }
+                    )
+                    for anonymous_id, entry in pending.items()
+                ], ordered=False)
+            except Exception as e:
+                print(f"Error flushing analytics: {e}")
+        if rollups:
+            try:
+                write_rollups(self.rollups, rollups)
+            except Exception as e:
+                print(f"Error flushing analytics rollups: {e}")
+
+
+class DecryptedMessageCache:
+    """LRU cache of decrypted message contents keyed by (chat_id, seq), bounded in bytes.
+
+    Stored messages are append-only, so an entry never goes stale while its
+    chat exists.
+    """
+
+    def __init__(self, max_bytes=DECRYPT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._chat_keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, seq):
+        with self._lock:
+            content = self._entries.get((chat_id, seq))
+            if content is not None:
+                self._entries.move_to_end((chat_id, seq))
+            return content
+
+    def put(self, chat_id, seq, content):
+        cost = len(content.encode("utf-8"))
+        if cost > self.max_bytes:
+            return
+        key = (chat_id, seq)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = content
+            self._chat_keys.setdefault(chat_id, set()).add(seq)
+            self.size += cost
+            while self.size > self.max_bytes:
+                (old_chat, old_seq), old_content = self._entries.popitem(last=False)
+                self.size -= len(old_content.encode("utf-8"))
+                seqs = self._chat_keys.get(old_chat)
+                if seqs is not None:
+                    seqs.discard(old_seq)
+                    if not seqs:
+                        del self._chat_keys[old_chat]
+
+    def invalidate(self, chat_id):
+        with self._lock:
+            for seq in self._chat_keys.pop(chat_id, ()):
+                content = self._entries.pop((chat_id, seq), None)
+                if content is not None:
+                    self.size -= len(content.encode("utf-8"))
+
+
+message_cache = DecryptedMessageCache()
+
+
 class ChatDatabase:
-    def __init__(self):
+    """Chats and their messages.
+
+    A chat document holds the title, counters and summary. Its messages
+    live in the `messages` collection, in buckets of MESSAGE_BUCKET_SIZE
+    per chat keyed by (chat_id, seq), so appends and tail reads touch one
+    or two small documents however long the chat gets. Chats written by
+    older versions keep their messages in the chat document until
+    migrate_buckets.py moves them; reads merge both layouts meanwhile.
+    """
+
+    def __init__(self, client=None, annotator=None):
         try:
-            self.client = MongoClient(os.getenv("MONGODB_URI"))
+            self.client = client or MongoClient(os.getenv("MONGODB_URI"))
+            self.annotator = annotator or MessageAnnotator()
             self.db = self.client["medbot"]
             self.chats = self.db["chats"]
-            self.analytics = self.db["analytics"]  
+            self.messages = self.db["messages"]
+            self.analytics = self.db["analytics"]
+            self.rollups = AnalyticsRollups(self.db["analytics_rollups"])
+            self.analytics_buffer = AnalyticsBuffer(self.analytics, self.rollups.collection)
+            self.chats.create_index([("user_id", 1), ("updated_at", -1), ("_id", -1)])
+            self.messages.create_index([("chat_id", 1), ("seq", 1)], unique=True)
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
             raise
@@ -22,24 +258,26 @@ class ChatDatabase:
         try:
             chat_id = str(ObjectId())
             anonymous_id = generate_anonymous_id(chat_id)
+            now = datetime.now()
             chat_doc = {
                 "_id": ObjectId(chat_id),
                 "user_id": user_id,
                 "anonymous_id": anonymous_id,
                 "title": "New Chat",
-                "created_at": datetime.now(),
-                "updated_at": datetime.now(),
-                "messages": []
+                "created_at": now,
+                "updated_at": now,
+                "message_count": 0
             }
         
             self.chats.insert_one(chat_doc)
             self.analytics.insert_one({
                 "anonymous_id": anonymous_id,
                 "user_id": user_id,
-                "created_at": anonymize_timestamp(datetime.now()),
+                "created_at": anonymize_timestamp(now),
                 "message_count": 0,
-                "last_activity": anonymize_timestamp(datetime.now())
+                "last_activity": anonymize_timestamp(now)
             })
+            self.analytics_buffer.record_session(anonymous_id, now)
             
             return chat_id
         except Exception as e:
@@ -47,104 +285,388 @@ class ChatDatabase:
             return None
     
     def add_message(self, chat_id, role, content):
+        return self.add_messages(chat_id, [(role, content)])
+
+    def add_messages(self, chat_id, messages, start_seq=None):
+        """Append (role, content) pairs to a chat in a single write.
+
+        The `message_count` high-water mark, the title and the other chat
+        fields are updated together with one aggregation-pipeline update that
+        also reserves the sequence numbers, then the messages are appended to
+        their bucket, usually a single document. When `start_seq` is given the
+        write only applies if the chat still holds exactly that many messages.
+
+        User messages are annotated with their mood on the way in and queued
+        for sentiment labelling in the background. The chat keeps
+        `latest_mood`, `latest_sentiment` and running `sentiment` counts, so
+        readers never rescan the history.
+        """
         try:
-            encrypted_content = encrypt_message(content)
-            chat = self.chats.find_one({"_id": ObjectId(chat_id)})
-            anonymous_id = chat.get("anonymous_id")
-            message = {
+            if not messages:
+                return True
+            with span("persist"):
+                return self._push_messages(chat_id, messages, start_seq)
+        except Exception as e:
+            print(f"Error adding messages: {e}")
+            return False
+
+    def append_messages(self, chat_id, messages, start_seq):
+        """Append only messages not yet stored, using message_count as high-water mark.
+
+        `start_seq` is the number of messages the caller believes are already
+        persisted. The write is guarded on it, so a retried call never stores
+        the same message twice. Each message is stored with its `id`, which
+        is generated and set on the message dict when missing; a retry only
+        counts messages already stored under the same ids as its own. When
+        another session wrote those seqs instead, nothing is written and
+        False is returned, so the caller can reload the chat.
+        """
+        try:
+            ids = [msg.setdefault("id", uuid.uuid4().hex) for msg in messages]
+            messages = [(msg["role"], msg["content"]) for msg in messages]
+            if not messages:
+                return True
+            for _ in range(2):
+                with span("persist"):
+                    if self._push_messages(chat_id, messages, start_seq, ids):
+                        return True
+                chat = self.chats.find_one(
+                    {"_id": ObjectId(chat_id)},
+                    {"message_count": 1}
+                )
+                if not chat:
+                    return False
+                stored = chat.get("message_count")
+                if stored is None:
+                    stored = self._inline_count(chat["_id"])
+                if not start_seq < stored <= start_seq + len(messages):
+                    print(f"Message sequence mismatch for chat {chat_id}: stored {stored}, expected {start_seq}")
+                    return False
+                # A previous attempt may have stored part of this batch; check it was this one
+                stored_ids = self._stored_ids(chat_id, start_seq, stored)
+                if any(stored_ids.get(start_seq + i, own) != own for i, own in enumerate(ids[:stored - start_seq])):
+                    print(f"Messages {start_seq}-{stored - 1} of chat {chat_id} were written by another session")
+                    return False
+                for seq in range(start_seq, stored):
+                    if seq not in stored_ids:
+                        # The sequence numbers were reserved but the messages did not make it
+                        i = seq - start_seq
+                        self._write_messages(chat_id, seq, messages[i:i + 1], ids[i:i + 1])
+                if stored == start_seq + len(messages):
+                    return True
+                # Only send the rest
+                messages, ids = messages[stored - start_seq:], ids[stored - start_seq:]
+                start_seq = stored
+            return False
+        except Exception as e:
+            print(f"Error appending messages: {e}")
+            return False
+
+    def _message_docs(self, messages, first_seq, now, ids=None):
+        encrypted = get_cipher().encrypt_many(content for _, content in messages)
+        with span("annotate"):
+            annotations = self.annotator.annotate(messages)
+        docs = []
+        for i, ((role, _), encrypted_content, annotation) in enumerate(zip(messages, encrypted, annotations)):
+            doc = {
+                "seq": first_seq + i,
                 "role": role,
                 "content": encrypted_content,
-                "timestamp": datetime.now()
+                "timestamp": now
             }
-        
+            if ids:
+                doc["id"] = ids[i]
+            if annotation:
+                doc["ann"] = annotation
+            docs.append(doc)
+        return docs
+
+    def _write_messages(self, chat_id, first_seq, messages, ids=None):
+        now = datetime.now()
+        docs = self._message_docs(messages, first_seq, now, ids)
+        write_buckets(self.messages, ObjectId(chat_id), docs)
+        self._label_sentiments(chat_id, messages, docs, now)
+
+    def _label_sentiments(self, chat_id, messages, docs, now):
+        self.annotator.label_later(
+            [(doc["seq"], content) for (role, content), doc in zip(messages, docs) if role == "user"],
+            lambda seq, code: self._store_sentiment(chat_id, seq, code, now)
+        )
+
+    def _store_sentiment(self, chat_id, seq, code, when):
+        """Record the sentiment of a stored user message, from the annotator's background threads."""
+        chat_oid = ObjectId(chat_id)
+        key = SENTIMENT_KEYS[code]
+        self.messages.update_one(
+            {"chat_id": chat_oid, "seq": bucket_start(seq), "messages.seq": seq},
+            {"$set": {"messages.$.ann.s": code}}
+        )
+        if not self.chats.update_one({"_id": chat_oid}, {"$inc": {f"sentiment.{key}": 1}}).matched_count:
+            return
+        # Labels can finish out of order; only a later message replaces latest_sentiment
+        self.chats.update_one(
+            {"_id": chat_oid, "latest_sentiment_seq": {"$not": {"$gt": seq}}},
+            {"$set": {"latest_sentiment": code, "latest_sentiment_seq": seq}}
+        )
+        self.analytics_buffer.record(generate_anonymous_id(chat_id), 0, when, {key: 1})
+
+    def _inline_count(self, chat_oid):
+        """Length of a chat's inline array, which is its message count until it has a message_count."""
+        for chat in self.chats.aggregate([
+            {"$match": {"_id": chat_oid}},
+            {"$project": {"count": {"$size": {"$ifNull": ["$messages", []]}}}}
+        ]):
+            return chat["count"]
+        return 0
+
+    def _stored_ids(self, chat_id, low, high):
+        """Ids of the stored messages with low <= seq < high, by seq; seqs not written yet are left out."""
+        ids = {}
+        for bucket in self.messages.find(
+            {"chat_id": ObjectId(chat_id), "seq": {"$gte": bucket_start(low), "$lt": high}},
+            {"messages.seq": 1, "messages.id": 1}
+        ):
+            for msg in bucket["messages"]:
+                if low <= msg["seq"] < high:
+                    ids[msg["seq"]] = msg.get("id")
+        return ids
+
+    def _push_messages(self, chat_id, messages, start_seq=None, ids=None):
+        now = datetime.now()
+        title = None
+        latest_mood = None
+        mood_counts = {}
+        docs = self._message_docs(messages, 0, now, ids)
+        for (role, content), doc in zip(messages, docs):
+            annotation = doc.get("ann")
+            if annotation:
+                latest_mood = annotation["m"]
+                mood_counts[latest_mood] = mood_counts.get(latest_mood, 0) + 1
+            if role == "user" and title is None:
+                title = content[:40] + "..." if len(content) > 40 else content
+
+        fields = {
+            "message_count": {"$add": [STORED_COUNT, len(docs)]},
+            "updated_at": now
+        }
+        if title:
+            fields["title"] = {"$cond": [
+                {"$eq": [{"$ifNull": ["$title", "New Chat"]}, "New Chat"]},
+                {"$literal": title},
+                "$title"
+            ]}
+        if latest_mood:
+            fields["latest_mood"] = {"$literal": latest_mood}
+
+        query = {"_id": ObjectId(chat_id)}
+        if start_seq is not None:
+            query["$expr"] = {"$eq": [STORED_COUNT, start_seq]}
+        chat = self.chats.find_one_and_update(
+            query,
+            [{"$set": fields}],
+            projection={"message_count": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if chat is None:
+            return False
+        first_seq = chat.get("message_count")
+        if first_seq is None:
+            first_seq = start_seq if start_seq is not None else self._inline_count(query["_id"])
+        for doc in docs:
+            doc["seq"] += first_seq
+        write_buckets(self.messages, query["_id"], docs)
+        self.analytics_buffer.record(generate_anonymous_id(chat_id), len(docs), now, moods=mood_counts)
+        self._label_sentiments(chat_id, messages, docs, now)
+        return True
+
+    def get_chat_history(self, chat_id, limit=None, before=None):
+        """Return decrypted messages of a chat, oldest first.
+
+        With `limit`, only the last `limit` messages are fetched, or the
+        `limit` messages preceding sequence number `before` when paging back.
+        Decrypted contents are served from the process-wide message cache.
+        """
+        try:
+            chat = self._find_history(chat_id, limit, before)
+            return chat["messages"] if chat else []
+        except Exception as e:
+            print(f"Error getting chat history: {e}")
+            return []
+
+    def get_conversation_context(self, chat_id, limit):
+        """The last `limit` messages plus the rolling summary of older ones, in one read."""
+        try:
+            chat = self._find_history(chat_id, limit, None, {"summary": 1, "summary_upto": 1})
+            if not chat:
+                return {"summary": "", "summary_upto": 0, "messages": []}
+            return {
+                "summary": decrypt_message(chat["summary"]) if chat.get("summary") else "",
+                "summary_upto": chat.get("summary_upto", 0),
+                "messages": chat["messages"]
+            }
+        except Exception as e:
+            print(f"Error getting conversation context: {e}")
+            return {"summary": "", "summary_upto": 0, "messages": []}
+
+    def update_conversation_summary(self, chat_id, summary, summary_upto):
+        """Store a newer rolling summary; never replaces one that covers more messages."""
+        try:
             self.chats.update_one(
-                {"_id": ObjectId(chat_id)},
-                {
-                    "$push": {"messages": message},
-                    "$set": {
-                        "updated_at": datetime.now(),
-                        "title": content[:40] + "..." if role == "user" and len(content) > 40 else chat.get("title", "New Chat")
-                    }
-                }
-            )
-            
-            self.analytics.update_one(
-                {"anonymous_id": anonymous_id},
                 {
-                    "$inc": {"message_count": 1},
-                    "$set": {"last_activity": anonymize_timestamp(datetime.now())}
-                }
+                    "_id": ObjectId(chat_id),
+                    "$or": [
+                        {"summary_upto": {"$lt": summary_upto}},
+                        {"summary_upto": {"$exists": False}}
+                    ]
+                },
+                {"$set": {"summary": encrypt_message(summary), "summary_upto": summary_upto}}
             )
-            
             return True
         except Exception as e:
-            print(f"Error adding message: {e}")
+            print(f"Error updating conversation summary: {e}")
             return False
-    
-    def get_chat_history(self, chat_id):
-        try:
-            chat = self.chats.find_one({"_id": ObjectId(chat_id)})
-            if chat and "messages" in chat:
-                decrypted_messages = []
-                for msg in chat["messages"]:
-                    try:
-                        decrypted_content = decrypt_message(msg["content"])
-                        decrypted_messages.append({
-                            "role": msg["role"],
-                            "content": decrypted_content,
-                            "timestamp": msg["timestamp"].strftime("%Y-%m-%d %H:%M") if "timestamp" in msg else None
-                        })
-                    except Exception as e:
-                        print(f"Error decrypting message: {e}")
-                        decrypted_messages.append({
-                            "role": msg["role"],
-                            "content": msg["content"],
-                            "timestamp": msg["timestamp"].strftime("%Y-%m-%d %H:%M") if "timestamp" in msg else None
-                        })
-                return decrypted_messages
-            return []
-        except Exception as e:
-            print(f"Error getting chat history: {e}")
-            return []
-    
-    def get_all_chats(self, user_id):
+
+    def _find_history(self, chat_id, limit, before, extra_fields=None):
+        # Chats not yet moved to buckets still hold their older messages inline
+        if before is not None:
+            skip = max(0, before - (limit or before))
+            if before - skip <= 0:
+                return {"messages": []}
+            projection = {"messages": {"$slice": [skip, before - skip]}, "message_count": 1}
+        elif limit:
+            projection = {"messages": {"$slice": -limit}, "message_count": 1}
+        else:
+            projection = {"messages": 1, "message_count": 1}
+        projection.update(extra_fields or {})
+        with span("history_load"):
+            chat = self.chats.find_one({"_id": ObjectId(chat_id)}, projection)
+            if not chat:
+                return None
+            # Unmigrated inline messages are always the oldest ones, seq 0 up to the inline length
+            inline = chat.get("messages", [])
+            count = chat.get("message_count")
+            if before is not None:
+                low, high, first_inline = skip, before if count is None else min(before, count), skip
+            else:
+                first_inline = 0
+                if limit and len(inline) == limit:
+                    # The slice may have cut the inline array short; its full length says where it starts
+                    first_inline = self._inline_count(chat["_id"]) - limit
+                if count is None:
+                    # Chats no write has reached since message_count was added have nothing in buckets
+                    count = first_inline + len(inline)
+                low, high = max(0, count - limit) if limit else 0, count
+            messages = self._merge_buckets(chat["_id"], inline, first_inline, low, high)
+        chat["messages"] = self._decrypt_history(chat_id, messages)
+        return chat
+
+    def _merge_buckets(self, chat_oid, inline, first_inline, low, high):
+        """Stored messages with low <= seq < high, from the inline array and the buckets, by seq."""
+        by_seq = {}
+        for i, msg in enumerate(inline):
+            seq = msg.get("seq", first_inline + i)
+            if low <= seq < high:
+                by_seq[seq] = dict(msg, seq=seq)
+        if high > low:
+            for bucket in self.messages.find(
+                {"chat_id": chat_oid, "seq": {"$gte": bucket_start(low), "$lt": high}},
+                {"messages": 1}
+            ).sort("seq", 1):
+                for msg in bucket["messages"]:
+                    if low <= msg["seq"] < high:
+                        by_seq[msg["seq"]] = msg
+        return [by_seq[seq] for seq in sorted(by_seq)]
+
+    def _decrypt_history(self, chat_id, messages):
+        contents = [message_cache.get(chat_id, msg["seq"]) for msg in messages]
+        missing = [i for i, content in enumerate(contents) if content is None]
+        decrypted = get_cipher().decrypt_many(messages[i]["content"] for i in missing)
+        for i, content in zip(missing, decrypted):
+            contents[i] = content
+            if content != messages[i]["content"]:
+                message_cache.put(chat_id, messages[i]["seq"], content)
+
+        decrypted_messages = []
+        for msg, content in zip(messages, contents):
+            annotation = msg.get("ann", {})
+            decrypted_messages.append({
+                "seq": msg["seq"],
+                "role": msg["role"],
+                "content": content,
+                "timestamp": msg["timestamp"].strftime("%Y-%m-%d %H:%M") if "timestamp" in msg else None,
+                "mood": annotation.get("m"),
+                "sentiment": annotation.get("s")
+            })
+        return decrypted_messages
+
+    def get_chat_summaries(self, user_id, limit=20, cursor=None):
+        """Return one page of sidebar entries, newest first, and the cursor for the next page.
+
+        Only `_id`, `title`, `updated_at`, `message_count` and the write-time
+        mood and sentiment fields are read, served by the (user_id, updated_at, _id) index. `cursor` is the opaque value
+        returned with the previous page, or None for the first page.
+        """
         try:
-            chats = list(self.chats.find(
-                {"user_id": user_id}
-            ).sort([("updated_at", -1), ("created_at", -1)]))
-            
+            query = {"user_id": user_id}
+            if cursor:
+                updated_at, last_id = cursor.split("|")
+                updated_at = datetime.fromisoformat(updated_at)
+                query["$or"] = [
+                    {"updated_at": {"$lt": updated_at}},
+                    {"updated_at": updated_at, "_id": {"$lt": ObjectId(last_id)}}
+                ]
+            found = self.chats.find(
+                query,
+                {"title": 1, "updated_at": 1, "message_count": 1,
+                 "latest_mood": 1, "latest_sentiment": 1, "sentiment": 1}
+            ).sort([("updated_at", -1), ("_id", -1)])
+            if limit:
+                found = found.limit(limit + 1)
+            chats = list(found)
+
+            next_cursor = None
+            if limit and len(chats) > limit:
+                chats = chats[:limit]
+                last = chats[-1]
+                next_cursor = f"{last['updated_at'].isoformat()}|{last['_id']}"
+
             for chat in chats:
                 chat["_id"] = str(chat["_id"])
-                if "messages" in chat and chat["messages"]:
-                    user_messages = [msg for msg in chat["messages"] if msg["role"] == "user"]
-                    if user_messages:
-                        first_msg = user_messages[0]
-                        try:
-                            decrypted_content = decrypt_message(first_msg["content"])
-                            chat["title"] = decrypted_content[:40] + "..." if len(decrypted_content) > 40 else decrypted_content
-                        except:
-                            chat["title"] = "New Chat"
-                    else:
-                        chat["title"] = "New Chat"
-                else:
-                    chat["title"] = "New Chat"
-                chat["message_count"] = len(chat.get("messages", []))
-                if "created_at" in chat:
-                    chat["created_at"] = chat["created_at"].strftime("%Y-%m-%d %H:%M")
+                chat["title"] = chat.get("title") or "New Chat"
+                chat["message_count"] = chat.get("message_count", 0)
+                chat["latest_mood"] = chat.get("latest_mood")
+                chat["latest_sentiment"] = chat.get("latest_sentiment")
+                chat["sentiment"] = {key: chat.get("sentiment", {}).get(key, 0) for key in SENTIMENT_KEYS.values()}
                 if "updated_at" in chat:
                     chat["updated_at"] = chat["updated_at"].strftime("%Y-%m-%d %H:%M")
-            
-            return chats
+            return chats, next_cursor
         except Exception as e:
-            print(f"Error getting all chats: {e}")
-            return []
-    
+            print(f"Error getting chat summaries: {e}")
+            return [], None
+
+    def get_all_chats(self, user_id):
+        chats, _ = self.get_chat_summaries(user_id, limit=None)
+        return chats
+
+    def get_analytics_series(self, granularity="day", start=None, end=None):
+        """Dashboard series of sessions, messages, sentiment and moods across all chats; see AnalyticsRollups.series."""
+        try:
+            self.analytics_buffer.flush()
+            return self.rollups.series(granularity, start, end)
+        except Exception as e:
+            print(f"Error getting analytics series: {e}")
+            return None
+
     def delete_chat(self, chat_id):
         try:
-            chat = self.chats.find_one({"_id": ObjectId(chat_id)})
+            chat = self.chats.find_one({"_id": ObjectId(chat_id)}, {"anonymous_id": 1})
             anonymous_id = chat.get("anonymous_id")
+            self.analytics_buffer.discard(anonymous_id)
+            message_cache.invalidate(chat_id)
             self.chats.delete_one({"_id": ObjectId(chat_id)})
+            self.messages.delete_many({"chat_id": ObjectId(chat_id)})
             self.analytics.delete_one({"anonymous_id": anonymous_id})
+            self.rollups.forget(anonymous_id)
             
             return True
         except Exception as e:
@@ -5,7 +5,10 @@ from dotenv import load_dotenv
 import base64
 import hashlib
 from datetime import datetime
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from metrics import span
 
 load_dotenv()
 
@@ -23,26 +26,194 @@ def get_encryption_key():
     # Convert hex string to bytes
     return bytes.fromhex(encryption_key)
 
-def encrypt_message(message):
-    try:
+# Records written in the GCM format start with this marker; legacy CBC records are bare base64
+GCM_PREFIX = "2:"
+# Keyed envelope: "3:<key id>:" + base64(nonce + tag + ciphertext), AES-GCM with that key
+ENVELOPE_PREFIX = "3:"
+# Key id under which ENCRYPTION_KEY is known; records without a key id were written with it
+LEGACY_KEY_ID = "legacy"
+# Format for new records: "cbc" (legacy), "gcm" (authenticated) or "envelope" (authenticated, with key id).
+# Defaults to "envelope" once a keyring is configured through ENCRYPTION_KEYS.
+ENCRYPTION_FORMAT = os.getenv("ENCRYPTION_FORMAT", "envelope" if os.getenv("ENCRYPTION_KEYS") else "cbc").lower()
+# Threads used by encrypt_many/decrypt_many for large batches. pycryptodome releases the
+# GIL inside AES, but for chat-sized messages the Python overhead dominates, so this only
+# pays off for long messages on multi-core hosts (see `benchmarks.py crypto`).
+ENCRYPTION_WORKERS = int(os.getenv("ENCRYPTION_WORKERS", "1"))
+PARALLEL_BATCH_SIZE = 256
+
+_executor = None
+_executor_lock = threading.Lock()
+_default_cipher = None
+
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cipher")
+        return _executor
+
+
+class KeyRing:
+    """Encryption keys by id, one of which is active for new records.
+
+    Configured with ENCRYPTION_KEYS="id1:hex,id2:hex" and
+    ENCRYPTION_ACTIVE_KEY_ID. ENCRYPTION_KEY is always present as
+    LEGACY_KEY_ID so records written before key ids existed still decrypt.
+    """
+
+    def __init__(self, keys, active_id):
+        for key_id, key in keys.items():
+            if not key_id or ":" in key_id:
+                raise ValueError(f"Invalid encryption key id: {key_id!r}")
+            if len(key) != 32:
+                raise ValueError(f"Encryption key {key_id!r} must be 32 bytes")
+        if active_id not in keys:
+            raise ValueError(f"Active encryption key id {active_id!r} is not in the keyring")
+        self.keys = dict(keys)
+        self.active_id = active_id
+
+    @classmethod
+    def from_env(cls):
+        keys = {LEGACY_KEY_ID: get_encryption_key()}
+        active_id = LEGACY_KEY_ID
+        for entry in filter(None, (e.strip() for e in os.getenv("ENCRYPTION_KEYS", "").split(","))):
+            key_id, _, hex_key = entry.partition(":")
+            if len(hex_key) != 64:
+                raise ValueError(f"Encryption key {key_id!r} must be 64 characters long")
+            keys[key_id] = bytes.fromhex(hex_key)
+            active_id = key_id
+        return cls(keys, os.getenv("ENCRYPTION_ACTIVE_KEY_ID", active_id))
+
+    @property
+    def active_key(self):
+        return self.keys[self.active_id]
+
+    def key(self, key_id):
+        try:
+            return self.keys[key_id]
+        except KeyError:
+            raise ValueError(f"Unknown encryption key id: {key_id!r}")
+
+
+def key_id_of(encrypted_message):
+    """Id of the key a record was written with."""
+    if encrypted_message.startswith(ENVELOPE_PREFIX):
+        return encrypted_message[len(ENVELOPE_PREFIX):].split(":", 1)[0]
+    return LEGACY_KEY_ID
+
+
+class MessageCipher:
+    """AES message encryption with keys parsed once.
+
+    Writes one of three formats:
+    - "cbc": the legacy format, base64(iv + ciphertext), with ENCRYPTION_KEY
+    - "gcm": "2:" + base64(nonce + tag + ciphertext), with ENCRYPTION_KEY
+    - "envelope": "3:<key id>:" + base64(nonce + tag + ciphertext), with the
+      keyring's active key
+
+    Decryption accepts all three, so existing records keep working after
+    switching formats or rotating keys.
+    """
+
+    def __init__(self, keyring, fmt=ENCRYPTION_FORMAT, workers=ENCRYPTION_WORKERS):
+        if isinstance(keyring, bytes):
+            keyring = KeyRing({LEGACY_KEY_ID: keyring}, LEGACY_KEY_ID)
+        if fmt not in ("cbc", "gcm", "envelope"):
+            raise ValueError(f"Unknown encryption format: {fmt}")
+        self.keyring = keyring
+        self.key = keyring.key(LEGACY_KEY_ID) if LEGACY_KEY_ID in keyring.keys else keyring.active_key
+        self.format = fmt
+        self.workers = workers
+
+    @staticmethod
+    def _gcm_encrypt(key, message_bytes):
+        nonce = os.urandom(12)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        encrypted, tag = cipher.encrypt_and_digest(message_bytes)
+        return base64.b64encode(nonce + tag + encrypted).decode('utf-8')
+
+    @staticmethod
+    def _gcm_decrypt(key, payload):
+        combined = base64.b64decode(payload)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=combined[:12])
+        return cipher.decrypt_and_verify(combined[28:], combined[12:28]).decode('utf-8')
+
+    def encrypt(self, message):
         message_bytes = message.encode('utf-8')
+        if self.format == "envelope":
+            key_id = self.keyring.active_id
+            return f"{ENVELOPE_PREFIX}{key_id}:" + self._gcm_encrypt(self.keyring.active_key, message_bytes)
+        if self.format == "gcm":
+            return GCM_PREFIX + self._gcm_encrypt(self.key, message_bytes)
         iv = os.urandom(16)
-        cipher = AES.new(get_encryption_key(), AES.MODE_CBC, iv)
+        cipher = AES.new(self.key, AES.MODE_CBC, iv)
         encrypted = cipher.encrypt(pad(message_bytes, AES.block_size))
-        combined = iv + encrypted
-        return base64.b64encode(combined).decode('utf-8')
+        return base64.b64encode(iv + encrypted).decode('utf-8')
+
+    def decrypt(self, encrypted_message):
+        if encrypted_message.startswith(ENVELOPE_PREFIX):
+            key_id, _, payload = encrypted_message[len(ENVELOPE_PREFIX):].partition(":")
+            return self._gcm_decrypt(self.keyring.key(key_id), payload)
+        if encrypted_message.startswith(GCM_PREFIX):
+            return self._gcm_decrypt(self.key, encrypted_message[len(GCM_PREFIX):])
+        combined = base64.b64decode(encrypted_message)
+        cipher = AES.new(self.key, AES.MODE_CBC, combined[:16])
+        return unpad(cipher.decrypt(combined[16:]), AES.block_size).decode('utf-8')
+
+    def is_current(self, encrypted_message):
+        """Whether a record is already in the format and key this cipher writes."""
+        if self.format == "envelope":
+            return (
+                encrypted_message.startswith(ENVELOPE_PREFIX)
+                and key_id_of(encrypted_message) == self.keyring.active_id
+            )
+        if self.format == "gcm":
+            return encrypted_message.startswith(GCM_PREFIX)
+        return not encrypted_message.startswith((GCM_PREFIX, ENVELOPE_PREFIX))
+
+    def _map(self, func, items):
+        items = list(items)
+        if self.workers > 1 and len(items) >= PARALLEL_BATCH_SIZE:
+            chunk = -(-len(items) // self.workers)
+            return list(_get_executor(self.workers).map(func, items, chunksize=chunk))
+        return [func(item) for item in items]
+
+    def encrypt_many(self, messages):
+        with span("encrypt"):
+            return self._map(self.encrypt, messages)
+
+    def decrypt_many(self, encrypted_messages):
+        """Decrypt a batch; records that fail to decrypt are returned unchanged, as decrypt_message does."""
+        with span("decrypt"):
+            return self._map(self._decrypt_or_passthrough, encrypted_messages)
+
+    def _decrypt_or_passthrough(self, encrypted_message):
+        try:
+            return self.decrypt(encrypted_message)
+        except Exception as e:
+            print(f"Decryption error: {str(e)}")
+            return encrypted_message
+
+
+def get_cipher():
+    """The process-wide cipher for the configured keyring, built on first use."""
+    global _default_cipher
+    if _default_cipher is None:
+        _default_cipher = MessageCipher(KeyRing.from_env())
+    return _default_cipher
+
+
+def encrypt_message(message):
+    try:
+        return get_cipher().encrypt(message)
     except Exception as e:
         print(f"Encryption error: {str(e)}")
         return message
 
 def decrypt_message(encrypted_message):
     try:
-        combined = base64.b64decode(encrypted_message)
-        iv = combined[:16]
-        encrypted = combined[16:]
-        cipher = AES.new(get_encryption_key(), AES.MODE_CBC, iv)
-        decrypted = unpad(cipher.decrypt(encrypted), AES.block_size)
-        return decrypted.decode('utf-8')
+        return get_cipher().decrypt(encrypted_message)
     except Exception as e:
         print(f"Decryption error: {str(e)}")
         return encrypted_message
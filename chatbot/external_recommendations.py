@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RECOMMENDATIONS_API_URL = os.getenv(
+    "RECOMMENDATIONS_FETCH_URL",
+    'https://magicloops.dev/api/loop/358a84e8-378e-47b3-9af1-9a658bbf97d4/run'
+)
+EXTERNAL_RECS_CONNECT_TIMEOUT = float(os.getenv("EXTERNAL_RECS_CONNECT_TIMEOUT", "2"))
+EXTERNAL_RECS_READ_TIMEOUT = float(os.getenv("EXTERNAL_RECS_READ_TIMEOUT", "5"))
+EXTERNAL_RECS_TTL = float(os.getenv("EXTERNAL_RECS_TTL", str(6 * 3600)))
+# Directory for the disk tier of the cache; memory only when unset
+EXTERNAL_RECS_CACHE_DIR = os.getenv("EXTERNAL_RECS_CACHE_DIR")
+EXTERNAL_RECS_FAILURE_THRESHOLD = int(os.getenv("EXTERNAL_RECS_FAILURE_THRESHOLD", "3"))
+EXTERNAL_RECS_RESET_TIMEOUT = float(os.getenv("EXTERNAL_RECS_RESET_TIMEOUT", "30"))
+EXTERNAL_RECS_LIMIT = 3
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream for `reset_timeout` seconds.
+
+    Opens after `failure_threshold` consecutive failures. Once the timeout
+    has passed a single trial call is let through; its outcome closes the
+    breaker again or restarts the timeout.
+    """
+
+    def __init__(self, failure_threshold=EXTERNAL_RECS_FAILURE_THRESHOLD, reset_timeout=EXTERNAL_RECS_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def _limit(recommendations):
+    return {
+        key: value[:EXTERNAL_RECS_LIMIT] if isinstance(value, list) else value
+        for key, value in recommendations.items()
+    }
+
+
+class ExternalRecommendationClient:
+    """Videos and podcasts per mood from the recommendation API, without blocking the UI.
+
+    Results are cached per mood for `ttl` seconds in memory and, with
+    `cache_dir`, on disk so they survive restarts. Stale entries are served
+    as they are while a background thread refreshes them. A mood seen for
+    the first time is answered from `local_recommendations` while it is
+    fetched in the background; only moods with no local entry wait for the
+    API, bounded by the connect and read timeouts. Calls go through one
+    pooled session and a circuit breaker, so an unreachable API costs
+    nothing after a few failures.
+    """
+
+    def __init__(self, url=RECOMMENDATIONS_API_URL, local_recommendations=None, ttl=EXTERNAL_RECS_TTL,
+                 cache_dir=EXTERNAL_RECS_CACHE_DIR, connect_timeout=EXTERNAL_RECS_CONNECT_TIMEOUT,
+                 read_timeout=EXTERNAL_RECS_READ_TIMEOUT, breaker=None, session=None):
+        self.url = url
+        self.local_recommendations = local_recommendations or {}
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = session or self._create_session()
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recommendations-refresh")
+        self.hits = 0
+        self.stale_hits = 0
+        self.fallbacks = 0
+        self.fetches = 0
+        self.errors = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _create_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _disk_path(self, mood):
+        return os.path.join(self.cache_dir, hashlib.sha256(mood.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def _read_disk(self, mood):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(mood), "r") as f:
+                entry = json.load(f)
+            return entry["fetched_at"], entry["recommendations"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, mood, fetched_at, recommendations):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(mood)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"mood": mood, "fetched_at": fetched_at, "recommendations": recommendations}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing recommendation cache: {e}")
+
+    def _cached(self, mood):
+        with self._lock:
+            entry = self._cache.get(mood)
+        if entry is None:
+            entry = self._read_disk(mood)
+            if entry is not None:
+                with self._lock:
+                    self._cache[mood] = entry
+        return entry
+
+    def fetch(self, mood):
+        """Call the API for one mood and cache the result. Returns None on failure or an open breaker."""
+        if not self.breaker.allow():
+            return None
+        try:
+            self.fetches += 1
+            response = self.session.get(self.url, json={"mood": mood}, timeout=self.timeout)
+            response.raise_for_status()
+            recommendations = response.json()
+            if not isinstance(recommendations, dict) or not recommendations or "error" in recommendations:
+                raise ValueError(f"Unexpected response: {str(recommendations)[:200]}")
+        except Exception as e:
+            print(f"API error: {e}")
+            self.errors += 1
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        recommendations = _limit(recommendations)
+        fetched_at = time.time()
+        with self._lock:
+            self._cache[mood] = (fetched_at, recommendations)
+        self._write_disk(mood, fetched_at, recommendations)
+        return recommendations
+
+    def _refresh_in_background(self, mood):
+        with self._lock:
+            if mood in self._refreshing:
+                return
+            self._refreshing.add(mood)
+
+        def refresh():
+            try:
+                self.fetch(mood)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(mood)
+        self._executor.submit(refresh)
+
+    def get(self, mood):
+        mood = mood.lower()
+        entry = self._cached(mood)
+        if entry is not None:
+            fetched_at, recommendations = entry
+            if time.time() - fetched_at < self.ttl:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._refresh_in_background(mood)
+            return recommendations
+        local = self.local_recommendations.get(mood)
+        if local:
+            self.fallbacks += 1
+            self._refresh_in_background(mood)
+            return local
+        recommendations = self.fetch(mood)
+        if recommendations is None:
+            self.fallbacks += 1
+            return {"videos": [], "podcasts": []}
+        return recommendations
+
+    def stats(self):
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "fallbacks": self.fallbacks,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "breaker": self.breaker.state,
+        }
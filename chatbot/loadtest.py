@@ -0,0 +1,309 @@
+"""Headless load test of the chat turn, for sizing Streamlit replicas.
+
+Simulates `--users` concurrent users, one thread each as Streamlit runs
+sessions, without the UI. Every user opens a chat and replays a
+conversation script built from mental_health_chatbot_interactions.csv through
+the same calls a page run makes: chat_turn.process_user_input, ChatBot and
+ChatDatabase. With --stream, replies go through chat_turn.stream_user_input
+and AsyncChatBot on the shared event loop, under a RequestScheduler, as
+main.stream_async_reply does. Replies come from a local FakeLLMServer with
+the given latency, and storage is a local mongod when MONGODB_URI is set,
+mongomock otherwise:
+
+    python loadtest.py --users 50 --turns 10 --llm-latency 0.5 --think-time 2
+
+Reports throughput, turn latency percentiles, Mongo operations per turn and
+RSS growth. With mongomock the stored chats live in this process, so RSS
+growth includes them; use a local mongod to see the app's own growth.
+Sentiment labelling of stored messages follows SENTIMENT_ON_WRITE unless
+--sentiment-on-write says otherwise; it loads the transformer model.
+"""
+import argparse
+import csv
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import chat_turn
+import metrics
+import shared
+from annotations import SENTIMENT_ON_WRITE
+from benchmarks import current_rss_mb, make_counting_db, make_mongo_client, percentile
+from scheduler import LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, RequestScheduler
+
+CHAT_PAGE_SIZE = 20
+CHAT_HISTORY_PAGE_SIZE = 50
+
+# Openers and follow-ups stay clear of the recommendation intent phrases in moods.json, so they reach the LLM
+OPENERS = (
+    "I've been feeling {mood} lately and I don't really know why.",
+    "The last few days have been hard, there is a lot of {mood} and I can't switch off at night.",
+    "Honestly I'm struggling with {mood} again and it is affecting my work.",
+)
+RECOMMENDATION_REQUESTS = (
+    "Can you suggest something for {mood}?",
+    "Any tips for dealing with {mood}?",
+    "How do I cope with {mood} when it gets bad?",
+)
+FOLLOW_UPS = (
+    "I tried the {exercise} yesterday. {step} It was harder than I expected.",
+    "What is the point of the {exercise}? {step}",
+    "Thanks, that makes sense. I think the {mood} gets worse when I'm tired.",
+    "I talked to a friend about it and felt a bit better, but the {mood} came back in the evening.",
+)
+
+
+def load_dataset(path=shared.DATASET_PATH):
+    """Exercises per mood from the interactions dataset."""
+    exercises = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row.get("mood") and row.get("exercise"):
+                exercises.setdefault(row["mood"].strip(), []).append(row["exercise"].strip())
+    return exercises
+
+
+def build_script(exercises, turns, rng, recommendation_share=0.25):
+    """The user messages of one conversation about a single mood."""
+    mood = rng.choice(sorted(exercises))
+    script = [rng.choice(OPENERS).format(mood=mood)]
+    while len(script) < turns:
+        if rng.random() < recommendation_share:
+            script.append(rng.choice(RECOMMENDATION_REQUESTS).format(mood=mood))
+            continue
+        exercise = rng.choice(exercises[mood])
+        name, _, instructions = exercise.partition(":")
+        step = instructions.strip().split(". ")[0].rstrip(".") + "."
+        script.append(rng.choice(FOLLOW_UPS).format(mood=mood, exercise=name.strip(), step=step))
+    return script[:turns]
+
+
+class LoadTest:
+    """Runs the simulated users and collects per-turn measurements."""
+
+    def __init__(self, chatbot, scripts, think_time=0.0, ramp_up=0.0, stream_reply=None, seed=0):
+        self.chatbot = chatbot
+        self.scripts = scripts
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        # Called as stream_reply(chat_id, prompt), like main.stream_async_reply; None for blocking replies
+        self.stream_reply = stream_reply
+        self.seed = seed
+        self.turn_ms = {"llm": [], "recommendation": []}
+        self.first_token_ms = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def open_session(self, user):
+        """What a new session does before the first message: create a chat and load the sidebar and history."""
+        db = self.chatbot.db
+        user_id = f"loadtest_user_{user}"
+        chat_id = db.create_chat(user_id)
+        db.get_chat_summaries(user_id, limit=CHAT_PAGE_SIZE)
+        db.get_chat_history(chat_id, limit=CHAT_HISTORY_PAGE_SIZE)
+        return user_id, chat_id
+
+    def run_turn(self, user_id, chat_id, prompt, persisted):
+        db = self.chatbot.db
+        start = time.perf_counter()
+        first_token = None
+        with metrics.turn():
+            if self.stream_reply:
+                parts = []
+                for token in chat_turn.stream_user_input(self.chatbot, chat_id, prompt, self.stream_reply):
+                    if first_token is None:
+                        first_token = (time.perf_counter() - start) * 1000
+                    parts.append(token)
+                response = "".join(parts)
+            else:
+                response = chat_turn.process_user_input(self.chatbot, chat_id, prompt)
+            pair = [{"role": "user", "content": prompt}, {"role": "assistant", "content": response}]
+            if not db.append_messages(chat_id, pair, persisted):
+                raise RuntimeError(f"Messages of chat {chat_id} were not stored")
+            db.get_chat_summaries(user_id, limit=CHAT_PAGE_SIZE)
+        elapsed = (time.perf_counter() - start) * 1000
+        kind = "recommendation" if chat_turn.is_mood_message(prompt) else "llm"
+        with self._lock:
+            self.turn_ms[kind].append(elapsed)
+            if first_token is not None and kind == "llm":
+                self.first_token_ms.append(first_token)
+
+    def run_user(self, user, session):
+        user_id, chat_id = session
+        rng = random.Random(self.seed * 100003 + user)
+        if self.ramp_up:
+            time.sleep(self.ramp_up * user / len(self.scripts))
+        persisted = 0
+        for prompt in self.scripts[user]:
+            try:
+                self.run_turn(user_id, chat_id, prompt, persisted)
+                persisted += 2
+            except Exception as e:
+                print(f"Error in simulated turn: {e}")
+                with self._lock:
+                    self.errors += 1
+            if self.think_time:
+                time.sleep(rng.expovariate(1 / self.think_time))
+
+    def run(self, sessions):
+        with ThreadPoolExecutor(max_workers=len(sessions), thread_name_prefix="loadtest-user") as executor:
+            list(executor.map(self.run_user, range(len(sessions)), sessions))
+
+
+class RssSampler:
+    """Samples the process RSS in a background thread to catch the peak."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+def print_latency(name, samples):
+    if not samples:
+        return
+    print(
+        f"  {name:<22} n={len(samples):<6} p50 {percentile(samples, 50):8.1f}ms  "
+        f"p95 {percentile(samples, 95):8.1f}ms  p99 {percentile(samples, 99):8.1f}ms  max {max(samples):8.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=10, help="Messages sent by each user")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a user's turns")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which users start")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds before the fake LLM's first token")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="Seconds between further tokens")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of LLM calls answered with 429")
+    parser.add_argument("--recommendation-share", type=float, default=0.25,
+                        help="Fraction of later turns that ask for recommendations")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream replies through AsyncChatBot, as the UI does, and report first tokens")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_MAX_CONCURRENCY,
+                        help="Concurrent LLM calls allowed by the scheduler of streamed replies")
+    parser.add_argument("--llm-rpm", type=float, default=LLM_REQUESTS_PER_MINUTE,
+                        help="LLM calls per minute allowed by the scheduler of streamed replies")
+    parser.add_argument("--sentiment-on-write", choices=("true", "false"),
+                        default="true" if SENTIMENT_ON_WRITE else "false",
+                        help="Label the sentiment of stored messages (default: SENTIMENT_ON_WRITE)")
+    parser.add_argument("--trace", action="store_true", help="Also report per-stage latency")
+    parser.add_argument("--dataset", default=shared.DATASET_PATH, help="CSV the conversation scripts are drawn from")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import httpx
+    from openai import AsyncOpenAI
+    from annotations import MessageAnnotator
+    from async_chatbot import AsyncChatBot
+    from chatbot import ChatBot
+    from langchain.chat_models import ChatOpenAI
+    from stub_servers import FakeLLMServer
+
+    rng = random.Random(args.seed)
+    exercises = load_dataset(args.dataset)
+    scripts = [build_script(exercises, args.turns, rng, args.recommendation_share) for _ in range(args.users)]
+    client, backend = make_mongo_client()
+    counter = {}
+    metrics.enable_tracing(args.trace)
+
+    with FakeLLMServer(first_token_latency=args.llm_latency, token_interval=args.token_interval,
+                       error_rate=args.llm_error_rate, retry_after=0.05, seed=args.seed) as llm:
+        annotator = MessageAnnotator(sentiment=args.sentiment_on_write == "true")
+        chatbot = ChatBot(
+            llm=ChatOpenAI(base_url=llm.base_url, api_key="loadtest", model="fake-llm"),
+            db=make_counting_db(client, counter, annotator),
+            recommender=shared.get_recommender()
+        )
+        stream_reply = None
+        if args.stream:
+            # Built like shared's async client and scheduler, pointed at the fake LLM
+            http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+            async_chatbot = AsyncChatBot(
+                chatbot=chatbot,
+                client=AsyncOpenAI(base_url=llm.base_url, api_key="loadtest", max_retries=0, http_client=http_client),
+                scheduler=RequestScheduler(max_concurrency=args.llm_concurrency, requests_per_minute=args.llm_rpm),
+                model="fake-llm"
+            )
+
+            def stream_reply(chat_id, prompt):
+                return shared.iterate_async(async_chatbot.stream_bot_response(chat_id, prompt))
+        load = LoadTest(chatbot, scripts, think_time=args.think_time, ramp_up=args.ramp_up,
+                        stream_reply=stream_reply, seed=args.seed)
+
+        # One turn outside the measurement, so lazily built models and indexes are not counted
+        warm_user, warm_chat = load.open_session("warm_up")
+        load.run_turn(warm_user, warm_chat, RECOMMENDATION_REQUESTS[0].format(mood="stress"), 0)
+        load.run_turn(warm_user, warm_chat, OPENERS[0].format(mood="stress"), 2)
+        load.turn_ms = {"llm": [], "recommendation": []}
+        load.first_token_ms = []
+        annotator.join()
+        metrics.STAGE_LATENCY_MS.clear()
+
+        sessions = [load.open_session(user) for user in range(args.users)]
+        chatbot.db.analytics_buffer.flush()
+        counter.clear()
+        rss_start = current_rss_mb()
+        with RssSampler() as rss:
+            start = time.perf_counter()
+            load.run(sessions)
+            elapsed = time.perf_counter() - start
+            drain_start = time.perf_counter()
+            annotator.join()
+            drained = time.perf_counter() - drain_start
+        chatbot.db.analytics_buffer.flush()
+        rss_end = current_rss_mb()
+        if args.stream:
+            shared.run_async(http_client.aclose())
+
+    turns = sum(len(samples) for samples in load.turn_ms.values())
+    if args.stream:
+        mode = f"streamed replies (scheduler {args.llm_concurrency} concurrent, {args.llm_rpm:.0f} rpm)"
+    else:
+        mode = "blocking replies"
+    print(
+        f"{args.users} users x {args.turns} turns, {mode}, fake LLM {args.llm_latency * 1000:.0f}ms "
+        f"+ {args.token_interval * 1000:.0f}ms/token, think time {args.think_time:.1f}s, {backend}"
+    )
+    if args.sentiment_on_write == "false":
+        print("Sentiment on write: off")
+    elif annotator.sentiment:
+        print(f"Sentiment on write: on, labels finished {drained:.2f}s after the last turn")
+    else:
+        print("Sentiment on write: on, but disabled after the model failed to load")
+    print(f"Throughput {turns / elapsed:.1f} turns/s over {elapsed:.2f}s, {load.errors} failed turns, "
+          f"{llm.rejected} LLM 429s")
+    print("Turn latency")
+    print_latency("all turns", load.turn_ms["llm"] + load.turn_ms["recommendation"])
+    print_latency("LLM replies", load.turn_ms["llm"])
+    print_latency("recommendations", load.turn_ms["recommendation"])
+    print_latency("first token", load.first_token_ms)
+    if turns:
+        print(f"Mongo ops/turn {sum(counter.values()) / turns:.2f}  {dict(sorted(counter.items()))}")
+        print(f"RSS start {rss_start:.1f}MB, end {rss_end:.1f}MB, peak {rss.peak:.1f}MB, "
+              f"growth {(rss_end - rss_start) / turns * 1000:.2f}MB per 1000 turns")
+    if args.trace:
+        print("Stages")
+        for key, snapshot in metrics.STAGE_LATENCY_MS.snapshot().items():
+            stage, outcome = key.split(" ")
+            print(f"  {stage:<14} {outcome:<6} n={snapshot['count']:<6} mean {snapshot['mean']:8.3f}ms  "
+                  f"p95 {snapshot['p95']:8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,25 @@
 import streamlit as st
-from chatbot import ChatBot
-import datetime
+import shared
+import metrics
+import chat_turn
 import jwt
 import requests
 from dotenv import load_dotenv
 import os
-from encryption import encrypt_message, decrypt_message
 from auth_helper import verify_and_get_user, init_auth
-from recommendation_system import MoodBasedRecommender
-import random
-import json
+from mood_matcher import detect_mood
 
 load_dotenv()
 
+shared.start_metrics_server()
 
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
 
-# API configuration
-API_BASE_URL = "http://localhost:5001/api"
+# Number of chats fetched per sidebar page
+CHAT_PAGE_SIZE = 20
+# Number of messages fetched when opening a chat or scrolling back
+CHAT_HISTORY_PAGE_SIZE = 50
 
-MOOD_WORDS = [
-    "happy", "sad", "lonely", "anxious", "stressed", "angry", "depressed", 
-    "worried", "upset", "excited", "tired", "overwhelmed", "nervous", 
-    "exhausted", "hopeless", "shame", "fear", "panic", "self-doubt", 
-    "low self-esteem", "distressed", "unmotivated", "burnt out", "guilt", 
-    "grief", "emptiness", "worthless", "helpless", "restless", "isolated", 
-    "insecure", "broken", "lost", "unloved", "rejected", "abandoned", 
-    "confused", "betrayed", "powerless", "apathetic", "heartbroken", 
-    "disconnected", "vulnerable", "regretful", "irritable", "resentful", 
-    "emotional pain", "mental fatigue", "dread", "invisible", "despair", 
-    "detachment", "dissociation", "emotional numbness", "self-hatred", 
-    "suicidal thoughts", "desire to disappear", "feeling like a burden", 
-    "thoughts of self-harm", "hopeless about future", "writing goodbye notes", 
-    "emotional shutdown", "urge to escape life", "preparing for death", 
-    "existential dread", "flashbacks", "social withdrawal", "mistrust", 
-    "mania", "psychosis", "obsession", "compulsion", "nightmares", 
-    "loss of identity", "agitation", "self-harm urges", "frustrated"
-]
-
-
-with open(os.path.join(os.path.dirname(__file__), 'mental_health_recommendations.json'), 'r') as f:
-    LOCAL_RECOMMENDATIONS = json.load(f)
-
-# Load mental health resources JSON
-with open(os.path.join(os.path.dirname(__file__), 'mental_health_resources.json'), 'r') as f:
-    MENTAL_HEALTH_RESOURCES = json.load(f)
 
 st.set_page_config(
     page_title="🧠 Mental Health Assistant",
@@ -130,47 +105,82 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def make_api_request(method, endpoint, data=None, params=None):
-    headers = {
-        "Authorization": f"Bearer {st.session_state.token}",
-        "Content-Type": "application/json"
-    }
     try:
-        response = requests.request(
+        return shared.get_api_client().request(
             method,
-            f"{API_BASE_URL}{endpoint}",
-            json=data,
+            endpoint,
+            data=data,
             params=params,
-            headers=headers
+            token=st.session_state.token
         )
-        response.raise_for_status()
-        return response.json()
     except requests.exceptions.RequestException as e:
         st.error(f"API Error: {str(e)}")
         return None
 
+def make_api_requests(calls):
+    """Send several independent (method, endpoint, data, params) calls in parallel; failed ones return None."""
+    results = shared.get_api_client().batch(calls, token=st.session_state.token)
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            st.error(f"API Error: {str(result)}")
+            results[i] = None
+    return results
+
 def load_chat_messages(chat_id):
     try:
-        return st.session_state.chatbot.db.get_chat_history(chat_id)
+        messages = shared.get_database().get_chat_history(chat_id, limit=CHAT_HISTORY_PAGE_SIZE)
+        st.session_state.message_offset = messages[0]["seq"] if messages else 0
+        st.session_state.persisted_count = st.session_state.message_offset + len(messages)
+        return messages
     except Exception as e:
         st.error(f"Error loading chat messages: {str(e)}")
+        st.session_state.message_offset = 0
+        st.session_state.persisted_count = 0
         return []
 
+def load_earlier_messages(chat_id):
+    try:
+        earlier = shared.get_database().get_chat_history(
+            chat_id,
+            limit=CHAT_HISTORY_PAGE_SIZE,
+            before=st.session_state.message_offset
+        )
+        if earlier:
+            st.session_state.messages = earlier + st.session_state.messages
+            st.session_state.message_offset = earlier[0]["seq"]
+    except Exception as e:
+        st.error(f"Error loading chat messages: {str(e)}")
+
 def load_chats():
     try:
-        chats = st.session_state.chatbot.db.get_all_chats(st.session_state.user_id)
+        limit = max(CHAT_PAGE_SIZE, len(st.session_state.get("chats", [])))
+        chats, cursor = shared.get_database().get_chat_summaries(
+            st.session_state.user_id,
+            limit=limit
+        )
+        st.session_state.chats = chats
+        st.session_state.chats_cursor = cursor
+        if not st.session_state.current_chat_id and len(chats) > 0:
+            st.session_state.current_chat_id = chats[0]["_id"]
+            st.session_state.messages = load_chat_messages(chats[0]["_id"])
+    except Exception as e:
+        st.error(f"Error loading chats: {str(e)}")
 
-        if chats:
-            chats = sorted(chats, key=lambda c: c.get('updated_at', c.get('created_at', '')), reverse=True)
-            st.session_state.chats = chats
-            if not st.session_state.current_chat_id and len(chats) > 0:
-                st.session_state.current_chat_id = chats[0]["_id"]
-                st.session_state.messages = load_chat_messages(chats[0]["_id"])
+def load_more_chats():
+    try:
+        chats, cursor = shared.get_database().get_chat_summaries(
+            st.session_state.user_id,
+            limit=CHAT_PAGE_SIZE,
+            cursor=st.session_state.chats_cursor
+        )
+        st.session_state.chats.extend(chats)
+        st.session_state.chats_cursor = cursor
     except Exception as e:
         st.error(f"Error loading chats: {str(e)}")
 
 def create_chat():
     try:
-        chat_id = st.session_state.chatbot.db.create_chat(st.session_state.user_id)
+        chat_id = shared.get_database().create_chat(st.session_state.user_id)
         if chat_id:
             load_chats()
             return chat_id
@@ -180,26 +190,33 @@ def create_chat():
 
 def update_chat(chat_id, messages):
     try:
-        for msg in messages:
-            st.session_state.chatbot.db.add_message(
-                chat_id,
-                msg["role"],
-                msg["content"]
-            )
-
-        load_chats()
-        return True
+        persisted = st.session_state.get("persisted_count", 0)
+        offset = st.session_state.get("message_offset", 0)
+        if shared.get_database().append_messages(
+            chat_id,
+            messages[persisted - offset:],
+            persisted
+        ):
+            st.session_state.persisted_count = offset + len(messages)
+            load_chats()
+            return True
+        # The chat holds a different number of messages than this session loaded, e.g. it was
+        # written from another tab; reload it so the next turn is stored
+        st.error("Error updating chat: your latest messages could not be saved. The chat has been reloaded.")
+        st.session_state.messages = load_chat_messages(chat_id)
     except Exception as e:
         st.error(f"Error updating chat: {str(e)}")
     return False
 
 def delete_chat(chat_id):
     try:
-        if st.session_state.chatbot.db.delete_chat(chat_id):
+        if shared.get_database().delete_chat(chat_id):
             load_chats()
             if st.session_state.current_chat_id == chat_id:
                 st.session_state.current_chat_id = None
                 st.session_state.messages = []
+                st.session_state.message_offset = 0
+                st.session_state.persisted_count = 0
     except Exception as e:
         st.error(f"Error deleting chat: {str(e)}")
 
@@ -229,95 +246,62 @@ def initialize_session_state(user_id):
     if "initialized" not in st.session_state:
         st.session_state.initialized = True
         st.session_state.current_chat_id = None
-        st.session_state.chatbot = ChatBot()
         st.session_state.messages = []
+        st.session_state.message_offset = 0
+        st.session_state.persisted_count = 0
         st.session_state.chats = []
+        st.session_state.chats_cursor = None
         load_chats()
         if st.session_state.chats:
             st.session_state.current_chat_id = st.session_state.chats[0]["_id"]
             st.session_state.messages = load_chat_messages(st.session_state.chats[0]["_id"])
 
 def is_mood_message(user_input):
-    mood_triggers = [
-        'can you recommend', 'can you suggest', 'what should i do for', 'any tips for',
-        'help with', 'cope with', 'manage my', 'suggest something for', 'recommend something for'
-    ]
-    user_input_lower = user_input.lower()
-    return any(kw in user_input_lower for kw in mood_triggers)
+    return chat_turn.is_mood_message(user_input)
 
-def get_mental_health_resources(mood=None, category=None):
-    resources = []
-    if mood:
-        mood = mood.lower()    
-    if category and category in MENTAL_HEALTH_RESOURCES:
-        resources.extend(MENTAL_HEALTH_RESOURCES[category])
-    else:
-        resources.extend(MENTAL_HEALTH_RESOURCES.get('general', []))
-    
-    return resources
+def get_mental_health_resources(mood=None, category=None, region=None):
+    return chat_turn.get_mental_health_resources(mood, category, region)
 
 def format_resource_response(resources):
-    if not resources:
-        return "No resources found."
-    
-    response = "**Mental Health Resources:**\n\n"
-    for i, resource in enumerate(resources, 1):
-        response += f"{i}. **{resource['title']}**\n"
-        if resource.get('summary'):
-            response += f"   {resource['summary']}\n"
-        if resource.get('url'):
-            response += f"   [Read more]({resource['url']})\n"
-        if resource.get('published_date'):
-            response += f"   Published: {resource['published_date']}\n"
-        response += "\n"
-    
-    return response
+    return chat_turn.format_resource_response(resources)
 
 def process_user_input(prompt):
-    if is_mood_message(prompt):
-        recommendations = st.session_state.chatbot.recommender.get_recommendations(prompt)
-        response = "Here are some exercises that might help you:\n\n"
-        for i, rec in enumerate(recommendations, 1):
-            response += f"{i}. {rec['exercise']}\n\n"
-        
-        resources = get_mental_health_resources()
-        response += "\n" + format_resource_response(resources)
-        
-        response += "\nWould you like to try any of these exercises or learn more about the resources? I'm here to support you."
-        return response
-    return st.session_state.chatbot.get_bot_response(st.session_state.current_chat_id, prompt)
+    return chat_turn.process_user_input(shared.get_chatbot(), st.session_state.current_chat_id, prompt)
+
+def stream_async_reply(chat_id, prompt):
+    return shared.iterate_async(shared.get_async_chatbot().stream_bot_response(chat_id, prompt))
 
-def get_latest_mood(messages):
-    for msg in reversed(messages):
+def stream_user_input(prompt):
+    return chat_turn.stream_user_input(
+        shared.get_chatbot(),
+        st.session_state.current_chat_id,
+        prompt,
+        stream_async_reply
+    )
+
+def get_latest_mood():
+    """Latest mood of the open chat, as recorded when its messages were stored."""
+    for chat in st.session_state.chats:
+        if chat["_id"] == st.session_state.current_chat_id:
+            return chat.get("latest_mood")
+    # Nothing is stored without an open chat, so fall back to the session's messages
+    for msg in reversed(st.session_state.messages):
         if msg["role"] == "user":
-            for mood in MOOD_WORDS:
-                if mood in msg["content"].lower():
-                    return mood
+            mood = detect_mood(msg["content"])
+            if mood:
+                return mood
     return None
 
 def get_external_recommendations(mood):
-    url = 'https://magicloops.dev/api/loop/358a84e8-378e-47b3-9af1-9a658bbf97d4/run'
-    payload = { "mood": mood }
-    try:
-        response = requests.get(url, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"youtube": [], "spotify": []}
-    except Exception as e:
-        print(f"API error: {e}")
-        return {"youtube": [], "spotify": []}
+    return shared.get_external_recommendations().get(mood)
 
 def get_local_recommendations(mood):
-    mood = mood.lower()
-    recs = LOCAL_RECOMMENDATIONS.get(mood, {})
-    videos = recs.get('videos', [])
-    podcasts = recs.get('podcasts', [])
-    return videos, podcasts
+    return shared.get_resource_catalog().media(mood)
 
 def main():
     init_auth()
-    user_id = verify_and_get_user()
+    with metrics.span("auth"):
+        user_id = verify_and_get_user()
     if not user_id:
         return
     initialize_session_state(user_id)
@@ -337,28 +321,39 @@ def main():
                 if st.button("🗑️", key=f"delete_{chat_id}"):
                     delete_chat(chat_id)
                     st.rerun()
+        if st.session_state.chats_cursor and st.button("Load more chats"):
+            load_more_chats()
+            st.rerun()
     st.title("Mental Health Assistant")
+    if st.session_state.message_offset > 0 and st.button("Load earlier messages"):
+        load_earlier_messages(st.session_state.current_chat_id)
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.write(message["content"])
     if prompt := st.chat_input("How are you feeling today?"):
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.write(prompt)
-        response = process_user_input(prompt)
-        with st.chat_message("assistant"):
-            st.markdown(response, unsafe_allow_html=True)
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        if st.session_state.current_chat_id:
-            update_chat(st.session_state.current_chat_id, st.session_state.messages)
+        with metrics.turn():
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            with st.chat_message("user"):
+                st.write(prompt)
+            with st.chat_message("assistant"):
+                response = st.write_stream(stream_user_input(prompt))
+            st.session_state.messages.append({"role": "assistant", "content": response})
+            if st.session_state.current_chat_id:
+                update_chat(st.session_state.current_chat_id, st.session_state.messages)
 
-    mood = get_latest_mood(st.session_state.messages)
+    mood = get_latest_mood()
     if mood:
         if st.button("Show Recommendations"):
-            exercise_recommendations = st.session_state.chatbot.recommender.get_recommendations(mood, num_recommendations=10)
-            random.shuffle(exercise_recommendations)
-            exercise_recommendations = exercise_recommendations[:5]
-            videos, podcasts = get_local_recommendations(mood)
+            exercise_recommendations = shared.get_recommender().get_recommendations(
+                mood,
+                num_recommendations=5,
+                sample=True
+            )
+            media = get_external_recommendations(mood)
+            videos = media.get('videos', [])
+            podcasts = media.get('podcasts', [])
+            if not videos and not podcasts:
+                videos, podcasts = get_local_recommendations(mood)
             response = f"Since you mentioned feeling {mood}, here are some resources that might help:\n\n"
             if exercise_recommendations:
                 response += "**Recommended Exercises:**\n"
@@ -383,4 +378,9 @@ def main():
                 update_chat(st.session_state.current_chat_id, st.session_state.messages)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # Build the chatbot, models and LLM clients once the first page is out, not before it;
+        # st.rerun() and st.stop() leave main() by raising
+        shared.start_warm_up()
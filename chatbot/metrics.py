@@ -0,0 +1,309 @@
+"""Lightweight in-process metrics shared by the chatbot's clients and schedulers.
+
+Stages of a chat turn are timed with `span(stage)`, and a turn is wrapped
+in `turn()`, which gives it a request id. Both cost one flag check unless
+tracing is on. Histograms registered with `register` are served in the
+Prometheus text format on METRICS_PORT, and with TRACE_LOG=json every turn
+is also logged as one JSON line with its spans.
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Port for the /metrics side server; unset to not serve metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None
+# "json" to log one line per turn with its request id and stage timings
+TRACE_LOG = os.getenv("TRACE_LOG", "").lower()
+TRACING_ENABLED = (
+    os.getenv("TRACING_ENABLED", "false").lower() == "true" or bool(METRICS_PORT) or TRACE_LOG == "json"
+)
+
+# Upper bounds in milliseconds; anything slower lands in the overflow bucket
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, safe to update from many threads."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, pct):
+        """Estimate a percentile by interpolating inside the bucket that holds it."""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = pct / 100 * total
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            count, total = self.count, self.sum
+            cumulative = []
+            running = 0
+            for bucket_count in self.counts:
+                running += bucket_count
+                cumulative.append(running)
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": dict(zip([*self.buckets, "+Inf"], cumulative)),
+        }
+
+
+class HistogramFamily:
+    """Histograms keyed by label values, e.g. one per (method, route)."""
+
+    kind = "histogram"
+
+    def __init__(self, label_names, buckets=DEFAULT_BUCKETS_MS):
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        histogram = self._histograms.get(values)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(values, Histogram(self.buckets))
+        return histogram
+
+    def items(self):
+        with self._lock:
+            return sorted(self._histograms.items())
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self):
+        return {" ".join(values): histogram.snapshot() for values, histogram in self.items()}
+
+
+class Gauge:
+    """A number that goes up and down, e.g. a queue depth, safe to update from many threads."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class GaugeFamily(HistogramFamily):
+    """Gauges keyed by label values; with kind="counter" they are served as counters that only go up."""
+
+    def __init__(self, label_names, kind="gauge"):
+        super().__init__(label_names)
+        self.kind = kind
+
+    def labels(self, *values):
+        gauge = self._histograms.get(values)
+        if gauge is None:
+            with self._lock:
+                gauge = self._histograms.setdefault(values, Gauge())
+        return gauge
+
+    def snapshot(self):
+        return {" ".join(values): gauge.value for values, gauge in self.items()}
+
+
+_registry = {}
+
+
+def register(name, help_text, family):
+    """Expose a HistogramFamily or GaugeFamily under `name` on the metrics endpoint; registering a name again replaces it."""
+    _registry[name] = (help_text, family)
+    return family
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (help_text, family) in sorted(_registry.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {family.kind}")
+        for values, histogram in family.items():
+            labels = ",".join(
+                f'{label}="{_escape_label(value)}"' for label, value in zip(family.label_names, values)
+            )
+            if family.kind != "histogram":
+                lines.append(f"{name}{{{labels}}} {histogram.value}" if labels else f"{name} {histogram.value}")
+                continue
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                separator = "," if labels else ""
+                lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {snapshot['sum']}")
+            lines.append(f"{name}_count{suffix} {snapshot['count']}")
+    return "\n".join(lines) + "\n"
+
+
+STAGE_LATENCY_MS = register(
+    "chatbot_stage_duration_milliseconds",
+    "Time spent in each stage of a chat turn.",
+    HistogramFamily(("stage", "outcome"), buckets=(0.1, 0.25, 0.5, *DEFAULT_BUCKETS_MS))
+)
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_turn_spans = contextvars.ContextVar("turn_spans", default=None)
+
+
+def enable_tracing(enabled=True):
+    global TRACING_ENABLED
+    TRACING_ENABLED = enabled
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times one stage with a monotonic clock; an exception leaving the block marks it as an error."""
+
+    __slots__ = ("stage", "start", "elapsed_ms")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.elapsed_ms = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed_ms = (time.perf_counter() - self.start) * 1000
+        outcome = "error" if exc_type else "ok"
+        STAGE_LATENCY_MS.labels(self.stage, outcome).observe(self.elapsed_ms)
+        spans = _turn_spans.get()
+        if spans is not None:
+            spans.append({"stage": self.stage, "ms": round(self.elapsed_ms, 3), "outcome": outcome})
+        return False
+
+
+def span(stage):
+    """Context manager timing `stage`; a shared no-op when tracing is off."""
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(stage)
+
+
+@contextmanager
+def turn(request_id=None):
+    """Scope of one chat turn: sets its request id and, with tracing on, times it and collects its spans."""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    id_token = _request_id.set(request_id)
+    if not TRACING_ENABLED:
+        try:
+            yield request_id
+        finally:
+            _request_id.reset(id_token)
+        return
+    spans = []
+    spans_token = _turn_spans.set(spans)
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield request_id
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        STAGE_LATENCY_MS.labels("turn", outcome).observe(elapsed_ms)
+        _turn_spans.reset(spans_token)
+        _request_id.reset(id_token)
+        if TRACE_LOG == "json":
+            print(json.dumps({
+                "event": "turn",
+                "request_id": request_id,
+                "ms": round(elapsed_ms, 3),
+                "outcome": outcome,
+                "spans": spans
+            }), flush=True)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/metrics":
+            body = render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?", 1)[0] == "/metrics.json":
+            body = json.dumps({name: family.snapshot() for name, (_, family) in _registry.items()}).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serve /metrics and /metrics.json from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
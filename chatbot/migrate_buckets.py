@@ -0,0 +1,129 @@
+import argparse
+import os
+import time
+from datetime import datetime
+from db_handler import ChatDatabase, MESSAGE_BUCKET_SIZE, STORED_COUNT, write_buckets
+from scheduler import TokenBucket
+
+JOB_ID = "migrate_buckets"
+MIGRATE_BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "50"))
+MIGRATE_MAX_MESSAGES_PER_SEC = float(os.getenv("MIGRATE_MAX_MESSAGES_PER_SEC", "5000"))
+
+
+class BucketMigrationJob:
+    """Moves messages stored inside chat documents into the bucketed messages collection, online.
+
+    Chats that still have a `messages` array are read in `_id` order,
+    `batch_size` at a time. Their messages are appended to the buckets with
+    the same idempotent writes the app uses, then the array is removed, but
+    only if it still has the length that was copied; a chat changed in the
+    meantime by an older app instance is picked up by the next run. Readers
+    merge both layouts, so chats stay readable and writable throughout.
+    Writes are throttled to `max_messages_per_sec`, and progress is
+    checkpointed in `maintenance_jobs` after every batch.
+    """
+
+    def __init__(self, db, batch_size=MIGRATE_BATCH_SIZE, max_messages_per_sec=MIGRATE_MAX_MESSAGES_PER_SEC,
+                 bucket_size=MESSAGE_BUCKET_SIZE, dry_run=False):
+        self.chats = db.chats
+        self.messages = db.messages
+        self.jobs = db.chats.database["maintenance_jobs"]
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.bucket = TokenBucket(max_messages_per_sec, burst=max(max_messages_per_sec, 1)) if max_messages_per_sec else None
+        self.dry_run = dry_run
+
+    def load_checkpoint(self):
+        checkpoint = self.jobs.find_one({"_id": JOB_ID})
+        # A finished run starts over, so chats skipped because of a conflict are retried
+        if not checkpoint or checkpoint.get("finished"):
+            return {"last_id": None, "chats": 0, "messages": 0, "conflicts": 0}
+        return checkpoint
+
+    def reset(self):
+        self.jobs.delete_one({"_id": JOB_ID})
+
+    def _save_checkpoint(self, checkpoint, finished=False):
+        fields = {k: checkpoint[k] for k in ("last_id", "chats", "messages", "conflicts")}
+        fields.update({"updated_at": datetime.utcnow(), "finished": finished})
+        self.jobs.update_one({"_id": JOB_ID}, {"$set": fields}, upsert=True)
+
+    def migrate_chat(self, chat):
+        """Copy one chat's inline messages to buckets and drop the array. False if the chat changed meanwhile."""
+        messages = chat.get("messages", [])
+        docs = []
+        for i, msg in enumerate(messages):
+            doc = dict(msg)
+            doc.setdefault("seq", i)
+            docs.append(doc)
+        if self.dry_run:
+            return True
+        if self.bucket:
+            self.bucket.acquire(max(len(docs), 1))
+        write_buckets(self.messages, chat["_id"], docs, self.bucket_size)
+        result = self.chats.update_one(
+            {"_id": chat["_id"], "messages": {"$size": len(messages)}},
+            # A chat migrate_chats.py has not reached keeps its count, which was the array's length
+            [{"$set": {"message_count": STORED_COUNT}}, {"$project": {"messages": 0}}]
+        )
+        return result.modified_count == 1
+
+    def run(self, progress=print):
+        checkpoint = self.load_checkpoint()
+        remaining = self.chats.count_documents({"messages": {"$exists": True}})
+        started = time.monotonic()
+        done_before = checkpoint["chats"]
+        while True:
+            query = {"messages": {"$exists": True}}
+            if checkpoint["last_id"] is not None:
+                query["_id"] = {"$gt": checkpoint["last_id"]}
+            batch = list(self.chats.find(query, {"messages": 1}).sort("_id", 1).limit(self.batch_size))
+            if not batch:
+                break
+            for chat in batch:
+                if self.migrate_chat(chat):
+                    checkpoint["messages"] += len(chat.get("messages", []))
+                else:
+                    checkpoint["conflicts"] += 1
+            checkpoint["chats"] += len(batch)
+            checkpoint["last_id"] = batch[-1]["_id"]
+            if not self.dry_run:
+                self._save_checkpoint(checkpoint)
+            progress(self._progress_line(checkpoint, remaining, done_before, started))
+
+        if not self.dry_run:
+            self._save_checkpoint(checkpoint, finished=True)
+        return checkpoint
+
+    @staticmethod
+    def _progress_line(checkpoint, remaining, done_before, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        done = checkpoint["chats"] - done_before
+        chats_per_sec = done / elapsed
+        eta = f"{max(remaining - done, 0) / chats_per_sec:.0f}s" if chats_per_sec else "?"
+        return (
+            f"{done}/{remaining} chats this run, {checkpoint['messages']} messages moved, "
+            f"{chats_per_sec:.1f} chats/s, ETA {eta}, {checkpoint['conflicts']} conflicts"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move messages stored inside chat documents into message buckets")
+    parser.add_argument("--batch-size", type=int, default=MIGRATE_BATCH_SIZE, help="Chats read per batch")
+    parser.add_argument("--max-messages-per-sec", type=float, default=MIGRATE_MAX_MESSAGES_PER_SEC,
+                        help="Upper bound on messages moved per second (0 for no limit)")
+    parser.add_argument("--reset", action="store_true", help="Discard the checkpoint and start from the first chat")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    job = BucketMigrationJob(ChatDatabase(), batch_size=args.batch_size,
+                             max_messages_per_sec=args.max_messages_per_sec, dry_run=args.dry_run)
+    if args.reset and not args.dry_run:
+        job.reset()
+    result = job.run()
+    action = "Would move" if args.dry_run else "Moved"
+    print(f"{action} {result['messages']} messages out of {result['chats']} chats, {result['conflicts']} left for the next run")
+
+
+if __name__ == "__main__":
+    main()
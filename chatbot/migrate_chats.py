@@ -0,0 +1,160 @@
+import argparse
+from db_handler import MESSAGE_BUCKET_SIZE, STORED_COUNT, ChatDatabase, bucket_start
+from encryption import decrypt_message
+
+
+def _block_ends(keys, start, end):
+    """True when the messages from `end` on begin with another block after keys[start:end].
+
+    The next block is either the same session saving again, which repeats
+    keys[start:end] and adds to it, or a new session, which repeats
+    everything stored before it.
+    """
+    if end == len(keys):
+        return True
+    block = keys[start:end]
+    if keys[end] == block[0] and keys[end:end + len(block)] == block:
+        return True
+    return keys[end] == keys[0] and keys[end:2 * end] == keys[:end]
+
+
+def dedupe_messages(messages):
+    """Collapse a transcript that was re-saved in full after every turn.
+
+    Older versions of `update_chat` appended the whole session transcript on
+    each turn, and a session started from everything stored so far,
+    duplicates included. A chat therefore is a run of blocks, each one the
+    history its session loaded followed by that session's messages so far:
+
+        session 1: [u1 a1] [u1 a1 u2 a2]
+        session 2: [u1 a1 u1 a1 u2 a2 u3 a3] [u1 a1 u1 a1 u2 a2 u3 a3 u4 a4]
+
+    Every block starts with either the previous block of its session or
+    the whole stored chat before it; what follows is new, and is kept once.
+    Each stored message is compared on its decrypted content, since every
+    copy was encrypted with a fresh IV.
+    """
+    decoded = [
+        {"role": msg["role"], "text": decrypt_message(msg["content"]), "raw": msg}
+        for msg in messages
+    ]
+    keys = [(msg["role"], msg["text"]) for msg in decoded]
+    clean = []
+    block = []
+    pos = 0
+    while pos < len(keys):
+        if pos and keys[pos:2 * pos] == keys[:pos]:
+            # A new session, which loaded everything stored so far
+            loaded = pos
+        elif block and keys[pos:pos + len(block)] == block:
+            loaded = len(block)
+        else:
+            # Not a re-saved prefix; keep everything from here as it is
+            loaded = 0
+        start = pos
+        pos += loaded
+        end = pos + 1
+        while not _block_ends(keys, start, end):
+            end += 1
+        clean.extend(decoded[pos:end])
+        block = keys[start:end]
+        pos = end
+
+    result = []
+    for seq, msg in enumerate(clean):
+        stored = dict(msg["raw"])
+        stored["seq"] = seq
+        result.append(stored)
+    return result
+
+
+def chat_title(messages):
+    """Title from the first user message, as the sidebar used to compute on every load."""
+    for msg in messages:
+        if msg["role"] == "user":
+            text = decrypt_message(msg["content"])
+            return text[:40] + "..." if len(text) > 40 else text
+    return "New Chat"
+
+
+def renumber_buckets(db, chat_oid, shift, size=MESSAGE_BUCKET_SIZE):
+    """Move every bucketed message of a chat `shift` seqs down, rewriting its buckets in ascending order.
+
+    A bucket is only overwritten once the messages it held are in their new,
+    lower buckets, so an interrupted run does not lose any.
+    """
+    docs = [msg for bucket in db.messages.find({"chat_id": chat_oid}).sort("seq", 1) for msg in bucket["messages"]]
+    if not docs:
+        return
+    buckets = {}
+    for doc in docs:
+        doc["seq"] -= shift
+        buckets.setdefault(bucket_start(doc["seq"], size), []).append(doc)
+    for start, messages in sorted(buckets.items()):
+        db.messages.replace_one(
+            {"chat_id": chat_oid, "seq": start},
+            {"chat_id": chat_oid, "seq": start, "messages": messages, "count": len(messages)},
+            upsert=True
+        )
+    db.messages.delete_many({"chat_id": chat_oid, "seq": {"$gt": max(buckets)}})
+
+
+def migrate(db, dry_run=False):
+    """Dedupe bloated chats and backfill `message_count` and the sidebar title.
+
+    A chat is migrated while its inline messages have no `seq`, including
+    one written since this version was deployed: it then has a
+    `message_count`, and its newer messages are in buckets after the
+    inline ones. Only the inline part is deduped; the bucketed messages and
+    `summary_upto` move down by the number of duplicates removed. Run it
+    while the app is not writing to the chats.
+    """
+    migrated = 0
+    removed = 0
+    for chat in db.chats.find({"messages": {"$elemMatch": {"seq": {"$exists": False}}}}):
+        messages = chat["messages"]
+        clean = dedupe_messages(messages)
+        duplicates = len(messages) - len(clean)
+        removed += duplicates
+        migrated += 1
+        if dry_run:
+            continue
+        stored = chat.get("message_count", len(messages))
+        fields = {"messages": clean, "message_count": stored - duplicates, "title": chat_title(clean)}
+        update = {"$set": fields}
+        summary_upto = chat.get("summary_upto", 0)
+        if summary_upto >= len(messages):
+            fields["summary_upto"] = summary_upto - duplicates
+        elif summary_upto:
+            # The summary covers part of the duplicated messages; it is rebuilt on the next turn
+            update["$unset"] = {"summary": "", "summary_upto": ""}
+        result = db.chats.update_one(
+            {"_id": chat["_id"], "messages": {"$size": len(messages)}, "$expr": {"$eq": [STORED_COUNT, stored]}},
+            update
+        )
+        if not result.modified_count:
+            print(f"Skipped chat {chat['_id']}: it was written during the migration")
+            continue
+        if duplicates and stored > len(messages):
+            renumber_buckets(db, chat["_id"], duplicates)
+        if chat.get("anonymous_id"):
+            db.analytics.update_one(
+                {"anonymous_id": chat["anonymous_id"]},
+                {"$set": {"message_count": stored - duplicates}}
+            )
+    return migrated, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove duplicated messages from chats saved by the old update path")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    db = ChatDatabase()
+    migrated, removed = migrate(db, dry_run=args.dry_run)
+    action = "Would remove" if args.dry_run else "Removed"
+    print(f"{action} {removed} duplicated messages across {migrated} chats")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+from typing import NamedTuple
+
+MOODS_PATH = os.path.join(os.path.dirname(__file__), "moods.json")
+
+# Spaces and hyphens inside a phrase match any run of either, so "burnt out" also finds "burnt-out"
+_SEPARATOR = r"[\s\-]+"
+_END = ""
+
+_default_matcher = None
+
+
+def load_mood_config(path=MOODS_PATH):
+    """The mood and intent phrase lists shared by the chatbot and vid.py."""
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def normalize_phrase(text):
+    return " ".join(re.split(_SEPARATOR, text.lower().strip()))
+
+
+def _trie_pattern(phrases):
+    """Regex for a set of phrases, shaped as a trie so shared prefixes are matched once."""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[_END] = True
+
+    def build(node):
+        branches = [
+            (_SEPARATOR if char == " " else re.escape(char)) + build(child)
+            for char, child in sorted(node.items()) if char != _END
+        ]
+        if not branches:
+            return ""
+        if _END in node:
+            # Optional, but greedy: the longest phrase at a position wins
+            return "(?:" + "|".join(branches) + ")?"
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    return build(trie)
+
+
+class Match(NamedTuple):
+    kind: str
+    label: str
+    start: int
+    end: int
+
+
+class MoodMatcher:
+    """Finds mood words and intent phrases in one pass over a message.
+
+    All phrases are compiled into a single regex with word boundaries, run
+    over the lowercased text, so "lost" no longer matches inside "lostness" and each
+    position of the text is examined once. Where phrases overlap, the longest
+    one wins, so "existential dread" is reported rather than "dread".
+    """
+
+    def __init__(self, moods, intents):
+        self.moods = list(moods)
+        self.labels = {}
+        for mood in self.moods:
+            self.labels[normalize_phrase(mood)] = ("mood", mood)
+        for intent, phrases in intents.items():
+            for phrase in phrases:
+                self.labels.setdefault(normalize_phrase(phrase), ("intent", intent))
+        pattern = r"\b" + _trie_pattern(self.labels) + r"\b"
+        self.pattern = re.compile(pattern)
+        # For the rare text whose length changes when lowercased, where spans would shift
+        self.caseless_pattern = re.compile(pattern, re.IGNORECASE)
+
+    @classmethod
+    def from_file(cls, path=MOODS_PATH):
+        config = load_mood_config(path)
+        return cls(config["moods"], config.get("intents", {}))
+
+    def scan(self, text):
+        """Every mood and intent mentioned in the text, in order of position."""
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            found = self.pattern.finditer(lowered)
+        else:
+            found = self.caseless_pattern.finditer(text)
+        matches = []
+        for match in found:
+            phrase = match.group()
+            kind, label = self.labels.get(phrase) or self.labels[normalize_phrase(phrase)]
+            matches.append(Match(kind, label, match.start(), match.end()))
+        return matches
+
+    def find_moods(self, text):
+        """Distinct moods mentioned in the text, in order of first mention."""
+        return list(dict.fromkeys(m.label for m in self.scan(text) if m.kind == "mood"))
+
+    def find_intents(self, text):
+        return {m.label for m in self.scan(text) if m.kind == "intent"}
+
+    def detect_mood(self, text):
+        """The first mood mentioned in the text, or None."""
+        for match in self.scan(text):
+            if match.kind == "mood":
+                return match.label
+        return None
+
+    def is_recommendation_request(self, text):
+        return any(m.kind == "intent" and m.label == "recommendation" for m in self.scan(text))
+
+
+def get_matcher():
+    """The process-wide matcher for moods.json, built on first use."""
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = MoodMatcher.from_file()
+    return _default_matcher
+
+
+def detect_mood(text):
+    return get_matcher().detect_mood(text)
+
+
+def is_recommendation_request(text):
+    return get_matcher().is_recommendation_request(text)
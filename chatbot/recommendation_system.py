@@ -1,29 +1,208 @@
-import pandas as pd
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import hashlib
 import json
+import os
+import pickle
+import re
+import shutil
+import numpy as np
+from scipy.sparse import csr_matrix
+from metrics import span
+
+# Bump when the artifact layout or the fitting procedure changes
+ARTIFACT_VERSION = 1
+# When sampling, recommendations are drawn from this many times more top candidates
+SAMPLE_POOL_FACTOR = 2
+
 
 class MoodBasedRecommender:
-    def __init__(self, dataset_path="mental_health_chatbot_interactions.csv"):
-        self.df = pd.read_csv(dataset_path)
+    """Recommends exercises for a mood from the interactions dataset.
+
+    The ~2,000 dataset rows only cover ~73 distinct moods, so rows are
+    collapsed into a per-mood index: one TF-IDF row per mood plus the list of
+    exercises for it. Queries naming a known mood are answered by lookup
+    without vectorizing; free text is scored against the mood rows only.
+
+    The fitted index is cached on disk in a versioned artifact directory and
+    memory-mapped on later starts, so the CSV is parsed and fitted only when
+    it changes.
+    """
+
+    def __init__(self, dataset_path="mental_health_chatbot_interactions.csv", artifact_dir=None):
+        self.dataset_path = dataset_path
+        self.artifact_dir = artifact_dir or os.getenv(
+            "RECOMMENDER_ARTIFACT_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(dataset_path)), ".recommender_cache")
+        )
+        artifact_path = os.path.join(self.artifact_dir, f"v{ARTIFACT_VERSION}-{self._dataset_fingerprint()}")
+        if not self._load_artifact(artifact_path):
+            self._fit()
+            self._save_artifact(artifact_path)
+        self.mood_index = {mood: i for i, mood in enumerate(self.moods)}
+        self._mood_pattern = re.compile(
+            r"\b(" + "|".join(re.escape(mood) for mood in sorted(self.moods, key=len, reverse=True)) + r")\b"
+        )
+
+    def _dataset_fingerprint(self):
+        stat = os.stat(self.dataset_path)
+        key = f"{os.path.abspath(self.dataset_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    def _fit(self):
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        df = pd.read_csv(self.dataset_path)
+        df["mood"] = df["mood"].str.strip().str.lower()
+        # Fit on every row so IDF weights match the original per-row model
         self.vectorizer = TfidfVectorizer(stop_words='english')
-        self.tfidf_matrix = self.vectorizer.fit_transform(self.df['mood'])
-        
-    def get_recommendations(self, user_mood, num_recommendations=3):
-        mood_vector = self.vectorizer.transform([user_mood])
-        similarities = cosine_similarity(mood_vector, self.tfidf_matrix)
-        top_indices = similarities[0].argsort()[-num_recommendations:][::-1]
-        
-        recommendations = []
-        for idx in top_indices:
-            recommendation = {
-                'exercise': self.df.iloc[idx]['exercise'],
-                'similarity_score': float(similarities[0][idx])
-            }
-            recommendations.append(recommendation)
-            
-        return recommendations
+        self.vectorizer.fit(df["mood"])
+
+        grouped = df.groupby("mood", sort=True)["exercise"].apply(list)
+        self.moods = list(grouped.index)
+        self.exercises = [exercise for exercises in grouped for exercise in exercises]
+        self.mood_offsets = np.cumsum([0] + [len(exercises) for exercises in grouped])
+        self.mood_matrix = self.vectorizer.transform(self.moods).tocsr()
+
+    def _load_artifact(self, path):
+        try:
+            with open(os.path.join(path, "index.json")) as f:
+                index = json.load(f)
+            if index.get("version") != ARTIFACT_VERSION:
+                return False
+            with open(os.path.join(path, "vectorizer.pkl"), "rb") as f:
+                self.vectorizer = pickle.load(f)
+            self.moods = index["moods"]
+            self.exercises = index["exercises"]
+            self.mood_offsets = np.asarray(index["mood_offsets"])
+            self.mood_matrix = csr_matrix(
+                (
+                    np.load(os.path.join(path, "data.npy"), mmap_mode="r"),
+                    np.load(os.path.join(path, "indices.npy"), mmap_mode="r"),
+                    np.load(os.path.join(path, "indptr.npy"), mmap_mode="r"),
+                ),
+                shape=tuple(index["shape"]),
+                copy=False
+            )
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Error loading recommender artifact, refitting: {e}")
+            return False
+
+    def _save_artifact(self, path):
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(tmp_path, exist_ok=True)
+            with open(os.path.join(tmp_path, "vectorizer.pkl"), "wb") as f:
+                pickle.dump(self.vectorizer, f)
+            np.save(os.path.join(tmp_path, "data.npy"), self.mood_matrix.data)
+            np.save(os.path.join(tmp_path, "indices.npy"), self.mood_matrix.indices)
+            np.save(os.path.join(tmp_path, "indptr.npy"), self.mood_matrix.indptr)
+            with open(os.path.join(tmp_path, "index.json"), "w") as f:
+                json.dump({
+                    "version": ARTIFACT_VERSION,
+                    "dataset": os.path.basename(self.dataset_path),
+                    "shape": list(self.mood_matrix.shape),
+                    "moods": self.moods,
+                    "exercises": self.exercises,
+                    "mood_offsets": [int(offset) for offset in self.mood_offsets]
+                }, f)
+            if os.path.isdir(path):
+                # A corrupt or outdated artifact that failed to load; rename cannot replace a directory
+                stale_path = f"{path}.stale-{os.getpid()}"
+                os.rename(path, stale_path)
+                shutil.rmtree(stale_path, ignore_errors=True)
+            os.rename(tmp_path, path)
+        except OSError as e:
+            print(f"Error saving recommender artifact: {e}")
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _mood_exercises(self, mood_id):
+        return self.exercises[self.mood_offsets[mood_id]:self.mood_offsets[mood_id + 1]]
+
+    def _rank(self, scored_moods, limit):
+        """Exercises of the given moods in score order, de-duplicated, at most `limit`."""
+        ranked = []
+        seen = set()
+        for mood_id, score in scored_moods:
+            for exercise in self._mood_exercises(mood_id):
+                if len(ranked) == limit:
+                    return ranked
+                if exercise in seen:
+                    continue
+                seen.add(exercise)
+                ranked.append({
+                    'exercise': exercise,
+                    'similarity_score': float(score)
+                })
+        return ranked
+
+    def _select(self, scored_moods, num_recommendations, rng):
+        if rng is None:
+            return self._rank(scored_moods, num_recommendations)
+        # Sample from a wider pool of good candidates so repeated calls vary
+        pool = self._rank(scored_moods, num_recommendations * SAMPLE_POOL_FACTOR)
+        picks = rng.choice(len(pool), size=min(num_recommendations, len(pool)), replace=False)
+        return [pool[i] for i in picks]
+
+    def match_moods(self, text):
+        """Known moods named in `text`, longest phrases first, without vectorizing."""
+        text = text.strip().lower()
+        if text in self.mood_index:
+            return [self.mood_index[text]]
+        matched = []
+        for mood in self._mood_pattern.findall(text):
+            mood_id = self.mood_index[mood]
+            if mood_id not in matched:
+                matched.append(mood_id)
+        return matched
+
+    def score_moods_batch(self, texts, k):
+        """Top-k moods per text by cosine similarity, best first, from one sparse product."""
+        queries = self.vectorizer.transform(texts)
+        similarities = (queries @ self.mood_matrix.T).toarray()
+        k = min(k, similarities.shape[1])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [list(zip(row.tolist(), scores.tolist())) for row, scores in zip(top, top_scores)]
+
+    def score_moods(self, text, k):
+        """Top-k moods for free text by cosine similarity, best first."""
+        return self.score_moods_batch([text], k)[0]
+
+    def get_recommendations(self, user_mood, num_recommendations=3, sample=False, seed=None):
+        return self.get_recommendations_batch([user_mood], num_recommendations, sample, seed)[0]
+
+    def get_recommendations_batch(self, queries, k=3, sample=False, seed=None):
+        """Recommendations for many queries at once.
+
+        Queries naming a known mood are answered by lookup; the rest are scored
+        together with a single sparse matrix product. With `sample`, each query
+        gets `k` distinct exercises drawn from its top candidates using a
+        generator seeded with `seed`, so results are reproducible when a seed
+        is given.
+        """
+        with span("recommend"):
+            rng = np.random.default_rng(seed) if sample else None
+            limit = k * SAMPLE_POOL_FACTOR if sample else k
+            results = [None] * len(queries)
+            unmatched = []
+            for i, query in enumerate(queries):
+                matched = self.match_moods(query)
+                if matched:
+                    results[i] = self._select([(mood_id, 1.0) for mood_id in matched], k, rng)
+                else:
+                    unmatched.append(i)
+            if unmatched:
+                scored = self.score_moods_batch([queries[i] for i in unmatched], limit)
+                for i, scored_moods in zip(unmatched, scored):
+                    results[i] = self._select(scored_moods, k, rng)
+            return results
 
 def main():
     recommender = MoodBasedRecommender()
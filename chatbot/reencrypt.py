@@ -0,0 +1,180 @@
+import argparse
+import os
+import time
+from datetime import datetime
+from pymongo import UpdateOne
+from db_handler import ChatDatabase
+from encryption import get_cipher
+from scheduler import TokenBucket
+
+JOB_ID = "reencrypt"
+# Collections rewritten, in order, and the checkpoint counter for their documents
+COLLECTIONS = (("chats", "chats"), ("messages", "buckets"))
+COUNTERS = ("last_id", "collection", "chats", "buckets", "messages", "summaries", "failed", "conflicts")
+REENCRYPT_BATCH_SIZE = int(os.getenv("REENCRYPT_BATCH_SIZE", "100"))
+REENCRYPT_MAX_MESSAGES_PER_SEC = float(os.getenv("REENCRYPT_MAX_MESSAGES_PER_SEC", "2000"))
+
+
+class ReencryptionJob:
+    """Rewrites stored messages and summaries with the active key, online and resumable.
+
+    Chat documents (summaries, and messages not yet moved to buckets) and
+    then message buckets are read in `_id` order, `batch_size` at a time,
+    and each batch is written back with a single unordered `bulk_write`.
+    Only records that are not already in the current format and key are
+    touched. Each field update
+    is conditional on the old ciphertext, so a concurrent rewrite of the same
+    chat is left alone and picked up by the next run. Writes are throttled to
+    `max_messages_per_sec`, and the last processed `_id` is checkpointed in
+    `maintenance_jobs` after every batch. An interrupted run resumes from
+    there; a run for a different active key starts over.
+
+    Appends do not shift message positions, so the job can run while users
+    chat, but not at the same time as migrate_chats.py or migrate_buckets.py.
+    """
+
+    def __init__(self, db, cipher=None, batch_size=REENCRYPT_BATCH_SIZE,
+                 max_messages_per_sec=REENCRYPT_MAX_MESSAGES_PER_SEC, dry_run=False):
+        self.collections = {"chats": db.chats, "messages": db.messages}
+        self.jobs = db.chats.database["maintenance_jobs"]
+        self.cipher = cipher or get_cipher()
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(max_messages_per_sec, burst=max(max_messages_per_sec, 1)) if max_messages_per_sec else None
+        self.dry_run = dry_run
+        self.target = f"{self.cipher.format}:{self.cipher.keyring.active_id}"
+
+    def load_checkpoint(self):
+        checkpoint = self.jobs.find_one({"_id": JOB_ID})
+        if not checkpoint or checkpoint.get("target") != self.target:
+            return {"last_id": None, "collection": "chats", "chats": 0, "buckets": 0,
+                    "messages": 0, "summaries": 0, "failed": 0, "conflicts": 0}
+        checkpoint.setdefault("collection", "chats")
+        checkpoint.setdefault("buckets", 0)
+        return checkpoint
+
+    def reset(self):
+        self.jobs.delete_one({"_id": JOB_ID})
+
+    def _save_checkpoint(self, checkpoint, finished=False):
+        fields = {k: checkpoint[k] for k in COUNTERS}
+        fields.update({"target": self.target, "updated_at": datetime.utcnow(), "finished": finished})
+        self.jobs.update_one({"_id": JOB_ID}, {"$set": fields}, upsert=True)
+
+    def _reencrypt(self, token, counters):
+        try:
+            return self.cipher.encrypt(self.cipher.decrypt(token))
+        except Exception as e:
+            print(f"Error re-encrypting record: {e}")
+            counters["failed"] += 1
+            return None
+
+    def plan_chat(self, chat, counters):
+        """(filter, $set fields) rewriting one chat or bucket, or None when it is already current."""
+        condition = {"_id": chat["_id"]}
+        updates = {}
+        for i, msg in enumerate(chat.get("messages", [])):
+            content = msg.get("content")
+            if not isinstance(content, str) or self.cipher.is_current(content):
+                continue
+            token = self._reencrypt(content, counters)
+            if token is not None:
+                condition[f"messages.{i}.content"] = content
+                updates[f"messages.{i}.content"] = token
+        summary = chat.get("summary")
+        if isinstance(summary, str) and summary and not self.cipher.is_current(summary):
+            token = self._reencrypt(summary, counters)
+            if token is not None:
+                condition["summary"] = summary
+                updates["summary"] = token
+        if not updates:
+            return None
+        return condition, updates
+
+    def run(self, progress=print):
+        checkpoint = self.load_checkpoint()
+        total = sum(collection.estimated_document_count() for collection in self.collections.values())
+        started = time.monotonic()
+        done_before = checkpoint["chats"] + checkpoint["buckets"]
+        written = 0
+        names = [name for name, _ in COLLECTIONS]
+        for name, counter in COLLECTIONS[names.index(checkpoint["collection"]):]:
+            if checkpoint["collection"] != name:
+                checkpoint["collection"] = name
+                checkpoint["last_id"] = None
+            collection = self.collections[name]
+            while True:
+                query = {"_id": {"$gt": checkpoint["last_id"]}} if checkpoint["last_id"] is not None else {}
+                batch = list(
+                    collection.find(query, {"messages.content": 1, "summary": 1})
+                    .sort("_id", 1)
+                    .limit(self.batch_size)
+                )
+                if not batch:
+                    break
+
+                operations = []
+                records = 0
+                for doc in batch:
+                    plan = self.plan_chat(doc, checkpoint)
+                    if plan is None:
+                        continue
+                    condition, updates = plan
+                    operations.append(UpdateOne(condition, {"$set": updates}))
+                    records += len(updates)
+                    checkpoint["summaries"] += "summary" in updates
+                    checkpoint["messages"] += len(updates) - ("summary" in updates)
+
+                if operations and not self.dry_run:
+                    if self.bucket:
+                        self.bucket.acquire(records)
+                    result = collection.bulk_write(operations, ordered=False)
+                    checkpoint["conflicts"] += len(operations) - result.matched_count
+                written += records
+                checkpoint[counter] += len(batch)
+                checkpoint["last_id"] = batch[-1]["_id"]
+                if not self.dry_run:
+                    self._save_checkpoint(checkpoint)
+                progress(self._progress_line(checkpoint, total, done_before, written, started))
+
+        if not self.dry_run:
+            self._save_checkpoint(checkpoint, finished=True)
+        return checkpoint
+
+    @staticmethod
+    def _progress_line(checkpoint, total, done_before, written, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        done = checkpoint["chats"] + checkpoint["buckets"]
+        docs_per_sec = (done - done_before) / elapsed
+        remaining = max(total - done, 0)
+        eta = f"{remaining / docs_per_sec:.0f}s" if docs_per_sec else "?"
+        pct = 100 * done / total if total else 100.0
+        return (
+            f"{checkpoint['chats']} chats and {checkpoint['buckets']} buckets of {total} documents ({pct:.1f}%), "
+            f"{checkpoint['messages']} messages and {checkpoint['summaries']} summaries re-encrypted, "
+            f"{written / elapsed:.0f} records/s, {docs_per_sec:.1f} docs/s, ETA {eta}, "
+            f"{checkpoint['failed']} failed, {checkpoint['conflicts']} conflicts"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encrypt stored chats with the active encryption key")
+    parser.add_argument("--batch-size", type=int, default=REENCRYPT_BATCH_SIZE, help="Chats read and written per batch")
+    parser.add_argument("--max-messages-per-sec", type=float, default=REENCRYPT_MAX_MESSAGES_PER_SEC,
+                        help="Upper bound on records rewritten per second (0 for no limit)")
+    parser.add_argument("--reset", action="store_true", help="Discard the checkpoint and start from the first chat")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    job = ReencryptionJob(ChatDatabase(), batch_size=args.batch_size,
+                          max_messages_per_sec=args.max_messages_per_sec, dry_run=args.dry_run)
+    if args.reset and not args.dry_run:
+        job.reset()
+    print(f"Re-encrypting chats to {job.target}")
+    result = job.run()
+    action = "Would re-encrypt" if args.dry_run else "Re-encrypted"
+    print(f"{action} {result['messages']} messages and {result['summaries']} summaries across "
+          f"{result['chats']} chats and {result['buckets']} message buckets")
+
+
+if __name__ == "__main__":
+    main()
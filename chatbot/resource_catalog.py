@@ -0,0 +1,228 @@
+import heapq
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+RESOURCES_PATH = os.path.join(os.path.dirname(__file__), 'mental_health_resources.json')
+RECOMMENDATIONS_PATH = os.path.join(os.path.dirname(__file__), 'mental_health_recommendations.json')
+# Seconds between checks of the JSON files' modification times
+RELOAD_CHECK_INTERVAL = float(os.getenv("RESOURCE_RELOAD_INTERVAL", "2"))
+
+# Score added per matching term when ranking
+MOOD_WEIGHT = 3
+KEYWORD_WEIGHT = 1
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to "
+    "was were which will with you your how what when who why can".split()
+)
+
+
+def keywords_of(text):
+    return {word for word in re.findall(r"[a-z]{3,}", text.lower()) if word not in STOPWORDS}
+
+
+def render_resource(resource):
+    parts = [f"**{resource['title']}**\n"]
+    if resource.get('summary'):
+        parts.append(f"   {resource['summary']}\n")
+    if resource.get('url'):
+        parts.append(f"   [Read more]({resource['url']})\n")
+    if resource.get('published_date'):
+        parts.append(f"   Published: {resource['published_date']}\n")
+    parts.append("\n")
+    return "".join(parts)
+
+
+class _CatalogState:
+    """One immutable build of the catalog; a reload builds a new one and swaps it in."""
+
+    def __init__(self, resources_json, recommendations_json):
+        self.resources = []
+        self.index = defaultdict(list)
+        by_key = {}
+
+        def add(item, kind, **terms):
+            # Identical entries listed under several categories or moods are stored once
+            key = (kind, json.dumps(item, sort_keys=True))
+            resource_id = by_key.get(key)
+            if resource_id is None:
+                resource_id = by_key[key] = len(self.resources)
+                self.resources.append({"kind": kind, "item": item})
+                self.index[("kind", kind)].append(resource_id)
+                text = f"{item.get('title', '')} {item.get('summary', '')} {item.get('description', '')}"
+                for word in keywords_of(text):
+                    self.index[("keyword", word)].append(resource_id)
+            for field, value in terms.items():
+                postings = self.index[(field, value.lower())]
+                if not postings or postings[-1] != resource_id:
+                    postings.append(resource_id)
+
+        for category, entries in resources_json.items():
+            if isinstance(entries, dict):
+                # by_region maps region names to their resources
+                for region, region_entries in entries.items():
+                    for item in region_entries:
+                        add(item, "article", category=category, region=region)
+            else:
+                for item in entries:
+                    add(item, "article", category=category)
+        for mood, media in recommendations_json.items():
+            if not isinstance(media, dict):
+                continue
+            for kind, field in (("video", "videos"), ("podcast", "podcasts")):
+                for item in media.get(field, []):
+                    add(item, kind, mood=mood)
+        self.index = dict(self.index)
+        self._posting_sets = {}
+        self.rendered = {id(r["item"]): (r["item"], render_resource(r["item"])) for r in self.resources}
+
+    def posting_set(self, key):
+        postings = self._posting_sets.get(key)
+        if postings is None:
+            postings = self._posting_sets[key] = frozenset(self.index.get(key, ()))
+        return postings
+
+
+class ResourceCatalog:
+    """Articles, videos and podcasts from the bundled JSON files, indexed for lookup.
+
+    Every resource is listed once, with inverted indexes from mood,
+    category, region, kind and title/summary keyword to resource ids.
+    `search` filters on category, region and kind, ranks by mood and
+    keyword matches, and touches only the posting lists involved. Rendered
+    markdown is memoized per resource. The files are re-read when their
+    modification time changes, checked at most every `reload_interval`
+    seconds.
+    """
+
+    def __init__(self, resources_path=RESOURCES_PATH, recommendations_path=RECOMMENDATIONS_PATH,
+                 reload_interval=RELOAD_CHECK_INTERVAL):
+        self.paths = (resources_path, recommendations_path)
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._mtimes = None
+        self._state = None
+        self.reloads = 0
+        self.reload()
+
+    def _current_mtimes(self):
+        return tuple(os.stat(path).st_mtime_ns for path in self.paths)
+
+    def reload(self):
+        """Rebuild from the JSON files; a file that fails to parse leaves the current build in place."""
+        with self._lock:
+            try:
+                mtimes = self._current_mtimes()
+                loaded = []
+                for path in self.paths:
+                    with open(path, 'r') as f:
+                        loaded.append(json.load(f))
+                state = _CatalogState(*loaded)
+            except (OSError, ValueError) as e:
+                print(f"Error loading resource catalog: {e}")
+                if self._state is None:
+                    self._state = _CatalogState({}, {})
+                return False
+            self._state = state
+            self._mtimes = mtimes
+            self.reloads += 1
+            return True
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            changed = self._current_mtimes() != self._mtimes
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def search(self, mood=None, category=None, region=None, kind=None, keywords=(), limit=None):
+        """Resource dicts ranked by relevance to `mood` and `keywords`, within the given filters.
+
+        With no filter, any resource matching the mood or a keyword is a
+        candidate. Ties keep their order in the file, within the category
+        when one is given.
+        """
+        self.maybe_reload()
+        state = self._state
+        index = state.index
+        filters = [(field, value.lower()) for field, value in
+                   (("category", category), ("region", region), ("kind", kind)) if value]
+        candidates = None
+        if filters:
+            candidates = index.get(filters[0], [])
+            if len(filters) > 1:
+                allowed = sorted((state.posting_set(key) for key in filters[1:]), key=len)
+                candidates = [i for i in candidates if all(i in postings for postings in allowed)]
+            if not candidates:
+                return []
+            if not mood and not keywords:
+                resources = state.resources
+                return [resources[i]["item"] for i in candidates[:limit]]
+            allowed_ids = set(candidates)
+
+        terms = set(keywords)
+        scores = defaultdict(int)
+        if mood:
+            mood = mood.lower()
+            terms |= keywords_of(mood)
+            for resource_id in index.get(("mood", mood), ()):
+                if candidates is None or resource_id in allowed_ids:
+                    scores[resource_id] += MOOD_WEIGHT
+        for term in terms:
+            for resource_id in index.get(("keyword", term.lower()), ()):
+                if candidates is None or resource_id in allowed_ids:
+                    scores[resource_id] += KEYWORD_WEIGHT
+
+        if candidates is None:
+            candidates = sorted(scores)
+        position = {resource_id: n for n, resource_id in enumerate(candidates)}
+
+        def rank(resource_id):
+            return -scores.get(resource_id, 0), position[resource_id]
+        if limit is None:
+            ids = sorted(candidates, key=rank)
+        else:
+            ids = heapq.nsmallest(limit, candidates, key=rank)
+        return [state.resources[i]["item"] for i in ids]
+
+    def media(self, mood):
+        """Videos and podcasts listed for a mood, in file order."""
+        self.maybe_reload()
+        state = self._state
+        videos, podcasts = [], []
+        for resource_id in state.index.get(("mood", mood.lower()), ()) if mood else ():
+            resource = state.resources[resource_id]
+            if resource["kind"] == "video":
+                videos.append(resource["item"])
+            elif resource["kind"] == "podcast":
+                podcasts.append(resource["item"])
+        return videos, podcasts
+
+    def stats(self):
+        state = self._state
+        return {"resources": len(state.resources), "index_keys": len(state.index), "reloads": self.reloads}
+
+    def render(self, resource):
+        """Markdown block for one resource, without its list number."""
+        cached = self._state.rendered.get(id(resource))
+        # Compared by identity too, in case a resource from an earlier build was freed and its id reused
+        if cached is not None and cached[0] is resource:
+            return cached[1]
+        return render_resource(resource)
+
+    def format_resources(self, resources):
+        if not resources:
+            return "No resources found."
+        return "**Mental Health Resources:**\n\n" + "".join(
+            f"{i}. {self.render(resource)}" for i, resource in enumerate(resources, 1)
+        )
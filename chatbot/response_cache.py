@@ -0,0 +1,168 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.8"))
+# Number of preceding messages that must match for a cached reply to be reused
+RESPONSE_CACHE_CONTEXT_MESSAGES = int(os.getenv("RESPONSE_CACHE_CONTEXT_MESSAGES", "4"))
+
+# Messages mentioning any of these always get a fresh reply and are never cached
+CRISIS_KEYWORDS = [
+    "suicide", "suicidal", "kill myself", "killing myself", "end my life", "ending my life",
+    "take my life", "want to die", "wanna die", "better off dead", "self-harm", "self harm",
+    "hurt myself", "hurting myself", "cut myself", "cutting myself", "overdose",
+    "goodbye note", "goodbye notes", "no reason to live", "don't want to live", "dont want to live",
+    "desire to disappear", "preparing for death", "urge to escape life", "feeling like a burden"
+]
+
+
+def normalize(text):
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^\w\s']", " ", text)
+    return " ".join(text.split())
+
+
+CRISIS_PATTERN = re.compile(r"\b(" + "|".join(sorted({re.escape(normalize(k)) for k in CRISIS_KEYWORDS})) + r")\b")
+
+
+def is_crisis(text):
+    return bool(CRISIS_PATTERN.search(normalize(text)))
+
+
+class ResponseCache:
+    """Two-tier cache of LLM replies, keyed on the prompt and the recent conversation.
+
+    The exact tier matches the normalized prompt. The semantic tier compares
+    bag-of-words vectors built with the recommender's TF-IDF analyzer and IDF
+    weights (words it has never seen weigh as much as the rarest ones), and
+    reuses a reply when cosine similarity reaches `threshold`. Both tiers only
+    match entries recorded after the same recent messages and the same
+    rolling summary, since the summary is part of the prompt. Entries expire
+    after `ttl` seconds and the least recently used are evicted beyond
+    `max_entries`. Turns where the message or the recent conversation mentions
+    a crisis keyword bypass the cache entirely.
+    """
+
+    def __init__(self, vectorizer=None, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 threshold=RESPONSE_CACHE_SIMILARITY, context_messages=RESPONSE_CACHE_CONTEXT_MESSAGES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.context_messages = context_messages
+        if vectorizer is not None:
+            self._analyze = vectorizer.build_analyzer()
+            self._idf = dict(zip(vectorizer.get_feature_names_out(), vectorizer.idf_))
+            self._default_idf = float(max(vectorizer.idf_))
+        else:
+            self._analyze = lambda text: re.findall(r"\b\w\w+\b", text)
+            self._idf = {}
+            self._default_idf = 1.0
+        self._entries = OrderedDict()
+        self._by_context = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _recent(self, messages):
+        return messages[-self.context_messages:] if self.context_messages else []
+
+    def _bypass(self, prompt, messages):
+        return is_crisis(prompt) or any(is_crisis(msg["content"]) for msg in self._recent(messages))
+
+    def context_key(self, messages, summary="", summary_upto=0):
+        digest = hashlib.sha256()
+        digest.update(f"{summary_upto}\x00{summary}\x02".encode("utf-8"))
+        for msg in self._recent(messages):
+            digest.update(f"{msg['role']}\x00{normalize(msg['content'])}\x01".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _vector(self, text):
+        counts = Counter(self._analyze(text))
+        vector = {token: count * self._idf.get(token, self._default_idf) for token, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {token: weight / norm for token, weight in vector.items()} if norm else {}
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        bucket = self._by_context.get(key[0])
+        if bucket is not None:
+            bucket.pop(key[1], None)
+            if not bucket:
+                del self._by_context[key[0]]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, prompt, messages, summary="", summary_upto=0):
+        if self._bypass(prompt, messages):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        context = self.context_key(messages, summary, summary_upto)
+        text = normalize(prompt)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live((context, text), now)
+            if entry:
+                self.hits += 1
+                return entry["response"]
+            candidates = list(self._by_context.get(context, {}).items())
+        vector = self._vector(text)
+        best_key, best_score = None, self.threshold
+        for candidate_text, candidate_vector in candidates:
+            score = sum(weight * candidate_vector.get(token, 0.0) for token, weight in vector.items())
+            if score >= best_score:
+                best_key, best_score = (context, candidate_text), score
+        with self._lock:
+            entry = self._live(best_key, now) if best_key else None
+            if entry:
+                self.hits += 1
+                self.semantic_hits += 1
+                return entry["response"]
+            self.misses += 1
+            return None
+
+    def put(self, prompt, messages, response, summary="", summary_upto=0):
+        if not response or self._bypass(prompt, messages):
+            return
+        context = self.context_key(messages, summary, summary_upto)
+        text = normalize(prompt)
+        vector = self._vector(text)
+        with self._lock:
+            key = (context, text)
+            self._entries[key] = {"response": response, "expires": time.monotonic() + self.ttl}
+            self._entries.move_to_end(key)
+            self._by_context.setdefault(context, {})[text] = vector
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,261 @@
+"""Asyncio request scheduling: concurrency caps, token-bucket rate limits and jittered retries."""
+import asyncio
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+from metrics import GaugeFamily, Histogram, HistogramFamily, register
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "300"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+QUEUE_DEPTH = register(
+    "chatbot_scheduler_queue_depth",
+    "Calls waiting for a concurrency slot or a rate-limit token.",
+    GaugeFamily(("scheduler",))
+)
+IN_FLIGHT = register(
+    "chatbot_scheduler_in_flight",
+    "Calls holding a concurrency slot.",
+    GaugeFamily(("scheduler",))
+)
+CALLS = register(
+    "chatbot_scheduler_calls_total",
+    "Scheduled call attempts by outcome: ok, retried or failed.",
+    GaugeFamily(("scheduler", "outcome"), kind="counter")
+)
+QUEUE_WAIT_MS = register(
+    "chatbot_scheduler_queue_wait_milliseconds",
+    "Time calls waited for a concurrency slot and a rate-limit token.",
+    HistogramFamily(("scheduler",))
+)
+CALL_LATENCY_MS = register(
+    "chatbot_scheduler_call_duration_milliseconds",
+    "Duration of each scheduled call attempt.",
+    HistogramFamily(("scheduler",))
+)
+
+
+class AsyncTokenBucket:
+    """Allows `rate_per_minute` acquisitions per minute, with bursts up to `burst`.
+
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class TokenBucket:
+    """Blocking counterpart of AsyncTokenBucket for worker threads and batch jobs.
+
+    `acquire(n)` takes n tokens at once, so a job can pay for a whole batch;
+    batches larger than the burst are allowed and simply wait longer.
+    """
+
+    def __init__(self, rate_per_second, burst=None):
+        self.rate = rate_per_second
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n=1):
+        with self._lock:
+            self._refill()
+            self.tokens -= n
+            deficit = -self.tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+
+def status_code_of(exc):
+    """HTTP status carried by an openai or httpx error, if any."""
+    status = getattr(exc, "status_code", None)
+    if status is None and getattr(exc, "response", None) is not None:
+        status = getattr(exc.response, "status_code", None)
+    return status
+
+
+def retry_after_of(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc):
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = status_code_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # openai.APIConnectionError / APITimeoutError and httpx.TransportError carry no status
+    return type(exc).__name__ in {"APIConnectionError", "APITimeoutError"} or any(
+        cls.__name__ == "TransportError" for cls in type(exc).__mro__
+    )
+
+
+class RequestScheduler:
+    """Runs coroutines under a concurrency cap and a per-minute rate limit.
+
+    Failed calls that look transient (429, 5xx, timeouts, dropped
+    connections) are retried with full-jitter exponential backoff, honouring
+    Retry-After when the server sends it. Queue depth, queue wait and call
+    latency are tracked per instance for `metrics()`, and served on the
+    metrics endpoint labelled with the scheduler's `name`.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 max_retries=LLM_MAX_RETRIES, base_delay=0.5, max_delay=20.0, name="llm"):
+        self.max_concurrency = max_concurrency
+        self.bucket = AsyncTokenBucket(requests_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_ms = Histogram()
+        self.latency_ms = Histogram()
+        self.name = name
+        self._queue_depth = QUEUE_DEPTH.labels(name)
+        self._in_flight = IN_FLIGHT.labels(name)
+
+    def backoff(self, attempt, exc):
+        retry_after = retry_after_of(exc)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _acquire(self):
+        queued = time.perf_counter()
+        self.queue_depth += 1
+        self._queue_depth.inc()
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.queue_depth -= 1
+            self._queue_depth.dec()
+        waited = (time.perf_counter() - queued) * 1000
+        self.wait_ms.observe(waited)
+        QUEUE_WAIT_MS.labels(self.name).observe(waited)
+        self.in_flight += 1
+        self._in_flight.inc()
+
+    def _release(self, started, outcome):
+        elapsed = (time.perf_counter() - started) * 1000
+        self.latency_ms.observe(elapsed)
+        CALL_LATENCY_MS.labels(self.name).observe(elapsed)
+        CALLS.labels(self.name, outcome).inc()
+        self.in_flight -= 1
+        self._in_flight.dec()
+        self._semaphore.release()
+
+    async def run(self, make_call):
+        """Await `make_call()` under the limits, retrying transient failures.
+
+        `make_call` must return a fresh awaitable on every invocation.
+        """
+        attempt = 0
+        while True:
+            await self._acquire()
+            started = time.perf_counter()
+            outcome = "failed"
+            try:
+                result = await make_call()
+                self.calls += 1
+                outcome = "ok"
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.failures += 1
+                    raise
+                delay = self.backoff(attempt, e)
+                outcome = "retried"
+            finally:
+                self._release(started, outcome)
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def stream(self, open_stream):
+        """Yield items from the async iterator returned by `await open_stream()`.
+
+        The concurrency slot is held until the stream is exhausted. Only
+        failures before the first item are retried, so nothing is yielded twice.
+        """
+        attempt = 0
+        while True:
+            await self._acquire()
+            started = time.perf_counter()
+            yielded = False
+            outcome = "failed"
+            try:
+                async for item in await open_stream():
+                    yielded = True
+                    yield item
+                self.calls += 1
+                outcome = "ok"
+                return
+            except Exception as e:
+                if yielded or attempt >= self.max_retries or not is_retryable(e):
+                    self.failures += 1
+                    raise
+                delay = self.backoff(attempt, e)
+                outcome = "retried"
+            finally:
+                self._release(started, outcome)
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def metrics(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "wait_ms": self.wait_ms.snapshot(),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
@@ -1,27 +1,194 @@
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-import torch
-import emoji
+import os
+import queue
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import emoji
+from dotenv import load_dotenv
+
+load_dotenv()
 
 MODEL = "cardiffnlp/twitter-roberta-base-sentiment"
-tokenizer = AutoTokenizer.from_pretrained(MODEL)
-model = AutoModelForSequenceClassification.from_pretrained(MODEL)
+# Directory holding a saved copy of the model (save_pretrained) for offline use
+SENTIMENT_MODEL_PATH = os.getenv("SENTIMENT_MODEL_PATH")
+# Dynamic int8 quantization of the Linear layers; faster on CPU at a small accuracy cost
+SENTIMENT_QUANTIZE = os.getenv("SENTIMENT_QUANTIZE", "false").lower() == "true"
+SENTIMENT_MAX_BATCH_SIZE = int(os.getenv("SENTIMENT_MAX_BATCH_SIZE", "32"))
+# How long the batching thread waits for more requests before running a partial batch
+SENTIMENT_MAX_WAIT_MS = float(os.getenv("SENTIMENT_MAX_WAIT_MS", "5"))
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "4096"))
+SENTIMENT_MAX_LENGTH = int(os.getenv("SENTIMENT_MAX_LENGTH", "512"))
 
 labels = ['NEGATIVE', 'NEUTRAL', 'POSITIVE']
 
 def preprocess(text):
     text = emoji.demojize(text)
-    print(text)
     text = re.sub(r"http\S+", "", text)
     text = re.sub(r"@\w+", "", text)
     text = re.sub(r"#", "", text)
-    return text
+    return " ".join(text.split())
+
+
+class SentimentAnalyzer:
+    """Sentiment classifier that loads its model on first use and batches requests.
+
+    The model comes from `model_path` (or SENTIMENT_MODEL_PATH) when set,
+    without touching the network, and from the Hugging Face hub otherwise.
+    An already loaded `model` and `tokenizer` can be passed in instead.
+
+    `analyze` calls from concurrent threads are queued and run together, up
+    to `max_batch_size` texts or `max_wait_ms` after the first one arrives.
+    `analyze_many` runs its own batches directly. Batches are grouped by
+    length and padded to their longest text only. Results are cached by
+    preprocessed text.
+    """
+
+    def __init__(self, model_path=SENTIMENT_MODEL_PATH, quantize=SENTIMENT_QUANTIZE,
+                 max_batch_size=SENTIMENT_MAX_BATCH_SIZE, max_wait_ms=SENTIMENT_MAX_WAIT_MS,
+                 cache_size=SENTIMENT_CACHE_SIZE, max_length=SENTIMENT_MAX_LENGTH, model=None, tokenizer=None):
+        self.source = model_path or MODEL
+        self.quantize = quantize
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self.model = model
+        self.tokenizer = tokenizer
+        self.labels = labels
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._infer_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = None
+        self.batches = 0
+        self.texts = 0
+        self.cache_hits = 0
+
+    def load(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            import torch
+            from transformers import AutoModelForSequenceClassification, AutoTokenizer
+            local = os.path.isdir(self.source)
+            if self.tokenizer is None:
+                self.tokenizer = AutoTokenizer.from_pretrained(self.source, local_files_only=local)
+            if self.model is None:
+                self.model = AutoModelForSequenceClassification.from_pretrained(self.source, local_files_only=local)
+            self.model.eval()
+            if self.quantize:
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            if self.model.config.num_labels != len(labels):
+                self.labels = [self.model.config.id2label[i] for i in range(self.model.config.num_labels)]
+            self._loaded = True
+
+    def _cached(self, key):
+        with self._cache_lock:
+            label = self._cache.get(key)
+            if label is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+            return label
+
+    def _remember(self, key, label):
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            self._cache[key] = label
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def predict(self, texts, batch_size=None):
+        """Labels for already preprocessed texts, bypassing the cache."""
+        import torch
+        self.load()
+        batch_size = batch_size or self.max_batch_size
+        # Sorting by length keeps padding within each batch to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            inputs = self.tokenizer(
+                [texts[i] for i in chunk], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="pt"
+            )
+            with self._infer_lock, torch.inference_mode():
+                predicted = self.model(**inputs).logits.argmax(dim=-1).tolist()
+            for i, label_id in zip(chunk, predicted):
+                results[i] = self.labels[label_id]
+            self.batches += 1
+            self.texts += len(chunk)
+        return results
+
+    def analyze_many(self, texts):
+        keys = [preprocess(text) for text in texts]
+        results = {key: self._cached(key) for key in keys}
+        misses = [key for key, label in results.items() if label is None]
+        if misses:
+            for key, label in zip(misses, self.predict(misses)):
+                results[key] = label
+                self._remember(key, label)
+        return [results[key] for key in keys]
+
+    def analyze(self, text):
+        key = preprocess(text)
+        label = self._cached(key)
+        if label is not None:
+            return label
+        self._start_worker()
+        future = Future()
+        self._requests.put((key, future))
+        return future.result()
+
+    def _start_worker(self):
+        if self._worker is None:
+            with self._load_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._serve, name="sentiment-batcher", daemon=True)
+                    self._worker.start()
+
+    def _serve(self):
+        while True:
+            batch = [self._requests.get()]
+            # One deadline for the whole batch, so a steady trickle cannot stretch the wait
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while len(batch) < self.max_batch_size:
+                    batch.append(self._requests.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            waiting = {}
+            for key, future in batch:
+                waiting.setdefault(key, []).append(future)
+            try:
+                predicted = self.predict(list(waiting))
+            except Exception as e:
+                for futures in waiting.values():
+                    for future in futures:
+                        future.set_exception(e)
+                continue
+            for (key, futures), label in zip(waiting.items(), predicted):
+                self._remember(key, label)
+                for future in futures:
+                    future.set_result(label)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "cache_hits": self.cache_hits,
+            "cache_entries": len(self._cache),
+        }
+
 
 def analyze_sentiment(text):
-    text = preprocess(text)
-    inputs = tokenizer(text, return_tensors="pt", truncation=True)
-    with torch.no_grad():
-        logits = model(**inputs).logits
-    scores = torch.nn.functional.softmax(logits, dim=1)[0]
-    sentiment = labels[scores.argmax().item()]
-    return sentiment
+    import shared
+    return shared.get_sentiment_analyzer().analyze(text)
@@ -0,0 +1,256 @@
+"""Process-wide instances of the heavy, stateless chatbot components.
+
+Every Streamlit session used to build its own Mongo client, TF-IDF model and
+LLM client. These are safe to share between threads, so each one is built
+once per process on first use and reused by all sessions.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-8b-8192")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+DATASET_PATH = os.path.join(os.path.dirname(__file__), 'mental_health_chatbot_interactions.csv')
+LOCAL_RECOMMENDATIONS_PATH = os.path.join(os.path.dirname(__file__), 'mental_health_recommendations.json')
+
+_instances = {}
+_locks = {}
+_registry_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def _get_or_create(name, factory):
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+
+def _create_llm():
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(
+        base_url=LLM_BASE_URL,
+        api_key=os.getenv("GROQ_API_KEY"),
+        model=LLM_MODEL,
+        temperature=0.7
+    )
+
+
+def _create_async_llm_client():
+    import httpx
+    from openai import AsyncOpenAI
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    return AsyncOpenAI(
+        base_url=LLM_BASE_URL,
+        api_key=os.getenv("GROQ_API_KEY"),
+        timeout=LLM_TIMEOUT,
+        # Retries are handled by the scheduler so they respect its rate limit
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=limits, timeout=LLM_TIMEOUT)
+    )
+
+
+def _create_llm_scheduler():
+    from scheduler import RequestScheduler
+    return RequestScheduler()
+
+
+def _create_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="async-chatbot", daemon=True).start()
+    return loop
+
+
+def _create_database():
+    from db_handler import ChatDatabase
+    return ChatDatabase()
+
+
+def _create_recommender():
+    from recommendation_system import MoodBasedRecommender
+    return MoodBasedRecommender(DATASET_PATH)
+
+
+def _create_sentiment_analyzer():
+    from sentiment import SentimentAnalyzer
+    return SentimentAnalyzer()
+
+
+def _create_api_client():
+    from api_client import ApiClient
+    return ApiClient()
+
+
+def _create_external_recommendations():
+    import json
+    from external_recommendations import ExternalRecommendationClient
+    with open(LOCAL_RECOMMENDATIONS_PATH, 'r') as f:
+        local_recommendations = json.load(f)
+    return ExternalRecommendationClient(local_recommendations=local_recommendations)
+
+
+def _create_resource_catalog():
+    from resource_catalog import ResourceCatalog
+    return ResourceCatalog()
+
+
+def _create_response_cache():
+    from response_cache import RESPONSE_CACHE_ENABLED, ResponseCache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    return ResponseCache(vectorizer=get_recommender().vectorizer)
+
+
+def _create_chatbot():
+    from chatbot import ChatBot
+    return ChatBot()
+
+
+def _create_async_chatbot():
+    from async_chatbot import AsyncChatBot
+    return AsyncChatBot()
+
+
+def get_llm():
+    return _get_or_create("llm", _create_llm)
+
+
+def get_database():
+    return _get_or_create("database", _create_database)
+
+
+def get_recommender():
+    return _get_or_create("recommender", _create_recommender)
+
+
+def get_sentiment_analyzer():
+    """The shared sentiment analyzer; its model is only loaded on the first analysis."""
+    return _get_or_create("sentiment_analyzer", _create_sentiment_analyzer)
+
+
+def get_api_client():
+    """The shared client for the Node API, with one keep-alive connection pool per process."""
+    return _get_or_create("api_client", _create_api_client)
+
+
+def get_external_recommendations():
+    """The shared client for per-mood videos and podcasts, with caching and local fallback."""
+    return _get_or_create("external_recommendations", _create_external_recommendations)
+
+
+def get_resource_catalog():
+    """The shared index of articles, videos and podcasts, reloaded when its JSON files change."""
+    return _get_or_create("resource_catalog", _create_resource_catalog)
+
+
+def get_response_cache():
+    """The shared LLM response cache, or None unless RESPONSE_CACHE_ENABLED is set."""
+    return _get_or_create("response_cache", _create_response_cache)
+
+
+def get_chatbot():
+    return _get_or_create("chatbot", _create_chatbot)
+
+
+def get_async_llm_client():
+    return _get_or_create("async_llm_client", _create_async_llm_client)
+
+
+def get_llm_scheduler():
+    return _get_or_create("llm_scheduler", _create_llm_scheduler)
+
+
+def get_async_chatbot():
+    return _get_or_create("async_chatbot", _create_async_chatbot)
+
+
+def get_event_loop():
+    """The process-wide event loop, running in a background thread, that serves async calls."""
+    return _get_or_create("event_loop", _create_event_loop)
+
+
+def run_async(coroutine):
+    """Run a coroutine on the shared event loop and wait for its result from sync code."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+
+async def _in_context(context, awaitable):
+    for var, value in context.items():
+        var.set(value)
+    return await awaitable
+
+
+def iterate_async(async_iterator):
+    """Consume an async iterator on the shared event loop as a regular generator.
+
+    The caller's context variables, such as the request id of the turn, are
+    visible to the iterator.
+    """
+    loop = get_event_loop()
+    context = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(_in_context(context, async_iterator.__anext__()), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(async_iterator.aclose(), loop).result()
+
+
+def warm_up():
+    """Build every shared component so the first chat turn does not pay for it.
+
+    main.py runs this after its first page render, which only needs the
+    database; the heavy imports (langchain, scikit-learn, pandas, torch)
+    happen here rather than while the page is waiting.
+    """
+    try:
+        from mood_matcher import get_matcher
+        get_database()
+        get_matcher()
+        get_resource_catalog()
+        get_chatbot()
+        get_async_chatbot()
+        get_event_loop()
+        get_database().annotator.warm_up()
+    except Exception as e:
+        print(f"Error warming up shared components: {e}")
+
+
+def _create_metrics_server():
+    import metrics
+    try:
+        return metrics.start_metrics_server(metrics.METRICS_PORT)
+    except OSError as e:
+        # Another process, e.g. a second Streamlit server, already serves the port
+        print(f"Error starting metrics server on port {metrics.METRICS_PORT}: {e}")
+        return False
+
+
+def start_metrics_server():
+    """Serve /metrics on METRICS_PORT once per process; does nothing when it is unset."""
+    import metrics
+    if metrics.METRICS_PORT:
+        return _get_or_create("metrics_server", _create_metrics_server)
+    return None
+
+
+def start_warm_up():
+    """Run warm_up once per process in a background thread."""
+    global _warm_up_thread
+    with _registry_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
@@ -0,0 +1,397 @@
+"""Local stand-ins for the external services the chatbot talks to.
+
+Used by benchmarks.py to measure the chatbot without network access. Each
+server runs in a background thread on a free localhost port:
+
+    with FakeLLMServer(first_token_latency=0.2) as llm:
+        ChatOpenAI(base_url=llm.base_url, api_key="test", ...)
+"""
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer:
+    """Runs a request handler class on localhost in a daemon thread."""
+
+    def __init__(self, handler_class):
+        handler = type(handler_class.__name__, (handler_class,), {"stub": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = self._handle_error
+        self.thread = None
+
+    def _handle_error(self, request, client_address):
+        # Clients hanging up on slow responses are expected when injecting timeouts
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self.httpd, request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, keep-alive
+        # clients stall on Nagle's algorithm and delayed ACKs
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class _ChatCompletionsHandler(StubHandler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        request = self.read_json()
+        llm = self.stub
+        llm.record_request(request)
+        if llm.should_fail():
+            self.send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                {"Retry-After": str(llm.retry_after)}
+            )
+            return
+        tokens = re.findall(r"\S+\s*", llm.reply)
+        time.sleep(llm.first_token_latency)
+        if request.get("stream"):
+            self._stream(request, tokens)
+        else:
+            time.sleep(llm.token_interval * max(0, len(tokens) - 1))
+            self.send_json(200, llm.completion(request, llm.reply))
+
+    def _stream(self, request, tokens):
+        llm = self.stub
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(llm.token_interval)
+            self._send_event(llm.chunk(request, {"content": token}, None))
+        self._send_event(llm.chunk(request, {}, "stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, body):
+        self.wfile.write(f"data: {json.dumps(body)}\n\n".encode())
+        self.wfile.flush()
+
+
+class FakeLLMServer(StubServer):
+    """OpenAI-compatible /v1/chat/completions endpoint with configurable latency.
+
+    Replies with `reply`, split into whitespace-delimited tokens. The first
+    token is sent after `first_token_latency` seconds and each following one
+    after `token_interval` seconds, whether or not the client streams.
+    A fraction `error_rate` of requests is rejected with 429 and a
+    Retry-After of `retry_after` seconds, to exercise client backoff.
+    """
+
+    def __init__(self, reply="I hear you. It sounds like a lot to carry right now, and it makes sense to feel this way.",
+                 first_token_latency=0.2, token_interval=0.02, model="fake-llm", error_rate=0.0, retry_after=0.1,
+                 seed=0):
+        super().__init__(_ChatCompletionsHandler)
+        self.reply = reply
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.model = model
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests = []
+        self.rejected = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self):
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.rejected += 1
+                return True
+            return False
+
+    @property
+    def base_url(self):
+        return f"{self.url}/v1"
+
+    def record_request(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def _envelope(self, request, kind):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": kind,
+            "created": int(time.time()),
+            "model": request.get("model", self.model),
+        }
+
+    def completion(self, request, content):
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        completion_tokens = len(content.split())
+        body = self._envelope(request, "chat.completion")
+        body["choices"] = [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }]
+        body["usage"] = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        return body
+
+    def chunk(self, request, delta, finish_reason):
+        body = self._envelope(request, "chat.completion.chunk")
+        body["choices"] = [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        return body
+
+
+class _RecommendationsHandler(StubHandler):
+    def do_GET(self):
+        request = self.read_json()
+        server = self.stub
+        mood = request.get("mood")
+        failure = server.failure_for(mood)
+        time.sleep(server.latency)
+        if failure == "rate_limit":
+            self.send_json(429, {"error": "Too many requests"}, {"Retry-After": str(server.retry_after)})
+        elif failure == "error":
+            self.send_json(500, {"error": "Internal server error"})
+        elif failure == "hang":
+            time.sleep(server.hang_seconds)
+            self.send_json(504, {"error": "Gateway timeout"})
+        elif not mood:
+            self.send_json(400, {"error": "mood is required"})
+        else:
+            self.send_json(200, server.recommendations(mood))
+
+
+class FakeRecommendationServer(StubServer):
+    """Stand-in for the recommendation loop API that vid.py fetches from.
+
+    Answers GET requests carrying {"mood": ...} with five videos and five
+    podcasts after `latency` seconds. A fraction `error_rate` of requests
+    fails, split between 429 (with Retry-After), 500 and requests that hang
+    for `hang_seconds`, to exercise client retries and timeouts. Moods in
+    `always_fail` fail on every attempt, and moods in `over_quota` get a 429
+    on every attempt, as when the quota for that query is used up.
+    """
+
+    def __init__(self, latency=0.05, error_rate=0.0, retry_after=0.1, hang_seconds=5.0, always_fail=(),
+                 over_quota=(), seed=0):
+        super().__init__(_RecommendationsHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.hang_seconds = hang_seconds
+        self.always_fail = set(always_fail)
+        self.over_quota = set(over_quota)
+        self.requests = 0
+        self.requested = []
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def failure_for(self, mood):
+        with self._lock:
+            self.requests += 1
+            self.requested.append(mood)
+            if mood in self.always_fail:
+                self.failures += 1
+                return "error"
+            if mood in self.over_quota:
+                self.failures += 1
+                return "rate_limit"
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.failures += 1
+                return self._random.choice(["rate_limit", "error", "hang"])
+            return None
+
+    @staticmethod
+    def recommendations(mood):
+        slug = mood.replace(" ", "-")
+        return {
+            "videos": [
+                {"title": f"Video {i} for feeling {mood}", "description": f"Helps with {mood}.",
+                 "url": f"https://www.youtube.com/watch?v={slug}-{i}"}
+                for i in range(5)
+            ],
+            "podcasts": [
+                {"title": f"Podcast {i} about {mood}", "description": f"Conversations about {mood}.",
+                 "url": f"https://open.spotify.com/episode/{slug}-{i}"}
+                for i in range(5)
+            ]
+        }
+
+
+class _ChatApiHandler(StubHandler):
+    def _route(self, method):
+        api = self.stub
+        path = self.path.split("?", 1)[0].rstrip("/")
+        status = api.injected_status()
+        time.sleep(api.latency)
+        if status:
+            self.send_json(status, {"error": "Injected failure"}, {"Retry-After": "0"})
+            return
+        body = self.read_json() if method in ("POST", "PUT") else {}
+        if method == "POST" and path == "/api/signup":
+            self.send_json(*api.signup(body))
+        elif method == "POST" and path == "/api/login":
+            self.send_json(*api.login(body))
+        elif path == "/api/chats" or path.startswith("/api/chats/"):
+            user_id = api.verify(self.headers.get("Authorization"))
+            if user_id is None:
+                self.send_json(401, {"error": "Invalid token"})
+                return
+            chat_id = path[len("/api/chats/"):] if path != "/api/chats" else None
+            self.send_json(*api.chats(method, user_id, chat_id, body))
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class FakeChatApiServer(StubServer):
+    """In-memory stand-in for the /api routes of web/server/server.js.
+
+    Implements signup, login and the chat CRUD routes with the same status
+    codes and JWT bearer auth, so the Python API client can be exercised
+    without Node or MongoDB. Each request waits `latency` seconds, and a
+    fraction `error_rate` fails with 503 before doing anything.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, jwt_secret="stub-secret-for-local-benchmarks-only", seed=0):
+        super().__init__(_ChatApiHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jwt_secret = jwt_secret
+        self.users = {}
+        self.chats_by_id = {}
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"{self.url}/api"
+
+    def injected_status(self):
+        with self._lock:
+            self.requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.failures += 1
+                return 503
+            return None
+
+    def _token(self, user_id):
+        import jwt
+        return jwt.encode({"userId": user_id, "exp": int(time.time()) + 86400}, self.jwt_secret, algorithm="HS256")
+
+    def verify(self, authorization):
+        import jwt
+        token = (authorization or "").split(" ")[-1]
+        try:
+            return jwt.decode(token, self.jwt_secret, algorithms=["HS256"])["userId"]
+        except Exception:
+            return None
+
+    def signup(self, body):
+        with self._lock:
+            if body.get("username") in self.users:
+                return 400, {"error": "Username already exists"}
+            user_id = uuid.uuid4().hex[:24]
+            self.users[body.get("username")] = {"_id": user_id, "password": body.get("password"), "name": body.get("name")}
+        return 201, {"token": self._token(user_id), "userId": user_id, "message": "User created successfully"}
+
+    def login(self, body):
+        user = self.users.get(body.get("username"))
+        if not user or user["password"] != body.get("password"):
+            return 401, {"error": "Invalid credentials"}
+        return 200, {"token": self._token(user["_id"]), "userId": user["_id"], "message": "Login successful"}
+
+    def chats(self, method, user_id, chat_id, body):
+        with self._lock:
+            if chat_id is None:
+                if method == "GET":
+                    own = [c for c in self.chats_by_id.values() if c["userId"] == user_id]
+                    own.sort(key=lambda c: c["createdAt"], reverse=True)
+                    return 200, [{"_id": c["_id"], "title": c["title"], "createdAt": c["createdAt"]} for c in own]
+                if method == "POST":
+                    chat = {
+                        "_id": uuid.uuid4().hex[:24], "userId": user_id, "title": body.get("title") or "New Chat",
+                        "messages": [], "createdAt": time.time()
+                    }
+                    self.chats_by_id[chat["_id"]] = chat
+                    return 201, chat
+                return 404, {"error": "Not found"}
+            chat = self.chats_by_id.get(chat_id)
+            if chat is None or chat["userId"] != user_id:
+                return 404, {"error": "Chat not found"}
+            if method == "GET":
+                return 200, chat
+            if method == "PUT":
+                chat["messages"] = body.get("messages", [])
+                return 200, chat
+            if method == "DELETE":
+                del self.chats_by_id[chat_id]
+                return 200, {"message": "Chat deleted successfully"}
+            return 404, {"error": "Not found"}
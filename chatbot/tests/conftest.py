@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The chatbot modules are flat and import each other by name, as when run from chatbot/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests never load the sentiment model unless they ask for it
+os.environ.setdefault("SENTIMENT_ON_WRITE", "false")
@@ -0,0 +1,66 @@
+import pytest
+import requests
+from api_client import ApiCall, ApiClient
+from stub_servers import FakeChatApiServer
+
+
+@pytest.fixture
+def api():
+    with FakeChatApiServer() as api:
+        yield api
+
+
+@pytest.fixture
+def client(api):
+    return ApiClient(base_url=api.base_url, max_retries=2, backoff_factor=0, pool_size=2)
+
+
+@pytest.fixture
+def session(api, client):
+    """A signed-up user's token and one of their chats."""
+    token = client.request("POST", "/signup", {"username": "user", "password": "secret", "name": "User"})["token"]
+    chat = client.request("POST", "/chats", {"title": "Test"}, token=token)
+    api.requests = 0
+    return token, chat["_id"]
+
+
+def test_get_is_retried_on_5xx(api, client, session):
+    token, chat_id = session
+    api.error_rate = 1.0
+    with pytest.raises(requests.HTTPError):
+        client.request("GET", f"/chats/{chat_id}", token=token)
+    assert api.requests == 3
+
+
+@pytest.mark.parametrize("method, endpoint", [("POST", "/chats"), ("PUT", "/chats/{chat_id}")])
+def test_writes_are_not_retried(api, client, session, method, endpoint):
+    token, chat_id = session
+    api.error_rate = 1.0
+    with pytest.raises(requests.HTTPError) as raised:
+        client.request(method, endpoint.format(chat_id=chat_id), {"messages": []}, token=token)
+    assert raised.value.response.status_code == 503
+    assert api.requests == 1
+
+
+@pytest.mark.parametrize("endpoint, token, status", [
+    ("/chats/{chat_id}", "invalid", 401),
+    ("/chats/000000000000000000000000", None, 404),
+])
+def test_4xx_is_not_retried(api, client, session, endpoint, token, status):
+    with pytest.raises(requests.HTTPError) as raised:
+        client.request("GET", endpoint.format(chat_id=session[1]), token=token or session[0])
+    assert raised.value.response.status_code == status
+    assert api.requests == 1
+
+
+def test_batch_returns_per_call_exceptions(client, session):
+    token, chat_id = session
+    results = client.batch([
+        ApiCall("GET", f"/chats/{chat_id}"),
+        ("GET", "/chats/000000000000000000000000"),
+        ApiCall("GET", "/chats"),
+    ], token=token)
+    assert results[0]["_id"] == chat_id
+    assert isinstance(results[1], requests.HTTPError)
+    assert results[1].response.status_code == 404
+    assert [chat["_id"] for chat in results[2]] == [chat_id]
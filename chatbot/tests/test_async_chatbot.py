@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+import mongomock
+from async_chatbot import AsyncChatBot
+from chatbot import ChatBot
+from db_handler import ChatDatabase
+from scheduler import RequestScheduler
+
+
+class UnusedLLM:
+    def predict(self, prompt):
+        raise AssertionError("summaries must go through the scheduler")
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.prompts = []
+
+    async def create(self, model, messages, temperature, stream):
+        prompt = messages[0]["content"]
+        self.prompts.append(prompt)
+        content = " a summary " if prompt.startswith("Progressively summarize") else "a reply"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_summary_goes_through_the_scheduler():
+    db = ChatDatabase(client=mongomock.MongoClient())
+    chat_id = db.create_chat("user")
+    # Eight long messages: within the turn limit, over the token budget
+    db.add_messages(chat_id, [("user" if i % 2 == 0 else "assistant", f"message {i} " * 100) for i in range(8)])
+    chatbot = ChatBot(llm=UnusedLLM(), db=db, recommender=object())
+    completions = FakeCompletions()
+    scheduler = RequestScheduler(max_retries=0)
+    bot = AsyncChatBot(chatbot, SimpleNamespace(chat=SimpleNamespace(completions=completions)), scheduler)
+
+    assert asyncio.run(bot.get_bot_response(chat_id, "how are you?")) == "a reply"
+    assert scheduler.calls == 2
+    summary_prompt, reply_prompt = completions.prompts
+    assert summary_prompt.startswith("Progressively summarize")
+    assert "Human: message 0 " in summary_prompt and "AI: message 5 " in summary_prompt
+    assert "message 6 " not in summary_prompt
+    assert "Summary of earlier conversation: a summary" in reply_prompt
+    assert "Human: message 6 " in reply_prompt and "AI: message 7 " in reply_prompt
+    assert "message 5 " not in reply_prompt
+    context = db.get_conversation_context(chat_id, limit=40)
+    assert (context["summary"], context["summary_upto"]) == ("a summary", 6)
@@ -0,0 +1,41 @@
+from conversation_memory import SummaryBufferMemory
+
+
+class FailingLLM:
+    calls = 0
+
+    def predict(self, prompt):
+        self.calls += 1
+        raise RuntimeError("429 Too Many Requests")
+
+
+class SummaryLLM:
+    def predict(self, prompt):
+        return "new summary"
+
+
+def transcript(count):
+    return [
+        {"seq": seq, "role": "user" if seq % 2 == 0 else "assistant", "content": f"message {seq} " * 20}
+        for seq in range(count)
+    ]
+
+
+def test_failed_summary_keeps_previous_summary_and_recent_window():
+    llm = FailingLLM()
+    memory = SummaryBufferMemory(llm, token_budget=200, recent_turns=2)
+    summary, summary_upto, history = memory.load("old summary", 0, transcript(10))
+    assert llm.calls == 1
+    assert (summary, summary_upto) == ("old summary", 0)
+    assert history.startswith("Summary of earlier conversation: old summary")
+    assert "message 9" in history
+    assert "message 0 " not in history
+
+
+def test_summary_is_retried_on_a_later_turn():
+    memory = SummaryBufferMemory(FailingLLM(), token_budget=200, recent_turns=2)
+    summary, summary_upto, _ = memory.load("", 0, transcript(10))
+    memory.llm = SummaryLLM()
+    summary, summary_upto, history = memory.load(summary, summary_upto, transcript(12))
+    assert summary == "new summary"
+    assert summary_upto > 0
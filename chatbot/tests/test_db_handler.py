@@ -0,0 +1,196 @@
+import threading
+from datetime import datetime
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from annotations import MessageAnnotator
+from db_handler import ChatDatabase, write_buckets
+from encryption import encrypt_message
+
+
+@pytest.fixture
+def db():
+    return ChatDatabase(client=mongomock.MongoClient())
+
+
+def legacy_chat(db, texts):
+    """A chat as older versions stored it: messages inline and no message_count."""
+    return str(db.chats.insert_one({
+        "user_id": "user", "anonymous_id": "anon", "title": "New Chat", "updated_at": datetime.now(),
+        "messages": [
+            {"role": role, "content": encrypt_message(text), "timestamp": datetime.now()}
+            for role, text in texts
+        ]
+    }).inserted_id)
+
+
+def contents(messages):
+    return [(msg["seq"], msg["role"], msg["content"]) for msg in messages]
+
+
+def test_append_to_chat_without_message_count(db):
+    chat_id = legacy_chat(db, [("user", "hello"), ("assistant", "hi")])
+    pair = [{"role": "user", "content": "again"}, {"role": "assistant", "content": "sure"}]
+    assert db.append_messages(chat_id, pair, 2)
+    assert db.chats.find_one({"_id": db.chats.find_one()["_id"]})["message_count"] == 4
+    # A retry of the same turn stores nothing twice
+    assert db.append_messages(chat_id, pair, 2)
+    assert db.chats.find_one()["message_count"] == 4
+
+
+def test_append_with_stale_count_is_rejected(db):
+    chat_id = legacy_chat(db, [("user", "hello"), ("assistant", "hi")])
+    assert not db.append_messages(chat_id, [{"role": "user", "content": "late"}], 5)
+    assert "message_count" not in db.chats.find_one()
+
+
+def test_add_messages_to_chat_without_message_count(db):
+    chat_id = legacy_chat(db, [("user", "hello"), ("assistant", "hi")])
+    assert db.add_messages(chat_id, [("user", "more")])
+    assert db.chats.find_one()["message_count"] == 3
+    bucket = db.messages.find_one()
+    assert [msg["seq"] for msg in bucket["messages"]] == [2]
+
+
+class BlockingAnalyzer:
+    """Labels every text NEGATIVE once released, like a model still loading until then."""
+
+    def __init__(self):
+        self.released = threading.Event()
+
+    def analyze(self, text):
+        self.released.wait()
+        return "NEGATIVE"
+
+
+def test_sentiment_is_labelled_after_the_write():
+    analyzer = BlockingAnalyzer()
+    annotator = MessageAnnotator(analyzer=analyzer, sentiment=True, workers=2)
+    db = ChatDatabase(client=mongomock.MongoClient(), annotator=annotator)
+    chat_id = db.create_chat("user")
+    pair = [{"role": "user", "content": "I feel anxious"}, {"role": "assistant", "content": "I'm here"}]
+    # The write returns while the analyzer is still blocked
+    assert db.append_messages(chat_id, pair, 0)
+    assert "sentiment" not in db.chats.find_one()
+    assert [msg["sentiment"] for msg in db.get_chat_history(chat_id)] == [None, None]
+
+    analyzer.released.set()
+    annotator.join()
+    chat = db.chats.find_one()
+    assert chat["sentiment"] == {"negative": 1}
+    assert chat["latest_sentiment"] == -1
+    stored = db.messages.find_one()["messages"]
+    assert [msg.get("ann", {}).get("s") for msg in stored] == [-1, None]
+
+
+def test_history_of_chat_without_message_count(db):
+    chat_id = legacy_chat(db, [("user", "hello"), ("assistant", "hi"), ("user", "again")])
+    assert [msg["content"] for msg in db.get_chat_history(chat_id)] == ["hello", "hi", "again"]
+    assert [msg["content"] for msg in db.get_chat_history(chat_id, limit=2)] == ["hi", "again"]
+    assert db.get_conversation_context(chat_id, limit=40)["messages"][-1]["seq"] == 2
+
+
+class RacingCollection:
+    """Lets a concurrent writer create each upserted bucket first, so the upsert fails on the unique index."""
+
+    def __init__(self, collection, chat_oid, competitor_seqs):
+        self.collection = collection
+        self.chat_oid = chat_oid
+        self.competitor_seqs = competitor_seqs
+
+    def _lose_race(self, condition):
+        seq = self.competitor_seqs[condition["seq"]]
+        self.collection.insert_one({
+            "chat_id": self.chat_oid, "seq": condition["seq"], "count": 1,
+            "messages": [{"seq": seq, "role": "assistant", "content": "competitor"}]
+        })
+
+    def update_one(self, condition, update, upsert=False):
+        if upsert:
+            self._lose_race(condition)
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return self.collection.update_one(condition, update)
+
+    def bulk_write(self, requests, ordered=True):
+        upserts = [i for i, request in enumerate(requests) if request._upsert]
+        if upserts:
+            for i in upserts:
+                self._lose_race(requests[i]._filter)
+            raise BulkWriteError({"writeErrors": [{"index": i, "code": 11000} for i in upserts]})
+        return self.collection.bulk_write(requests, ordered=ordered)
+
+
+@pytest.mark.parametrize("seqs, competitor_seqs", [
+    ([0], {0: 1}),
+    ([1, 2], {0: 0, 2: 3}),
+])
+def test_bucket_created_by_concurrent_writer_still_gets_messages(db, seqs, competitor_seqs):
+    chat_oid = ObjectId()
+    docs = [{"seq": seq, "role": "user", "content": f"message {seq}"} for seq in seqs]
+    write_buckets(RacingCollection(db.messages, chat_oid, competitor_seqs), chat_oid, docs, size=2)
+    buckets = {bucket["seq"]: bucket for bucket in db.messages.find({"chat_id": chat_oid})}
+    assert sorted(buckets) == sorted(competitor_seqs)
+    for start, bucket in buckets.items():
+        assert [msg["seq"] for msg in bucket["messages"]] == sorted(
+            [seq for seq in seqs if seq - seq % 2 == start] + [competitor_seqs[start]]
+        )
+        assert bucket["count"] == len(bucket["messages"])
+
+
+def test_rewriting_stored_messages_is_a_no_op(db):
+    chat_oid = ObjectId()
+    docs = [{"seq": seq, "role": "user", "content": f"message {seq}"} for seq in range(3)]
+    write_buckets(db.messages, chat_oid, docs, size=2)
+    write_buckets(db.messages, chat_oid, docs, size=2)
+    assert [bucket["count"] for bucket in db.messages.find({"chat_id": chat_oid}).sort("seq", 1)] == [2, 1]
+
+
+def test_history_of_chat_with_inline_and_bucketed_messages(db):
+    chat_id = legacy_chat(db, [("user" if i % 2 == 0 else "assistant", f"old{i}") for i in range(10)])
+    assert db.add_messages(chat_id, [("user" if i % 2 == 0 else "assistant", f"new{i}") for i in range(5)])
+    old = [f"old{i}" for i in range(10)]
+    new = [f"new{i}" for i in range(5)]
+
+    def history(**kwargs):
+        return [(msg["seq"], msg["content"]) for msg in db.get_chat_history(chat_id, **kwargs)]
+
+    assert history() == list(enumerate(old + new))
+    assert history(limit=8) == list(enumerate(old + new))[7:]
+    assert history(limit=3) == list(enumerate(old + new))[12:]
+    assert history(before=12, limit=4) == list(enumerate(old + new))[8:12]
+    assert history(before=5, limit=4) == list(enumerate(old + new))[1:5]
+    # Reads served from the decrypted-message cache keep the same numbering
+    assert history() == list(enumerate(old + new))
+
+
+def turn(user, assistant):
+    return [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+
+
+def test_conflicting_writers_do_not_both_succeed(db):
+    chat_id = db.create_chat("user")
+    assert db.append_messages(chat_id, turn("from tab a", "reply a"), 0)
+    # A second tab that loaded the chat empty and sends the same number of messages
+    assert not db.append_messages(chat_id, turn("from tab b", "reply b"), 0)
+    # A shorter turn from the other tab overlaps only part of this batch
+    assert not db.append_messages(chat_id, turn("from tab b", "reply b") + turn("again", "sure"), 1)
+    assert [msg["content"] for msg in db.get_chat_history(chat_id)] == ["from tab a", "reply a"]
+
+
+def test_retry_writes_reserved_messages_that_did_not_make_it(db, monkeypatch):
+    import db_handler
+    chat_id = db.create_chat("user")
+    pair = turn("hello", "hi")
+    write_buckets = db_handler.write_buckets
+
+    def fail_once(*args, **kwargs):
+        monkeypatch.setattr(db_handler, "write_buckets", write_buckets)
+        raise ConnectionError("connection reset")
+    monkeypatch.setattr(db_handler, "write_buckets", fail_once)
+    assert not db.append_messages(chat_id, pair, 0)
+    assert db.chats.find_one()["message_count"] == 2
+    assert db.append_messages(chat_id, pair, 0)
+    assert [msg["content"] for msg in db.get_chat_history(chat_id)] == ["hello", "hi"]
+    assert db.append_messages(chat_id, pair, 0)
+    assert db.messages.find_one()["count"] == 2
@@ -0,0 +1,22 @@
+from datetime import datetime
+import mongomock
+from db_handler import ChatDatabase
+from encryption import encrypt_message
+from migrate_buckets import BucketMigrationJob
+
+
+def test_migration_keeps_count_of_chats_without_message_count():
+    db = ChatDatabase(client=mongomock.MongoClient())
+    chat_id = str(db.chats.insert_one({
+        "user_id": "user", "anonymous_id": "anon", "title": "New Chat",
+        "messages": [
+            {"role": role, "content": encrypt_message(f"{role} {i}"), "timestamp": datetime.now()}
+            for i, role in enumerate(["user", "assistant"] * 3)
+        ]
+    }).inserted_id)
+    BucketMigrationJob(db, max_messages_per_sec=0).run(progress=lambda line: None)
+    chat = db.chats.find_one()
+    assert "messages" not in chat
+    assert chat["message_count"] == 6
+    history = db.get_chat_history(chat_id)
+    assert [msg["content"] for msg in history] == [f"{role} {i}" for i, role in enumerate(["user", "assistant"] * 3)]
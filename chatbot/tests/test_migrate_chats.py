@@ -0,0 +1,109 @@
+from datetime import datetime
+import mongomock
+from bson import ObjectId
+import pytest
+from db_handler import ChatDatabase, write_buckets
+from encryption import decrypt_message, encrypt_message
+from migrate_chats import dedupe_messages, migrate, renumber_buckets
+
+
+def stored_message(role, text):
+    return {"role": role, "content": encrypt_message(text), "timestamp": datetime.now()}
+
+
+def replay_baseline(sessions):
+    """The messages array the baseline update_chat left behind.
+
+    Each session loads everything stored so far, then after every save
+    appends its whole transcript again. A save is a list of new messages,
+    usually a user message and the reply.
+    """
+    stored = []
+    for saves in sessions:
+        transcript = [(msg["role"], decrypt_message(msg["content"])) for msg in stored]
+        for new_messages in saves:
+            transcript.extend(new_messages)
+            stored.extend(stored_message(role, text) for role, text in transcript)
+    return stored
+
+
+def turn(n):
+    return [("user", f"message {n}"), ("assistant", f"reply {n}")]
+
+
+def texts(messages):
+    return [(msg["role"], decrypt_message(msg["content"])) for msg in messages]
+
+
+@pytest.mark.parametrize("sessions", [
+    [[turn(1), turn(2), turn(3)]],
+    [[turn(1), turn(2)], [turn(3), turn(4)]],
+    [[turn(1)], [turn(2)], [turn(3)]],
+    [[turn(1), turn(2)], [turn(3)], [turn(4), turn(5), turn(6)], [turn(7)]],
+    # The recommendations button saves a single assistant message
+    [[turn(1), [("assistant", "recommendations")]], [turn(2), [("assistant", "more recommendations")]]],
+])
+def test_dedupe_collapses_baseline_saves_across_sessions(sessions):
+    expected = [message for saves in sessions for new_messages in saves for message in new_messages]
+    stored = replay_baseline(sessions)
+    clean = dedupe_messages(stored)
+    assert texts(clean) == expected
+    assert [msg["seq"] for msg in clean] == list(range(len(expected)))
+
+
+def test_dedupe_keeps_messages_the_user_really_repeated():
+    same = [("user", "hi"), ("assistant", "hello")]
+    sessions = [[same, same, turn(1)], [same]]
+    clean = dedupe_messages(replay_baseline(sessions))
+    assert texts(clean) == same + same + turn(1) + same
+
+
+def test_dedupe_leaves_clean_chats_alone():
+    messages = [stored_message(role, text) for role, text in turn(1) + turn(2)]
+    assert texts(dedupe_messages(messages)) == turn(1) + turn(2)
+
+
+def test_migrate_backfills_count_and_title():
+    db = ChatDatabase(client=mongomock.MongoClient())
+    chat_id = db.chats.insert_one({
+        "user_id": "user", "anonymous_id": "anon", "title": "New Chat",
+        "messages": replay_baseline([[turn(1), turn(2)], [turn(3), turn(4)]])
+    }).inserted_id
+    assert migrate(db) == (1, 24 - 8)
+    chat = db.chats.find_one({"_id": chat_id})
+    assert chat["message_count"] == 8
+    assert chat["title"] == "message 1"
+    assert texts(chat["messages"]) == turn(1) + turn(2) + turn(3) + turn(4)
+
+
+def test_migrate_chat_written_before_migration():
+    db = ChatDatabase(client=mongomock.MongoClient())
+    chat_id = str(db.chats.insert_one({
+        "user_id": "user", "anonymous_id": "anon", "title": "New Chat",
+        "messages": replay_baseline([[turn(1), turn(2)]])
+    }).inserted_id)
+    # The session loaded all six stored messages, duplicates included
+    pair = [{"role": role, "content": text} for role, text in turn(3)]
+    assert db.append_messages(chat_id, pair, 6)
+    assert migrate(db) == (1, 2)
+    history = db.get_chat_history(chat_id)
+    assert [(msg["role"], msg["content"]) for msg in history] == turn(1) + turn(2) + turn(3)
+    assert [msg["seq"] for msg in history] == list(range(6))
+    assert db.chats.find_one()["message_count"] == 6
+    # Migrated chats are left alone, and take new turns after their deduped history
+    assert migrate(db) == (0, 0)
+    assert db.append_messages(chat_id, [{"role": role, "content": text} for role, text in turn(4)], 6)
+    assert [msg["content"] for msg in db.get_chat_history(chat_id, limit=2)] == ["message 4", "reply 4"]
+
+
+def test_renumber_buckets_moves_messages_down():
+    db = ChatDatabase(client=mongomock.MongoClient())
+    chat_oid = ObjectId()
+    write_buckets(db.messages, chat_oid, [{"seq": seq, "role": "user", "content": str(seq)} for seq in range(5, 10)],
+                  size=2)
+    renumber_buckets(db, chat_oid, 3, size=2)
+    buckets = list(db.messages.find({"chat_id": chat_oid}).sort("seq", 1))
+    assert [(bucket["seq"], [(msg["seq"], msg["content"]) for msg in bucket["messages"]]) for bucket in buckets] == [
+        (2, [(2, "5"), (3, "6")]), (4, [(4, "7"), (5, "8")]), (6, [(6, "9")])
+    ]
+    assert [bucket["count"] for bucket in buckets] == [2, 2, 1]
@@ -0,0 +1,30 @@
+import csv
+import os
+from recommendation_system import MoodBasedRecommender
+
+
+def write_dataset(path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["mood", "exercise"])
+        writer.writerow(["anxious", "Box breathing: breathe in for four counts."])
+        writer.writerow(["sad", "Gratitude list: write down three good things."])
+
+
+def test_corrupt_artifact_is_replaced_by_the_refit_one(tmp_path, monkeypatch):
+    dataset = tmp_path / "interactions.csv"
+    write_dataset(dataset)
+    artifact_dir = tmp_path / "cache"
+    MoodBasedRecommender(str(dataset), str(artifact_dir))
+    [artifact] = os.listdir(artifact_dir)
+    with open(artifact_dir / artifact / "vectorizer.pkl", "wb") as f:
+        f.write(b"not a pickle")
+
+    recommender = MoodBasedRecommender(str(dataset), str(artifact_dir))
+    assert recommender.moods == ["anxious", "sad"]
+    assert os.listdir(artifact_dir) == [artifact]
+    # The next start loads the rewritten artifact instead of refitting
+    def refit(self):
+        raise AssertionError("refitted although a valid artifact was saved")
+    monkeypatch.setattr(MoodBasedRecommender, "_fit", refit)
+    assert MoodBasedRecommender(str(dataset), str(artifact_dir)).moods == ["anxious", "sad"]
@@ -0,0 +1,25 @@
+from response_cache import ResponseCache
+
+
+def recent():
+    return [
+        {"role": "user", "content": "hi"}, {"role": "assistant", "content": "Hello, how are you?"},
+        {"role": "user", "content": "ok I guess"}, {"role": "assistant", "content": "Want to talk about it?"},
+    ]
+
+
+def test_reply_is_reused_after_the_same_summary():
+    cache = ResponseCache()
+    cache.put("yes please", recent(), "Of course.", "User is stressed about exams.", 12)
+    assert cache.get("yes please", recent(), "User is stressed about exams.", 12) == "Of course."
+    assert cache.get("yes, please!", recent(), "User is stressed about exams.", 12) == "Of course."
+
+
+def test_reply_is_not_reused_after_a_different_summary():
+    cache = ResponseCache()
+    cache.put("yes please", recent(), "Since Maria's divorce she has been sleeping badly.", 12)
+    # Same recent messages and prompt, exact and semantic tiers
+    assert cache.get("yes please", recent(), "User is stressed about exams.", 12) is None
+    assert cache.get("yes, please!", recent(), "User is stressed about exams.", 12) is None
+    assert cache.get("yes please", recent(), "", 0) is None
+    assert cache.get("yes please", recent(), "Since Maria's divorce she has been sleeping badly.", 16) is None
@@ -0,0 +1,25 @@
+import asyncio
+import metrics
+from scheduler import RequestScheduler
+
+
+def test_scheduler_stats_are_served_on_the_metrics_endpoint():
+    scheduler = RequestScheduler(max_retries=1, base_delay=0, name="test")
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("connection reset")
+        return "ok"
+
+    assert asyncio.run(scheduler.run(flaky)) == "ok"
+    text = metrics.render_prometheus()
+    assert "# TYPE chatbot_scheduler_calls_total counter" in text
+    assert 'chatbot_scheduler_calls_total{scheduler="test",outcome="retried"} 1' in text
+    assert 'chatbot_scheduler_calls_total{scheduler="test",outcome="ok"} 1' in text
+    assert 'chatbot_scheduler_queue_depth{scheduler="test"} 0' in text
+    assert 'chatbot_scheduler_in_flight{scheduler="test"} 0' in text
+    assert 'chatbot_scheduler_queue_wait_milliseconds_count{scheduler="test"} 2' in text
+    assert 'chatbot_scheduler_call_duration_milliseconds_count{scheduler="test"} 2' in text
+    assert (scheduler.calls, scheduler.retries, scheduler.failures) == (1, 1, 0)
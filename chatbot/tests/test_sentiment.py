@@ -0,0 +1,31 @@
+import threading
+import time
+from sentiment import SentimentAnalyzer
+
+
+class RecordingAnalyzer(SentimentAnalyzer):
+    """Labels everything NEUTRAL without a model and records the batches the worker runs."""
+
+    def __init__(self, **kwargs):
+        super().__init__(cache_size=0, **kwargs)
+        self.batch_sizes = []
+
+    def predict(self, texts, batch_size=None):
+        self.batch_sizes.append(len(texts))
+        return ["NEUTRAL"] * len(texts)
+
+
+def test_batch_waits_at_most_max_wait_after_its_first_request():
+    analyzer = RecordingAnalyzer(max_batch_size=32, max_wait_ms=100)
+    threads = []
+    # A request every 40ms: each arrives within max_wait of the previous one
+    for i in range(10):
+        thread = threading.Thread(target=analyzer.analyze, args=(f"text {i}",))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.04)
+    for thread in threads:
+        thread.join()
+    assert sum(analyzer.batch_sizes) == 10
+    assert len(analyzer.batch_sizes) >= 3
+    assert max(analyzer.batch_sizes) <= 4
@@ -0,0 +1,80 @@
+import json
+import os
+import pytest
+from stub_servers import FakeRecommendationServer
+from vid import RECOMMENDATIONS_PER_STATE, RecommendationFetcher, checkpoint_path
+
+
+@pytest.fixture
+def server():
+    with FakeRecommendationServer(latency=0, retry_after=0.01) as server:
+        yield server
+
+
+def make_fetcher(server, tmp_path):
+    return RecommendationFetcher(
+        fetch_url=server.url, output_path=str(tmp_path / "recommendations.json"),
+        requests_per_minute=60000, timeout=5, max_retries=2, base_delay=0.01
+    )
+
+
+def read_output(fetcher):
+    with open(fetcher.output_path) as f:
+        return json.load(f)
+
+
+def test_fetches_every_mood_and_removes_checkpoint(server, tmp_path):
+    fetcher = make_fetcher(server, tmp_path)
+    assert fetcher.run(["anxious", "sad"]) == {}
+    output = read_output(fetcher)
+    assert sorted(output) == ["anxious", "sad"]
+    assert len(output["sad"]["videos"]) == RECOMMENDATIONS_PER_STATE
+    assert not os.path.exists(checkpoint_path(fetcher.output_path))
+
+
+def test_resume_skips_moods_in_checkpoint(server, tmp_path):
+    fetcher = make_fetcher(server, tmp_path)
+    with open(fetcher.checkpoint_path, "w") as f:
+        f.write(json.dumps({"mood": "anxious", "recommendations": {"videos": ["from checkpoint"]}}) + "\n")
+        # A line cut short by a crash
+        f.write('{"mood": "sad", "recomm')
+    assert fetcher.run(["anxious", "sad"]) == {}
+    assert server.requested == ["sad"]
+    output = read_output(fetcher)
+    assert output["anxious"] == {"videos": ["from checkpoint"]}
+    assert output["sad"] == {
+        key: value[:RECOMMENDATIONS_PER_STATE]
+        for key, value in FakeRecommendationServer.recommendations("sad").items()
+    }
+
+
+def test_fresh_run_ignores_checkpoint(server, tmp_path):
+    fetcher = make_fetcher(server, tmp_path)
+    with open(fetcher.checkpoint_path, "w") as f:
+        f.write(json.dumps({"mood": "anxious", "recommendations": {"videos": ["stale"]}}) + "\n")
+    assert fetcher.run(["anxious"], resume=False) == {}
+    assert server.requested == ["anxious"]
+    assert read_output(fetcher)["anxious"]["videos"] != ["stale"]
+
+
+def test_mood_over_quota_keeps_previous_recommendations(tmp_path):
+    with FakeRecommendationServer(latency=0, retry_after=0.01, over_quota={"sad"}) as server:
+        fetcher = make_fetcher(server, tmp_path)
+        with open(fetcher.output_path, "w") as f:
+            json.dump({"sad": {"videos": ["shipped"]}}, f)
+        failed = fetcher.run(["anxious", "sad"])
+        assert list(failed) == ["sad"]
+        assert "429" in failed["sad"]
+        # One attempt plus max_retries retries, and no retry storm on the other mood
+        assert server.requested.count("sad") == 3
+        assert server.requested.count("anxious") == 1
+        output = read_output(fetcher)
+        assert output["sad"] == {"videos": ["shipped"]}
+        assert "anxious" in output
+
+        # The next run resumes from the checkpoint and only asks for the failed mood
+        server.over_quota.clear()
+        server.requested.clear()
+        assert fetcher.run(["anxious", "sad"]) == {}
+        assert server.requested == ["sad"]
+        assert read_output(fetcher)["sad"] != {"videos": ["shipped"]}
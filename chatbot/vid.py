@@ -1,61 +1,198 @@
-import requests
+import argparse
+import asyncio
 import json
+import os
 import time
+import httpx
+from dotenv import load_dotenv
+from mood_matcher import load_mood_config
+from scheduler import RequestScheduler
 
-mental_health_states = [
-    "anxious", "lonely", "sad", "stressed",
-    "depressed", "frustrated", "angry", "worried", "nervous", "exhausted", "hopeless",
-    "shame", "fear", "panic",
-    "self-doubt", "low self-esteem", "distressed", "unmotivated",
-    "overwhelmed", "burnt out", "guilt", "grief", "emptiness",
-    "worthless", "helpless", "restless", "isolated", "insecure",
-    "broken", "lost", "unloved", "rejected", "abandoned",
-    "confused", "betrayed", "powerless", "apathetic", "heartbroken",
-    "disconnected", "vulnerable", "regretful", "irritable", "resentful",
-    "emotional pain", "mental fatigue", "dread", "invisible",
-    "despair", "detachment", "dissociation", "emotional numbness",
-    "self-hatred",
-    "suicidal thoughts", "desire to disappear", "feeling like a burden",
-    "thoughts of self-harm", "hopeless about future",
-    "writing goodbye notes", "emotional shutdown",
-    "urge to escape life", "preparing for death", "existential dread",
-    "flashbacks", "social withdrawal", "mistrust", "mania", "psychosis",
-    "obsession", "compulsion", "nightmares", "loss of identity",
-    "agitation", "self-harm urges"
-]
-
-url = 'https://magicloops.dev/api/loop/358a84e8-378e-47b3-9af1-9a658bbf97d4/run'
-
-all_recommendations = {}
-
-print("Collecting recommendations for all mental health states...")
-for mood in mental_health_states:
-    print(f"Processing: {mood}")
-    payload = { "mood": mood }
-    
+load_dotenv()
+
+mental_health_states = load_mood_config()["moods"]
+
+url = os.getenv("RECOMMENDATIONS_FETCH_URL", 'https://magicloops.dev/api/loop/358a84e8-378e-47b3-9af1-9a658bbf97d4/run')
+
+OUTPUT_PATH = os.path.join(os.path.dirname(__file__), 'mental_health_recommendations.json')
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+FETCH_REQUESTS_PER_MINUTE = float(os.getenv("FETCH_REQUESTS_PER_MINUTE", "600"))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "4"))
+RECOMMENDATIONS_PER_STATE = 3
+
+
+def checkpoint_path(output_path):
+    return output_path + ".partial"
+
+
+def limit_recommendations(response_json):
+    if isinstance(response_json, list):
+        return response_json[:RECOMMENDATIONS_PER_STATE]
+    if isinstance(response_json, dict):
+        return {
+            key: value[:RECOMMENDATIONS_PER_STATE] if isinstance(value, list) else value
+            for key, value in response_json.items()
+        }
+    return response_json
+
+
+def is_valid_recommendation(value):
+    return isinstance(value, (dict, list)) and bool(value) and not (isinstance(value, dict) and "error" in value)
+
+
+def load_checkpoint(path):
+    """Moods fetched by an earlier, interrupted run. A line cut short by a crash is ignored."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                done[entry["mood"]] = entry["recommendations"]
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+
+def load_existing(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_atomic(path, data):
+    """Write JSON to a temporary file next to `path` and move it into place in one step."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
     try:
-        response = requests.get(url, json=payload)
-        responseJson = response.json()
-        
-        if isinstance(responseJson, list):
-            limited_recommendations = responseJson[:3]
-        elif isinstance(responseJson, dict):
-            for key, value in responseJson.items():
-                if isinstance(value, list):
-                    responseJson[key] = value[:3]
-            limited_recommendations = responseJson
-        else:
-            limited_recommendations = responseJson
-            
-        all_recommendations[mood] = limited_recommendations
-        time.sleep(1)
-        
-    except Exception as e:
-        print(f"Error processing {mood}: {str(e)}")
-        all_recommendations[mood] = {"error": str(e)}
-with open('mental_health_recommendations.json', 'w') as json_file:
-    json.dump(all_recommendations, json_file, indent=4)
-
-print("\nAll recommendations have been saved to mental_health_recommendations.json")
-print(f"Processed {len(mental_health_states)} mental health states")
-print("Limited to 3 recommendations per state")
\ No newline at end of file
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class RecommendationFetcher:
+    """Fetches recommendations for many moods concurrently, resuming interrupted runs.
+
+    Requests go through a RequestScheduler, which bounds concurrency, applies
+    a per-minute rate limit and retries timeouts, 429s and 5xx responses with
+    jittered backoff. Each fetched mood is appended to a checkpoint file
+    straight away, so a crashed run only re-fetches what it had not finished.
+    The output file is replaced atomically. Moods that still fail keep their
+    previously shipped recommendations; error responses are never written.
+    """
+
+    def __init__(self, fetch_url=url, output_path=OUTPUT_PATH, concurrency=FETCH_CONCURRENCY,
+                 requests_per_minute=FETCH_REQUESTS_PER_MINUTE, timeout=FETCH_TIMEOUT,
+                 max_retries=FETCH_MAX_RETRIES, base_delay=0.5):
+        self.url = fetch_url
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path(output_path)
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.scheduler = None
+        self.failed = {}
+
+    async def _fetch_once(self, client, mood):
+        response = await client.request("GET", self.url, json={"mood": mood})
+        response.raise_for_status()
+        recommendations = limit_recommendations(response.json())
+        if not is_valid_recommendation(recommendations):
+            raise ValueError(f"Unexpected response: {str(recommendations)[:200]}")
+        return recommendations
+
+    async def _fetch(self, client, mood, checkpoint):
+        try:
+            recommendations = await self.scheduler.run(lambda: self._fetch_once(client, mood))
+        except Exception as e:
+            print(f"Error processing {mood}: {str(e)}")
+            self.failed[mood] = str(e)
+            return None
+        checkpoint.write(json.dumps({"mood": mood, "recommendations": recommendations}) + "\n")
+        checkpoint.flush()
+        print(f"Processed: {mood}")
+        return recommendations
+
+    async def fetch_all(self, moods, resume=True):
+        done = load_checkpoint(self.checkpoint_path) if resume else {}
+        pending = [mood for mood in moods if mood not in done]
+        if done:
+            print(f"Resuming: {len(moods) - len(pending)} of {len(moods)} moods already fetched")
+        # Built per run, since its locks belong to the event loop of this run
+        self.scheduler = RequestScheduler(
+            max_concurrency=self.concurrency,
+            requests_per_minute=self.requests_per_minute,
+            max_retries=self.max_retries,
+            base_delay=self.base_delay,
+            name="recommendations"
+        )
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        with open(self.checkpoint_path, 'a' if resume else 'w') as checkpoint:
+            async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+                results = await asyncio.gather(*(self._fetch(client, mood, checkpoint) for mood in pending))
+        for mood, recommendations in zip(pending, results):
+            if recommendations is not None:
+                done[mood] = recommendations
+        return done
+
+    def run(self, moods, resume=True):
+        """Fetch `moods` and update the output file. Returns the moods that could not be fetched."""
+        self.failed = {}
+        fetched = asyncio.run(self.fetch_all(moods, resume=resume))
+        existing = load_existing(self.output_path)
+        all_recommendations = {}
+        for mood in moods:
+            if mood in fetched:
+                all_recommendations[mood] = fetched[mood]
+            elif is_valid_recommendation(existing.get(mood)):
+                all_recommendations[mood] = existing[mood]
+        write_atomic(self.output_path, all_recommendations)
+        if not self.failed:
+            os.remove(self.checkpoint_path)
+        return self.failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect recommendations for all mental health states")
+    parser.add_argument("--url", default=url)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY)
+    parser.add_argument("--requests-per-minute", type=float, default=FETCH_REQUESTS_PER_MINUTE)
+    parser.add_argument("--timeout", type=float, default=FETCH_TIMEOUT, help="Seconds per request")
+    parser.add_argument("--retries", type=int, default=FETCH_MAX_RETRIES)
+    parser.add_argument("--fresh", action="store_true", help="Ignore the checkpoint of an interrupted run")
+    args = parser.parse_args()
+
+    fetcher = RecommendationFetcher(
+        fetch_url=args.url,
+        output_path=args.output,
+        concurrency=args.concurrency,
+        requests_per_minute=args.requests_per_minute,
+        timeout=args.timeout,
+        max_retries=args.retries
+    )
+    print("Collecting recommendations for all mental health states...")
+    start = time.perf_counter()
+    failed = fetcher.run(mental_health_states, resume=not args.fresh)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nAll recommendations have been saved to {args.output}")
+    print(f"Processed {len(mental_health_states)} mental health states in {elapsed:.1f}s")
+    print(f"Limited to {RECOMMENDATIONS_PER_STATE} recommendations per state")
+    if failed:
+        print(f"{len(failed)} states failed and kept their previous recommendations; run again to resume")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()